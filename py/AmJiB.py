@@ -1,12 +1,29 @@
 import os
 import re
+import json
+import hashlib
+import math
 import requests
 import time
-import concurrent.futures
-import subprocess
-import socket  # 用于域名解析
+import asyncio
 from datetime import datetime, timezone, timedelta
 
+import channel_names
+import convert_to_m3u
+import discover
+import dns_cache
+import geo_cache
+import isp_index
+import metrics
+import playlist
+import probe_journal
+import probe_scheduler
+import rtp_verify
+import server_registry
+import snapshot
+import stream_probe
+import tcp_scan
+
 # ===============================
 # 配置区
 FOFA_URLS = {
@@ -19,8 +36,32 @@ COUNTER_FILE = "py/计数.txt"
 IP_DIR = "ip"
 RTP_DIR = "rtp"
 ZUBO_FILE = "py/zubo.txt"
+ZUBO_MANIFEST = "py/zubo_manifest.json"   # 各 ip/rtp 文件内容哈希及 zubo.txt 分段位置，用于增量生成
 IPTV_FILE = "test/IPTV.txt"
 LIVE_BACKUP_FILE = "py/live.txt"  
+INGEST_CONCURRENCY = 64       # 第一阶段同时进行的域名解析数
+GEO_BATCH_LINGER = 0.2        # 归属地查询攒批的最长等待（秒），攒满 geo_cache.BATCH_SIZE 个立即发出
+GEO_CONCURRENCY = 4           # 同时进行的归属地批量查询数（实际请求速率仍由 geo_cache 的令牌桶限制）
+# 探测模式："async" 为进程内 asyncio 探测，"ffprobe" 为旧版逐个启动 ffprobe（对比用）
+PROBE_MODE = os.environ.get("PROBE_MODE", "async")
+PROBE_CONCURRENCY = 1000      # async 模式同时探测的 IP 数
+FFPROBE_CONCURRENCY = 32      # ffprobe 模式同时探测的 IP 数（同一 /24 的并发另由 probe_scheduler 限制）
+# 每个 IP 同时探测的代表频道数，首个成功即取消其余（1 为逐个探测）。
+# 调度器按 ip:port 派发，一个 IP 只占一个名额，对冲的几路流都打到同一台 udpxy 上，
+# 所以不能超过单主机并发上限（udpxy 默认最多 3 个客户端，留一个给别人）
+HEDGE_FANOUT = probe_scheduler.PER_HOST_LIMIT
+HEDGE_DEADLINE = 10           # 每个 IP 的总探测时限（秒），不再按 URL 个数累加
+JOURNAL_TTL = 3600            # 第三阶段被取消后，探测日志里多久以内的结果下次直接复用（秒）
+# 截止时间模式：第三阶段检测的墙钟预算（秒），0 为不限。设置后按期望价值排序、自适应并发，
+# 到点停止并用已验证的结果生成输出，没测完的留在探测日志里下一轮接着测
+PROBE_DEADLINE = float(os.environ.get("PROBE_DEADLINE", "0"))
+TCP_PREFILTER = True          # 流探测前先用 tcp_scan 做一轮 TCP 连接预筛，连不上的不再探测
+# 流水线模式："expand" 为先由第二阶段展开全部 ip × rtp 到 zubo.txt 再检测；"verify" 为先验证后展开（不写 zubo.txt）
+PIPELINE_MODE = os.environ.get("PIPELINE_MODE", "expand")
+STAGE_EVERY = 10              # 每隔多少轮跑一次第二、三阶段
+DISCOVER_EVERY = 10           # 每隔多少轮做一次邻段发现（与第二、三阶段错开半个周期），0 为关闭
+RTP_VERIFY_EVERY = 40         # 每隔多少轮逐个验证 rtp/ 组播并写出 rtp_verified/ 精简列表（单独占一轮），0 为关闭
+RTP_VERIFY_OFFSET = DISCOVER_EVERY // 2 + 2   # 组播验证落在周期内的第几轮，须避开第二、三阶段和邻段发现（见 check_schedule）
 # ===============================
 
 # 简化版分类与映射（仅保留最小配置，用于代表频道检测）
@@ -65,103 +106,7 @@ CHANNEL_CATEGORIES = {
     ],
 }
 
-# ===== 映射（别名 -> 标准名） =====
-CHANNEL_MAPPING = {
-    "CCTV1": ["CCTV-1", "CCTV-1 HD", "CCTV1 HD", "CCTV-1综合"],
-    "CCTV2": ["CCTV-2", "CCTV-2 HD", "CCTV2 HD", "CCTV-2财经"],
-    "CCTV3": ["CCTV-3", "CCTV-3 HD", "CCTV3 HD", "CCTV-3综艺"],
-    "CCTV4": ["CCTV-4", "CCTV-4 HD", "CCTV4 HD", "CCTV-4中文国际"],
-    "CCTV4欧洲": ["CCTV-4欧洲", "CCTV-4欧洲", "CCTV4欧洲 HD", "CCTV-4 欧洲", "CCTV-4中文国际欧洲", "CCTV4中文欧洲"],
-    "CCTV4美洲": ["CCTV-4美洲", "CCTV-4北美", "CCTV4美洲 HD", "CCTV-4 美洲", "CCTV-4中文国际美洲", "CCTV4中文美洲"],
-    "CCTV5": ["CCTV-5", "CCTV-5 HD", "CCTV5 HD", "CCTV-5体育"],
-    "CCTV5+": ["CCTV-5+", "CCTV-5+ HD", "CCTV5+ HD", "CCTV-5+体育赛事"],
-    "CCTV6": ["CCTV-6", "CCTV-6 HD", "CCTV6 HD", "CCTV-6电影"],
-    "CCTV7": ["CCTV-7", "CCTV-7 HD", "CCTV7 HD", "CCTV-7国防军事"],
-    "CCTV8": ["CCTV-8", "CCTV-8 HD", "CCTV8 HD", "CCTV-8电视剧"],
-    "CCTV9": ["CCTV-9", "CCTV-9 HD", "CCTV9 HD", "CCTV-9纪录"],
-    "CCTV10": ["CCTV-10", "CCTV-10 HD", "CCTV10 HD", "CCTV-10科教"],
-    "CCTV11": ["CCTV-11", "CCTV-11 HD", "CCTV11 HD", "CCTV-11戏曲"],
-    "CCTV12": ["CCTV-12", "CCTV-12 HD", "CCTV12 HD", "CCTV-12社会与法"],
-    "CCTV13": ["CCTV-13", "CCTV-13 HD", "CCTV13 HD", "CCTV-13新闻"],
-    "CCTV14": ["CCTV-14", "CCTV-14 HD", "CCTV14 HD", "CCTV-14少儿"],
-    "CCTV15": ["CCTV-15", "CCTV-15 HD", "CCTV15 HD", "CCTV-15音乐"],
-    "CCTV16": ["CCTV-16", "CCTV-16 HD", "CCTV-16 4K", "CCTV-16奥林匹克", "CCTV16 4K", "CCTV-16奥林匹克4K"],
-    "CCTV17": ["CCTV-17", "CCTV-17 HD", "CCTV17 HD", "CCTV-17农业农村"],
-    "CCTV4K": ["CCTV4K超高清", "CCTV-4K超高清", "CCTV-4K 超高清", "CCTV 4K"],
-    "CCTV8K": ["CCTV8K超高清", "CCTV-8K超高清", "CCTV-8K 超高清", "CCTV 8K"],
-    "兵器科技": ["CCTV-兵器科技", "CCTV兵器科技"],
-    "风云音乐": ["CCTV-风云音乐", "CCTV风云音乐"],
-    "第一剧场": ["CCTV-第一剧场", "CCTV第一剧场"],
-    "风云足球": ["CCTV-风云足球", "CCTV风云足球"],
-    "风云剧场": ["CCTV-风云剧场", "CCTV风云剧场"],
-    "怀旧剧场": ["CCTV-怀旧剧场", "CCTV怀旧剧场"],
-    "女性时尚": ["CCTV-女性时尚", "CCTV女性时尚"],
-    "世界地理": ["CCTV-世界地理", "CCTV世界地理"],
-    "央视台球": ["CCTV-央视台球", "CCTV央视台球"],
-    "高尔夫网球": ["CCTV-高尔夫网球", "CCTV高尔夫网球", "CCTV央视高网", "CCTV-高尔夫·网球", "央视高网"],
-    "央视文化精品": ["CCTV-央视文化精品", "CCTV央视文化精品", "CCTV文化精品", "CCTV-文化精品", "文化精品"],
-    "卫生健康": ["CCTV-卫生健康", "CCTV卫生健康"],
-    "电视指南": ["CCTV-电视指南", "CCTV电视指南"],
-    "农林卫视": ["陕西农林卫视"],
-    "三沙卫视": ["海南三沙卫视"],
-    "兵团卫视": ["新疆兵团卫视"],
-    "延边卫视": ["吉林延边卫视"],
-    "安多卫视": ["青海安多卫视"],
-    "康巴卫视": ["四川康巴卫视"],
-    "山东教育卫视": ["山东教育"],
-    "中国教育1台": ["CETV1", "中国教育一台", "中国教育1", "CETV-1 综合教育", "CETV-1"],
-    "中国教育2台": ["CETV2", "中国教育二台", "中国教育2", "CETV-2 空中课堂", "CETV-2"],
-    "中国教育3台": ["CETV3", "中国教育三台", "中国教育3", "CETV-3 教育服务", "CETV-3"],
-    "中国教育4台": ["CETV4", "中国教育四台", "中国教育4", "CETV-4 职业教育", "CETV-4"],
-    "早期教育": ["中国教育5台", "中国教育五台", "CETV早期教育", "华电早期教育", "CETV 早期教育"],
-    "CHC影迷电影": ["CHC高清电影", "CHC-影迷电影", "影迷电影", "chc高清电影"],
-    "淘电影": ["IPTV淘电影", "北京IPTV淘电影", "北京淘电影"],
-    "淘精彩": ["IPTV淘精彩", "北京IPTV淘精彩", "北京淘精彩"],
-    "淘剧场": ["IPTV淘剧场", "北京IPTV淘剧场", "北京淘剧场"],
-    "淘4K": ["IPTV淘4K", "北京IPTV4K超清", "北京淘4K", "淘4K", "淘 4K"],
-    "淘娱乐": ["IPTV淘娱乐", "北京IPTV淘娱乐", "北京淘娱乐"],
-    "淘BABY": ["IPTV淘BABY", "北京IPTV淘BABY", "北京淘BABY", "IPTV淘baby", "北京IPTV淘baby", "北京淘baby"],
-    "淘萌宠": ["IPTV淘萌宠", "北京IPTV萌宠TV", "北京淘萌宠"],
-    "魅力足球": ["上海魅力足球"],
-    "睛彩青少": ["睛彩羽毛球"],
-    "求索纪录": ["求索记录", "求索纪录4K", "求索记录4K", "求索纪录 4K", "求索记录 4K"],
-    "金鹰纪实": ["湖南金鹰纪实", "金鹰记实"],
-    "纪实科教": ["北京纪实科教", "BRTV纪实科教", "纪实科教8K"],
-    "星空卫视": ["星空衛視", "星空衛视", "星空卫視"],
-    "CHANNEL[V]": ["CHANNEL-V", "Channel[V]"],
-    "凤凰卫视中文台": ["凤凰中文", "凤凰中文台", "凤凰卫视中文", "凤凰卫视"],
-    "凤凰卫视香港台": ["凤凰香港台", "凤凰卫视香港", "凤凰香港"],
-    "凤凰卫视资讯台": ["凤凰资讯", "凤凰资讯台", "凤凰咨询", "凤凰咨询台", "凤凰卫视咨询台", "凤凰卫视资讯", "凤凰卫视咨询"],
-    "凤凰卫视电影台": ["凤凰电影", "凤凰电影台", "凤凰卫视电影", "鳳凰衛視電影台", " 凤凰电影"],
-    "茶频道": ["湖南茶频道"],
-    "快乐垂钓": ["湖南快乐垂钓"],
-    "先锋乒羽": ["湖南先锋乒羽"],
-    "天元围棋": ["天元围棋频道"],
-    "汽摩": ["重庆汽摩", "汽摩频道", "重庆汽摩频道"],
-    "梨园频道": ["河南梨园频道", "梨园", "河南梨园"],
-    "文物宝库": ["河南文物宝库"],
-    "武术世界": ["河南武术世界"],
-    "乐游": ["乐游频道", "上海乐游频道", "乐游纪实", "SiTV乐游频道", "SiTV 乐游频道"],
-    "欢笑剧场": ["上海欢笑剧场4K", "欢笑剧场 4K", "欢笑剧场4K", "上海欢笑剧场"],
-    "生活时尚": ["生活时尚4K", "SiTV生活时尚", "上海生活时尚"],
-    "都市剧场": ["都市剧场4K", "SiTV都市剧场", "上海都市剧场"],
-    "游戏风云": ["游戏风云4K", "SiTV游戏风云", "上海游戏风云"],
-    "金色学堂": ["金色学堂4K", "SiTV金色学堂", "上海金色学堂"],
-    "动漫秀场": ["动漫秀场4K", "SiTV动漫秀场", "上海动漫秀场"],
-    "卡酷少儿": ["北京KAKU少儿", "BRTV卡酷少儿", "北京卡酷少儿", "卡酷动画"],
-    "哈哈炫动": ["炫动卡通", "上海哈哈炫动"],
-    "优漫卡通": ["江苏优漫卡通", "优漫漫画"],
-    "金鹰卡通": ["湖南金鹰卡通"],
-    "中国交通": ["中国交通频道"],
-    "中国天气": ["中国天气频道"],
-    "华数4K": ["华数低于4K", "华数4K电影", "华数爱上4K"],
-    "山西卫视": ["山西卫视高清"],
-    "山西黄河HD": ["山西黄河", "黄河电视台高清"],
-    "山西经济与科技HD": ["山西经济与科技", "山西经济与科技高清"],
-    "山西社会与法治HD": ["山西社会与法治", "山西社会与法治高清"],
-    "山西文体生活HD": ["山西文体生活", "山西文体生活高清"],
-    "山西影视HD": ["山西影视", "山西影视高清"]  
-}# 如需更多别名，可自行补回
+# 别名 -> 标准名映射见 channel_names.CHANNEL_MAPPING
 
 # ===============================
 def get_run_count():
@@ -190,23 +135,98 @@ def get_isp_from_api(data):
         return "移动"
     return "未知"
 
-def get_isp_by_regex(ip):
-    if re.match(r"^(1[0-9]{2}|2[0-3]{2}|42|43|58|59|60|61|110|111|112|113|114|115|116|117|118|119|120|121|122|123|124|125|126|127|175|180|182|183|184|185|186|187|188|189|223)\.", ip):
-        return "电信"
-    elif re.match(r"^(42|43|58|59|60|61|110|111|112|113|114|115|116|117|118|119|120|121|122|123|124|125|126|127|175|180|182|183|184|185|186|187|188|189|223)\.", ip):
-        return "联通"
-    elif re.match(r"^(223|36|37|38|39|100|101|102|103|104|105|106|107|108|109|134|135|136|137|138|139|150|151|152|157|158|159|170|178|182|183|184|187|188|189)\.", ip):
-        return "移动"
-    return "未知"
-
 # ===============================
 # 第一阶段：爬取并分类IP
+def classify(ip_port, ip, data):
+    """归属地 -> (ip_port, 省份, 运营商)；查询失败或判断不出运营商返回 None"""
+    if data is None:
+        print(f"⚠️ 归属地查询失败，跳过：{ip_port}")
+        return None
+    province = data.get("regionName") or "未知"
+    isp = get_isp_from_api(data)
+    if isp == "未知":
+        # 离线索引只做兜底：API 给出的运营商优先，索引数据未必完整（见 isp_cidr.txt）
+        isp = isp_index.lookup(ip)
+    if isp == "未知":
+        print(f"⚠️ 无法判断运营商，跳过：{ip_port}")
+        return None
+    return ip_port, province, isp
+
+async def ingest(ip_ports, resolver=None):
+    """并发流水线：解析 host -> 域名解析（带 TTL 缓存）-> 归属地（攒批查询）-> 分类 -> 登记列表。
+    返回 [(ip_port, 省份, 运营商)]；各阶段用队列衔接，域名解析和归属地查询的并发都有上限"""
+    resolver = resolver or dns_cache.Resolver()
+    loop = asyncio.get_running_loop()
+    geo_q = asyncio.Queue()
+    entries = []
+    resolve_sem = asyncio.Semaphore(INGEST_CONCURRENCY)
+    geo_sem = asyncio.Semaphore(GEO_CONCURRENCY)
+
+    async def resolve(ip_port, host):
+        async with resolve_sem:
+            ips = await resolver.resolve(host)
+        if not ips:
+            print(f"❌ 域名解析失败，跳过：{ip_port}")
+            return
+        print(f"🌐 域名解析成功: {host} → {ips[0]}")
+        await geo_q.put((ip_port, ips[0]))
+
+    async def produce():
+        tasks = []
+        for ip_port in ip_ports:
+            host = ip_port.split(":")[0]
+            if re.match(r"^\d{1,3}(\.\d{1,3}){3}$", host):
+                await geo_q.put((ip_port, host))
+            else:
+                tasks.append(asyncio.ensure_future(resolve(ip_port, host)))
+        metrics.set_value("domains", len(tasks))
+        await asyncio.gather(*tasks)
+        await geo_q.put(None)
+
+    async def geolocate(batch):
+        async with geo_sem:
+            infos = await asyncio.to_thread(geo_cache.lookup_many, [ip for _, ip in batch], "zh-CN")
+        for ip_port, ip in batch:
+            try:
+                entry = classify(ip_port, ip, infos.get(ip))
+            except Exception as e:
+                print(f"⚠️ 解析 {ip_port} 出错：{e}")
+                continue
+            if entry:
+                entries.append(entry)
+
+    async def batcher():
+        # 攒够一批或等满 GEO_BATCH_LINGER 就发出，不必等全部域名解析完
+        batches = []
+        finished = False
+        while not finished:
+            item = await geo_q.get()
+            if item is None:
+                break
+            batch = [item]
+            end = loop.time() + GEO_BATCH_LINGER
+            while len(batch) < geo_cache.BATCH_SIZE:
+                try:
+                    item = await asyncio.wait_for(geo_q.get(), max(end - loop.time(), 0))
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    finished = True
+                    break
+                batch.append(item)
+            batches.append(asyncio.ensure_future(geolocate(batch)))
+        await asyncio.gather(*batches)
+
+    await asyncio.gather(produce(), batcher())
+    return entries
+
 def first_stage():
     os.makedirs(IP_DIR, exist_ok=True)
     all_ips = set()
     for url, filename in FOFA_URLS.items():
         print(f"📡 正在爬取 {filename} ...")
         try:
+            metrics.inc("fofa_requests")
             r = requests.get(url, headers=HEADERS, timeout=15)
             urls_all = re.findall(r'<a href="http://(.*?)"', r.text)
             all_ips.update(u.strip() for u in urls_all if u.strip())
@@ -214,56 +234,67 @@ def first_stage():
             print(f"❌ 爬取失败：{e}")
         time.sleep(3)
 
-    province_isp_dict = {}
-    for ip_port in all_ips:
-        try:
-            host = ip_port.split(":")[0]
-            is_ip = re.match(r"^\d{1,3}(\.\d{1,3}){3}$", host)
-            if not is_ip:
-                try:
-                    resolved_ip = socket.gethostbyname(host)
-                    print(f"🌐 域名解析成功: {host} → {resolved_ip}")
-                    ip = resolved_ip
-                except Exception:
-                    print(f"❌ 域名解析失败，跳过：{ip_port}")
-                    continue
-            else:
-                ip = host
-
-            res = requests.get(f"http://ip-api.com/json/{ip}?lang=zh-CN", timeout=10)
-            data = res.json()
-            province = data.get("regionName", "未知")
-            isp = get_isp_from_api(data)
-            if isp == "未知":
-                isp = get_isp_by_regex(ip)
-            if isp == "未知":
-                print(f"⚠️ 无法判断运营商，跳过：{ip_port}")
-                continue
+    entries = asyncio.run(ingest(sorted(all_ips)))
 
-            fname = f"{province}{isp}.txt"
-            province_isp_dict.setdefault(fname, set()).add(ip_port)
-        except Exception as e:
-            print(f"⚠️ 解析 {ip_port} 出错：{e}")
-            continue
+    print(f"🌐 域名解析：缓存命中 {dns_cache.stats['cache_hits']} 次（其中否定 {dns_cache.stats['negative_hits']} 次），"
+          f"实际查询 {dns_cache.stats['lookups']} 次，失败 {dns_cache.stats['failures']} 次")
+    print(f"🗂️ 归属地查询：缓存命中 {geo_cache.stats['cache_hits']} 次，API 调用 {geo_cache.stats['api_calls']} 次")
+    metrics.set_value("fofa_ips", len(all_ips))
+    metrics.set_value("registered", len(entries))
 
     count = get_run_count() + 1
     save_run_count(count)
 
-    for filename, ip_set in province_isp_dict.items():
-        path = os.path.join(IP_DIR, filename)
-        try:
-            with open(path, "a", encoding="utf-8") as f:
-                for ip_port in sorted(ip_set):
-                    f.write(ip_port + "\n")
-            print(f"✅ {path} 已追加写入 {len(ip_set)} 个 IP")
-        except Exception as e:
-            print(f"❌ 写入 {path} 失败：{e}")
+    # 登记到服务器注册表（按 ip:port 去重），再导出 ip/*.txt 视图
+    try:
+        server_registry.upsert(entries)
+        written = server_registry.export_views(IP_DIR)
+        print(f"✅ 注册表登记 {len(entries)} 个地址，导出 {len(written)} 个 ip 文件（共 {server_registry.count()} 个服务器）")
+    except Exception as e:
+        print(f"❌ 更新服务器注册表失败：{e}")
 
     print(f"✅ 第一阶段完成，当前轮次：{count}")
     return count
 
 # ===============================
 # 第二阶段：组合生成 zubo.txt
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def read_lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [x.strip() for x in f if x.strip()]
+
+def rtp_paths(rtp_lines):
+    """rtp 行 -> {"rtp/组播地址": 频道名}，同一地址保留第一次出现的频道名"""
+    paths = {}
+    for ch_name, path, _ in rtp_verify.parse(rtp_lines):
+        paths.setdefault(path, ch_name)
+    return paths
+
+def iter_zubo_lines(ip_ports, paths, emitted):
+    """逐行生成 频道,http://ip:port/rtp/组播，按 URL 去重且不构建完整列表"""
+    # emitted 只记录出现在多个 ip 文件里的 ip:port 已写出的地址，保证跨文件同样去重
+    for ip_port in ip_ports:
+        done = emitted.get(ip_port)
+        for path, ch_name in paths.items():
+            if done is not None:
+                if path in done:
+                    continue
+                done.add(path)
+            yield f"{ch_name},http://{ip_port}/{path}\n"
+
+def load_manifest():
+    try:
+        with open(ZUBO_MANIFEST, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
 def second_stage():
     print("🔔 第二阶段触发：生成 zubo.txt")
     if not os.path.exists(IP_DIR):
@@ -273,189 +304,366 @@ def second_stage():
         print("⚠️ rtp 目录不存在，无法进行第二阶段组合，跳过")
         return
 
-    combined_lines = []
-    for ip_file in os.listdir(IP_DIR):
-        if not ip_file.endswith(".txt"):
-            continue
-        ip_path = os.path.join(IP_DIR, ip_file)
-        rtp_path = os.path.join(RTP_DIR, ip_file)
-        if not os.path.exists(rtp_path):
-            continue
+    pairs = []
+    for ip_file in sorted(os.listdir(IP_DIR)):
+        if ip_file.endswith(".txt") and os.path.exists(os.path.join(RTP_DIR, ip_file)):
+            pairs.append(ip_file)
+
+    ip_lists, ip_hashes, rtp_hashes = {}, {}, {}
+    owners = {}
+    for name in pairs:
         try:
-            with open(ip_path, encoding="utf-8") as f1, open(rtp_path, encoding="utf-8") as f2:
-                ip_lines = [x.strip() for x in f1 if x.strip()]
-                rtp_lines = [x.strip() for x in f2 if x.strip()]
+            ip_lists[name] = list(dict.fromkeys(read_lines(os.path.join(IP_DIR, name))))
+            ip_hashes[name] = file_sha1(os.path.join(IP_DIR, name))
+            rtp_hashes[name] = file_sha1(rtp_verify.source_path(name, RTP_DIR))
         except Exception as e:
             print(f"⚠️ 文件读取失败：{e}")
+            ip_lists.pop(name, None)
             continue
-
-        if not ip_lines or not rtp_lines:
-            continue
-
-        for ip_port in ip_lines:
-            for rtp_line in rtp_lines:
-                if "," not in rtp_line:
-                    continue
-                ch_name, rtp_url = rtp_line.split(",", 1)
-                if "rtp://" in rtp_url:
-                    part = rtp_url.split("rtp://", 1)[1]
-                    combined_lines.append(f"{ch_name},http://{ip_port}/rtp/{part}")
-                elif "udp://" in rtp_url:
-                    part = rtp_url.split("udp://", 1)[1]
-                    combined_lines.append(f"{ch_name},http://{ip_port}/udp/{part}")
-
-    # 去重
-    unique = {}
-    for line in combined_lines:
-        url_part = line.split(",", 1)[1]
-        if url_part not in unique:
-            unique[url_part] = line
-
+        for ip_port in ip_lists[name]:
+            owners.setdefault(ip_port, []).append(name)
+    pairs = [p for p in pairs if p in ip_lists]
+
+    # 每个文件对的缓存键：自身 ip/rtp 哈希及 rtp 来源（原文件或精简列表）+ 与前面文件共享的 ip:port 所依赖的 rtp 哈希
+    keys = {}
+    for name in pairs:
+        shared = []
+        for ip_port in ip_lists[name]:
+            before = [(o, rtp_hashes[o]) for o in owners[ip_port] if o < name]
+            if before:
+                shared.append((ip_port, before))
+        raw = json.dumps([ip_hashes[name], rtp_hashes[name], rtp_verify.source_path(name, RTP_DIR), shared],
+                         ensure_ascii=False)
+        keys[name] = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    old = load_manifest()
+    old_pairs = old.get("pairs", {})
+    reusable = os.path.exists(ZUBO_FILE) and old.get("zubo_sha1") == file_sha1(ZUBO_FILE)
+
+    emitted = {ip: set() for ip, names in owners.items() if len(names) > 1}
+    new_pairs = {}
+    total = reused = 0
+    tmp_file = ZUBO_FILE + ".tmp"
+    snap = snapshot.SnapshotWriter()   # 与 zubo.txt 同步写出二进制快照，第三阶段直接读取
+    # 复用的分段直接从上一份快照按行号整段复制，不再解码、拆分 zubo.txt 的文本
+    old_snap = snapshot.open_fresh(ZUBO_FILE) if reusable else None
     try:
-        with open(ZUBO_FILE, "w", encoding="utf-8") as f:
-            for line in unique.values():
-                f.write(line + "\n")
-        print(f"🎯 第二阶段完成，写入 {len(unique)} 条记录")
+        with open(tmp_file, "wb") as out, open(ZUBO_FILE if reusable else os.devnull, "rb") as old_zubo:
+            for name in pairs:
+                offset, row = out.tell(), len(snap)
+                entry = old_pairs.get(name)
+                paths = None
+                if reusable and entry and entry.get("key") == keys[name]:
+                    old_zubo.seek(entry["offset"])
+                    chunk = old_zubo.read(entry["length"])
+                    out.write(chunk)
+                    lines = entry["lines"]
+                    if old_snap is not None and "row" in entry and entry["row"] + lines <= len(old_snap):
+                        snap.copy_rows(old_snap, entry["row"], lines)
+                    else:
+                        for line in chunk.decode("utf-8").splitlines():
+                            snap.add("", *line.split(",", 1))
+                    reused += 1
+                    # 复用的分段同样要登记跨文件去重信息
+                    if any(ip in emitted for ip in ip_lists[name]):
+                        paths = rtp_paths(read_lines(rtp_verify.source_path(name, RTP_DIR)))
+                        for _ in iter_zubo_lines([ip for ip in ip_lists[name] if ip in emitted], paths, emitted):
+                            pass
+                else:
+                    paths = rtp_paths(read_lines(rtp_verify.source_path(name, RTP_DIR)))
+                    lines = 0
+                    for line in iter_zubo_lines(ip_lists[name], paths, emitted):
+                        out.write(line.encode("utf-8"))
+                        snap.add("", *line.rstrip("\n").split(",", 1))
+                        lines += 1
+                new_pairs[name] = {
+                    "key": keys[name], "ip_sha1": ip_hashes[name], "rtp_sha1": rtp_hashes[name],
+                    "offset": offset, "length": out.tell() - offset, "lines": lines, "row": row,
+                }
+                total += lines
+        os.replace(tmp_file, ZUBO_FILE)
+        with open(ZUBO_MANIFEST, "w", encoding="utf-8") as f:
+            json.dump({"zubo_sha1": file_sha1(ZUBO_FILE), "pairs": new_pairs}, f, ensure_ascii=False, indent=1)
+        snap.save(snapshot.snap_path(ZUBO_FILE), source=ZUBO_FILE)
+        print(f"🎯 第二阶段完成，写入 {total} 条记录（{len(pairs)} 个文件对，复用 {reused} 个未变化的分段）")
+        metrics.set_value("pairs", len(pairs))
+        metrics.set_value("segments_reused", reused)
+        metrics.set_value("lines_out", total)
     except Exception as e:
         print(f"❌ 写文件失败：{e}")
+    finally:
+        if old_snap is not None:
+            old_snap.close()
 
-# ===============================
-# 第三阶段：检测并生成 IPTV.txt + 备份 live.txt
-def third_stage():
-    print("🧩 第三阶段：多线程检测代表频道生成 IPTV.txt 并写回可用 IP")
-    if not os.path.exists(ZUBO_FILE):
-        print("⚠️ zubo.txt 不存在，跳过第三阶段")
-        return
-
-    def check_stream(url, timeout=5):
-        try:
-            result = subprocess.run(
-                ["ffprobe", "-v", "error", "-show_streams", "-i", url],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                timeout=timeout + 2
-            )
-            return b"codec_type" in result.stdout
-        except Exception:
-            return False
-
-    # 别名映射
-    alias_map = {}
-    for main_name, aliases in CHANNEL_MAPPING.items():
-        for alias in aliases:
-            alias_map[alias] = main_name
-
-    # 读取现有 ip 文件，建立 ip_port -> operator 映射
-    ip_info = {}
-    if os.path.exists(IP_DIR):
-        for fname in os.listdir(IP_DIR):
-            if not fname.endswith(".txt"):
-                continue
-            province_operator = fname.replace(".txt", "")
-            try:
-                with open(os.path.join(IP_DIR, fname), encoding="utf-8") as f:
-                    for line in f:
-                        ip_port = line.strip()
-                        if ip_port:
-                            ip_info[ip_port] = province_operator
-            except Exception as e:
-                print(f"⚠️ 读取 {fname} 失败：{e}")
-
-    # 读取 zubo.txt 并按 ip:port 分组
+def load_zubo_groups():
+    """读取 zubo.txt 并按 ip:port 分组 -> {ip_port: [(标准频道名, url)]}；有新鲜快照时直接读快照，免去逐行解析"""
     groups = {}
-    with open(ZUBO_FILE, encoding="utf-8") as f:
-        for line in f:
-            if "," not in line:
-                continue
-            ch_name, url = line.strip().split(",", 1)
-            ch_main = alias_map.get(ch_name, ch_name)
-            m = re.match(r"http://([^/]+)/", url)
-            if not m:
-                continue
-            ip_port = m.group(1)
-            groups.setdefault(ip_port, []).append((ch_main, url))
+    snap = snapshot.open_fresh(ZUBO_FILE)
+    if snap is not None:
+        with snap:
+            for _, ch_name, ip_port, path, _ in snap.rows():
+                if ip_port:
+                    groups.setdefault(ip_port, []).append(
+                        (channel_names.canonical(ch_name), snapshot.join_url(ip_port, path)))
+    else:
+        with open(ZUBO_FILE, encoding="utf-8") as f:
+            for line in f:
+                if "," not in line:
+                    continue
+                ch_name, url = line.strip().split(",", 1)
+                ch_main = channel_names.canonical(ch_name)
+                m = re.match(r"http://([^/]+)/", url)
+                if not m:
+                    continue
+                ip_port = m.group(1)
+                groups.setdefault(ip_port, []).append((ch_main, url))
+    return groups
 
-    # 检测函数（优先 CCTV1）
+# ===============================
+# 第三阶段：检测并生成 IPTV.txt + 备份 live.txt
+def rep_channels(entries):
+    """代表频道（优先 CCTV1）"""
+    reps = [u for c, u in entries if c == "CCTV1"]
+    if not reps and entries:
+        reps = [entries[0][1]]
+    return reps
+
+def probe_servers(groups):
+    """检测 {ip_port: [(标准频道名, url)]} 里每个服务器的代表频道，结果写入注册表并导出 ip/*.txt。
+    返回 (可播放的 ip_port 集合, 是否被中断或到点, 探测日志)；日志由调用方在输出写完后结束"""
+    # 检测函数：ffprobe 模式
     def detect_ip(ip_port, entries):
-        rep_channels = [u for c, u in entries if c == "CCTV1"]
-        if not rep_channels and entries:
-            rep_channels = [entries[0][1]]
-        playable = any(check_stream(u) for u in rep_channels)
-        return ip_port, playable
-
-    print(f"🚀 启动多线程检测（共 {len(groups)} 个 IP）...")
-    playable_ips = set()
-    with concurrent.futures.ThreadPoolExecutor(max_workers=10) as executor:
-        futures = {executor.submit(detect_ip, ip, chs): ip for ip, chs in groups.items()}
-        for future in concurrent.futures.as_completed(futures):
-            try:
-                ip_port, ok = future.result()
-            except Exception as e:
-                print(f"⚠️ 线程检测返回异常：{e}")
-                continue
-            if ok:
-                playable_ips.add(ip_port)
-
+        url, elapsed = stream_probe.check_first(
+            rep_channels(entries), stream_probe.ffprobe_check, HEDGE_FANOUT, HEDGE_DEADLINE)
+        return ip_port, url is not None, elapsed
+
+    # 检测函数：async 模式
+    async def _detect(item):
+        ip_port, entries = item
+        url, elapsed = await stream_probe.probe_first(rep_channels(entries), HEDGE_FANOUT, HEDGE_DEADLINE)
+        return ip_port, url is not None, elapsed if url else None
+
+    # 上一轮被取消时留下的新鲜结果直接复用，只测剩下的
+    journal = probe_journal.ProbeJournal("third_stage", JOURNAL_TTL)
+    results = [tuple(journal.results[ip]) for ip in groups if ip in journal.results]
+    todo = {ip: entries for ip, entries in groups.items() if ip not in journal.results}
+    if results:
+        print(f"📒 从探测日志恢复 {len(results)} 个结果，本轮只需检测 {len(todo)} 个 IP")
+
+    # TCP 连接预筛：连不上的直接记为不可播放，不占流探测的并发和时间
+    rtts = {}
+    if TCP_PREFILTER and todo:
+        rtts = tcp_scan.scan(todo)
+        unreachable = [ip for ip in todo if rtts.get(ip) is None]
+        results.extend((ip, False, None) for ip in unreachable)
+        todo = {ip: entries for ip, entries in todo.items() if rtts.get(ip) is not None}
+        print(f"🔌 TCP 预筛：{len(todo)} 个可连接，{len(unreachable)} 个连不上")
+        metrics.set_value("tcp_unreachable", len(unreachable))
+
+    # 截止时间模式：没测过的、上次可用的、代表频道是 CCTV1 的先测，同等价值时 RTT 小的先测
+    deadline = None
+    if PROBE_DEADLINE:
+        try:
+            last = server_registry.last_probes()
+        except Exception as e:
+            print(f"⚠️ 读取注册表失败，按原顺序检测：{e}")
+            last = {}
+        todo = dict(sorted(todo.items(), key=lambda kv: (-probe_scheduler.expected_value(
+            last.get(kv[0]), any(c == "CCTV1" for c, _ in kv[1])), rtts.get(kv[0], 0))))
+        deadline = probe_scheduler.Deadline(PROBE_DEADLINE)
+        print(f"⏱️ 截止时间模式：预算 {PROBE_DEADLINE:.0f} 秒，按期望价值排序并自适应调节并发")
+
+    def on_result(item, r):
+        if r is not None:
+            results.append(r)
+            journal.record(item[0], r)
+
+    async def detect_all():
+        stream_probe.raise_nofile_limit()
+        await probe_scheduler.run_async(
+            _detect, todo.items(), key=lambda item: item[0], failed=lambda r: not r[1],
+            on_result=on_result, deadline=deadline, limit=PROBE_CONCURRENCY)
+
+    # 按 ip:port 与 /24 限流、主机间轮转派发，出错的主机自动退避
+    interrupted = False
+    try:
+        if PROBE_MODE == "ffprobe":
+            print(f"🚀 启动多线程 ffprobe 检测（共 {len(todo)} 个 IP，并发 {FFPROBE_CONCURRENCY}）...")
+            for item, r in probe_scheduler.run_threads(
+                    lambda item: detect_ip(*item), todo.items(), key=lambda item: item[0],
+                    failed=lambda r: not r[1], deadline=deadline, limit=FFPROBE_CONCURRENCY):
+                if r is None:
+                    print(f"⚠️ 线程检测返回异常：{item[0]}")
+                else:
+                    on_result(item, r)
+        else:
+            print(f"🚀 启动 asyncio 检测（共 {len(todo)} 个 IP，并发 {PROBE_CONCURRENCY}）...")
+            asyncio.run(detect_all())
+    except KeyboardInterrupt:
+        interrupted = True
+        print(f"⏸️ 检测被中断，已完成 {len(results)}/{len(groups)} 个，先用这些结果生成输出，下次从断点继续")
+    if deadline and deadline.hit:
+        print(f"⏰ 到达时间预算，已完成 {len(results)}/{len(groups)} 个，先用这些结果生成输出，下次从断点继续")
+    stopped = interrupted or bool(deadline and deadline.hit)
+
+    playable_ips = {ip for ip, ok, _ in results if ok}
     print(f"✅ 检测完成，可播放 IP 共 {len(playable_ips)} 个")
+    if stopped:
+        # 没来得及测的 IP 沿用注册表里上次的结论
+        probed = {ip for ip, _, _ in results}
+        try:
+            live = {ip for ips in server_registry.groups(live_only=True).values() for ip in ips}
+        except Exception as e:
+            print(f"⚠️ 读取注册表失败，未检测的 IP 本轮不输出：{e}")
+            live = set()
+        carried = {ip for ip in groups if ip not in probed and ip in live}
+        playable_ips |= carried
+        print(f"♻️ 未检测的 IP 中沿用上次可用结论 {len(carried)} 个")
+    metrics.set_value("servers", len(groups))
+    metrics.set_value("resumed", len(groups) - len(todo))
+    metrics.set_value("interrupted", int(interrupted))
+    metrics.set_value("playable_servers", len(playable_ips))
+    for _, ok, elapsed in results:
+        if ok:
+            metrics.observe("server_latency_ms", elapsed)
+
+    # 探测结果写入注册表（日志里已写过的不重复记），并重新导出 ip/*.txt 视图（剔除本轮不可播放的地址；
+    # 整组都不可播放时保留原文件，下一轮继续复测）
+    try:
+        server_registry.record_probes([(ip, ok, latency, None) for ip, ok, latency in results
+                                       if ip not in journal.saved])
+        journal.mark_saved()
+        for name, n in server_registry.export_views(IP_DIR).items():
+            print(f"📥 写回 {os.path.join(IP_DIR, name + '.txt')}，共 {n} 个可用地址")
+    except Exception as e:
+        print(f"❌ 更新服务器注册表失败：{e}")
+    return playable_ips, stopped, journal
 
-    valid_lines = []
+def iter_valid(playable_ips, lines_of):
+    """可播放服务器的频道线路 (频道名, url, 归属)，按 频道名,url 去重；lines_of(ip_port) 给出该服务器的 [(标准频道名, url)]"""
+    ip_info = server_registry.group_of()
     seen = set()
-    operator_playable_ips = {}
     for ip_port in playable_ips:
         operator = ip_info.get(ip_port, "未知")
-        for c, u in groups.get(ip_port, []):
+        for c, u in lines_of(ip_port):
             key = f"{c},{u}"
             if key not in seen:
                 seen.add(key)
-                valid_lines.append(f"{c},{u}${operator}")
-                operator_playable_ips.setdefault(operator, set()).add(ip_port)
+                yield c, u, operator
 
-    # 写回可用IP
-    for operator, ip_set in operator_playable_ips.items():
-        target_file = os.path.join(IP_DIR, operator + ".txt")
-        try:
-            with open(target_file, "w", encoding="utf-8") as wf:
-                for ip_p in sorted(ip_set):
-                    wf.write(ip_p + "\n")
-            print(f"📥 写回 {target_file}，共 {len(ip_set)} 个可用地址")
-        except Exception as e:
-            print(f"❌ 写回 {target_file} 失败：{e}")
-
-    # 生成 IPTV.txt
+def write_outputs(valid):
+    """(频道名, url, 归属) 流式组装成播放列表，写出 IPTV.txt、live.txt 备份和 IPTV.m3u；IPTV.txt 写失败返回 False"""
+    # 组装播放列表：按 CHANNEL_CATEGORIES 分组，同一频道的线路保持检测结果顺序
     beijing_now = datetime.now(timezone(timedelta(hours=8))).strftime("%Y-%m-%d %H:%M:%S")
+    pl = playlist.Playlist(updated=beijing_now)
+    count = 0
+    if CHANNEL_CATEGORIES:
+        by_name = {}
+        for c, u, operator in valid:
+            by_name.setdefault(c, []).append((u, operator))
+            count += 1
+        for category, ch_list in CHANNEL_CATEGORIES.items():
+            pl.category(category)
+            for ch in ch_list:
+                for u, operator in by_name.get(ch, []):
+                    pl.add(ch, u, category, operator)
+    else:
+        for c, u, operator in valid:
+            pl.add(c, u, "全部频道", operator)
+            count += 1
+
+    # 同一个模型直接输出 IPTV.txt、live.txt 备份和 IPTV.m3u，不再回读文本
     try:
         with open(IPTV_FILE, "w", encoding="utf-8") as f:
-            f.write(f"更新时间,#genre#\n")
-            f.write(f"{beijing_now},#genre#\n\n")
-
-            if CHANNEL_CATEGORIES:
-                for category, ch_list in CHANNEL_CATEGORIES.items():
-                    f.write(f"{category},#genre#\n")
-                    for ch in ch_list:
-                        for line in valid_lines:
-                            name = line.split(",", 1)[0]
-                            if name == ch:
-                                f.write(line + "\n")
-                    f.write("\n")
-            else:
-                f.write("全部频道,#genre#\n")
-                for line in valid_lines:
-                    f.write(line + "\n")
+            playlist.render_txt(pl, f)
+        print(f"🎯 IPTV.txt 生成完成，共 {count} 条频道")
+        metrics.set_value("lines_out", count)
+    except Exception as e:
+        print(f"❌ 写 IPTV.txt 失败：{e}")
+        return False
 
-        print(f"🎯 IPTV.txt 生成完成，共 {len(valid_lines)} 条频道")
+    try:
+        with open(LIVE_BACKUP_FILE, "w", encoding="utf-8") as f:
+            playlist.render_txt(pl, f)
+        print(f"✅ 根目录 {LIVE_BACKUP_FILE} 备份生成完成")
+    except Exception as e:
+        print(f"❌ {LIVE_BACKUP_FILE} 备份失败：{e}")
 
-        # 新增功能：备份 IPTV.txt 到根目录的 live.txt
+    try:
+        convert_to_m3u.render(pl)
+        print(f"✅ {convert_to_m3u.OUTPUT_FILE} 生成完成")
+    except Exception as e:
+        print(f"❌ 写 {convert_to_m3u.OUTPUT_FILE} 失败：{e}")
+    return True
+
+def third_stage():
+    print("🧩 第三阶段：并发检测代表频道生成 IPTV.txt 并写回可用 IP")
+    if not os.path.exists(ZUBO_FILE):
+        print("⚠️ zubo.txt 不存在，跳过第三阶段")
+        return
+
+    groups = load_zubo_groups()
+    playable_ips, stopped, journal = probe_servers(groups)
+    written = write_outputs(iter_valid(playable_ips, lambda ip_port: groups.get(ip_port, [])))
+    # 完整跑完才标记结束；被中断、到点或输出失败时日志保留，下次运行接着测
+    if written and not stopped:
+        journal.complete()
+    journal.close()
+
+# ===============================
+# 先验证后展开：不生成 zubo.txt，每个服务器只用所属 rtp 文件的代表组播检测，可播放的服务器才展开频道线路，
+# 直接送进播放列表输出；内存和读写量随可播放服务器数增长，而不是随 ip/ 里全部服务器 × rtp 行数增长
+def verify_expand_stage():
+    print("🧩 先验证后展开：用代表组播检测 ip/ 里的服务器，只展开可播放服务器的频道")
+    if not os.path.exists(IP_DIR) or not os.path.exists(RTP_DIR):
+        print("⚠️ ip 或 rtp 目录不存在，跳过")
+        return
+
+    owners = {}     # ip_port -> [所属文件名]，同一地址出现在多个文件时按文件名顺序
+    paths_of = {}   # 文件名 -> {"rtp/组播地址": 频道名}
+    for name in sorted(os.listdir(IP_DIR)):
+        if not name.endswith(".txt") or not os.path.exists(os.path.join(RTP_DIR, name)):
+            continue
         try:
-            with open(IPTV_FILE, "r", encoding="utf-8") as src:
-                content = src.read()
-            with open(LIVE_BACKUP_FILE, "w", encoding="utf-8") as dst:
-                dst.write(content)
-            print(f"✅ 根目录 {LIVE_BACKUP_FILE} 备份生成完成")
+            ip_ports = list(dict.fromkeys(read_lines(os.path.join(IP_DIR, name))))
+            paths_of[name] = rtp_paths(read_lines(rtp_verify.source_path(name, RTP_DIR)))
         except Exception as e:
-            print(f"❌ {LIVE_BACKUP_FILE} 备份失败：{e}")
-
-    except Exception as e:
-        print(f"❌ 写 IPTV.txt 失败：{e}")
+            print(f"⚠️ 文件读取失败：{e}")
+            paths_of.pop(name, None)
+            continue
+        for ip_port in ip_ports:
+            owners.setdefault(ip_port, []).append(name)
+
+    # 与第三阶段同样的代表频道规则：所属 rtp 文件里的 CCTV1 全部作为候选，都没有时取第一个组播
+    reps_of = {}
+    for name, paths in paths_of.items():
+        entries = [(channel_names.canonical(ch_name), path) for path, ch_name in paths.items()]
+        reps_of[name] = [e for e in entries if e[0] == "CCTV1"] or entries[:1]
+    groups = {}
+    for ip_port, names in owners.items():
+        entries = list(dict.fromkeys(
+            (c, f"http://{ip_port}/{path}") for name in names for c, path in reps_of[name]))
+        if entries:
+            groups[ip_port] = entries
+    print(f"📋 {len(paths_of)} 个文件对，{len(groups)} 个服务器待检测"
+          f"（全量展开约 {sum(len(paths_of[n]) for ns in owners.values() for n in ns)} 行）")
+    metrics.set_value("pairs", len(paths_of))
+
+    playable_ips, stopped, journal = probe_servers(groups)
+
+    # 展开与第二阶段一致：按 URL 去重，跨文件的同一服务器不重复输出
+    emitted = {ip_port: set() for ip_port, names in owners.items() if len(names) > 1}
+
+    def lines_of(ip_port):
+        for name in owners.get(ip_port, []):
+            for line in iter_zubo_lines([ip_port], paths_of[name], emitted):
+                ch_name, url = line.rstrip("\n").split(",", 1)
+                yield channel_names.canonical(ch_name), url
+
+    written = write_outputs(iter_valid(playable_ips, lines_of))
+    if written and not stopped:
+        journal.complete()
+    journal.close()
 
 # ===============================
 # 文件推送
@@ -474,18 +682,66 @@ def push_all_files():
     os.system('git commit -m "自动更新：计数、IP文件、zubo、IPTV.txt、live.txt" || echo "⚠️ 无需提交"')
     os.system("git push origin main || echo '⚠️ 推送失败'")
 
+# ===============================
+# 轮次计划
+def scheduled(run_count):
+    """本轮按计划要做的重任务：{"stages", "discover", "rtp_verify"} 的子集"""
+    tasks = set()
+    if run_count % STAGE_EVERY == 0:
+        tasks.add("stages")
+    if DISCOVER_EVERY and run_count % DISCOVER_EVERY == DISCOVER_EVERY // 2:
+        tasks.add("discover")
+    if RTP_VERIFY_EVERY and run_count % RTP_VERIFY_EVERY == RTP_VERIFY_OFFSET:
+        tasks.add("rtp_verify")
+    return tasks
+
+def check_schedule():
+    """一个完整周期内每轮最多安排一项重任务，否则各自的时限叠加会超出 15 分钟的触发间隔"""
+    period = math.lcm(STAGE_EVERY, DISCOVER_EVERY or 1, RTP_VERIFY_EVERY or 1)
+    clashes = [n for n in range(period) if len(scheduled(n)) > 1]
+    assert not clashes, f"轮次计划冲突：周期 {period} 内第 {clashes[:5]} 轮安排了多项任务 {scheduled(clashes[0])}"
+
 # ===============================
 # 主执行逻辑
 if __name__ == "__main__":
+    check_schedule()
+    probe_journal.install_signal_handlers()
     os.makedirs(IP_DIR, exist_ok=True)
     os.makedirs(RTP_DIR, exist_ok=True)
-
-    run_count = first_stage()
-
-    if run_count % 10 == 0:
-        second_stage()
-        third_stage()
+    # 已提交的 ip/*.txt 每轮合并回注册表，恢复到的注册表较旧时不丢地址
+    merged = server_registry.merge_from_dir(IP_DIR)
+    if merged:
+        print(f"📥 从 {IP_DIR}/*.txt 补登记 {merged} 个注册表里没有的地址")
+
+    with metrics.stage("first_stage"):
+        run_count = first_stage()
+
+    tasks = scheduled(run_count)
+    # 上一轮第三阶段被取消、日志里还有新鲜结果时，本轮补跑
+    run_stages = "stages" in tasks or probe_journal.pending("third_stage", JOURNAL_TTL)
+
+    # 从已验证服务器的邻段发现新地址，下一次第三阶段一并验证
+    if "discover" in tasks:
+        with metrics.stage("discover"):
+            discover.run()
+
+    # 组播验证单独占一轮（与第二、三阶段和邻段发现错开），精简后的列表下一次第二阶段起生效；
+    # 本轮要补跑第三阶段时让出，等下一个周期
+    if "rtp_verify" in tasks and not run_stages:
+        with metrics.stage("rtp_verify"):
+            rtp_verify.run(rtp_dir=RTP_DIR)
+
+    # 两种模式共用第三阶段的探测日志，切换模式也能接着上一轮的断点
+    if run_stages:
+        if PIPELINE_MODE == "verify":
+            with metrics.stage("verify_expand"):
+                verify_expand_stage()
+        else:
+            with metrics.stage("second_stage"):
+                second_stage()
+            with metrics.stage("third_stage"):
+                third_stage()
     else:
-        print("ℹ️ 本次不是 10 的倍数，跳过第二、三阶段")
+        print(f"ℹ️ 本次不是 {STAGE_EVERY} 的倍数，跳过第二、三阶段")
 
 
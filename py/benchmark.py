@@ -0,0 +1,374 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource   # 仅类 Unix 可用，Windows 下不报告 RSS
+except ImportError:
+    resource = None
+
+# ===============================
+# 配置区
+# 合成数据规模以仓库当前 ip/ rtp/ 为 1×：ip 文件的服务器数按倍数放大，rtp 频道表保持原长度（频道表不会随服务器增多而变长）
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCALES = (1, 10, 100)
+REPEAT = 3                     # 每个阶段重复次数，耗时取最小值，峰值内存取最大值
+SEED = 20240601
+REGRESSION_THRESHOLD = 0.10    # compare 时耗时变慢超过 10% 记为退化
+UDPXY_PORTS = (4022, 8888, 8000, 5555, 10001, 8188)
+CATEGORIES = (("央视频道", "CCTV"), ("卫视频道", "卫视"), ("数字频道", ""))
+# 阶段按依赖顺序执行：后面的阶段使用前面阶段生成的文件
+STAGES = (
+    "second_stage", "second_stage_incremental", "zubo_groups_text", "zubo_groups_snapshot",
+    "speed_filter_io", "pgen_generate", "convert_full_m3u", "convert_to_m3u",
+)
+# ===============================
+
+
+def _count_lines(path, unique=False):
+    with open(path, "rb") as f:
+        lines = [line.strip() for line in f if line.strip()]
+    return len(set(lines)) if unique else len(lines)
+
+
+def base_profile(repo=REPO_DIR):
+    """以仓库当前的 ip/ rtp/ 与测速输入为 1× 基准：各文件行数 + 频道名池"""
+    ip_dir, rtp_dir = os.path.join(repo, "ip"), os.path.join(repo, "rtp")
+    ip_counts = {f: _count_lines(os.path.join(ip_dir, f), unique=True) for f in sorted(os.listdir(ip_dir)) if f.endswith(".txt")}
+    rtp_counts, names = {}, []
+    for f in sorted(os.listdir(rtp_dir)):
+        if not f.endswith(".txt"):
+            continue
+        with open(os.path.join(rtp_dir, f), encoding="utf-8") as fh:
+            lines = [l.strip().split(",", 1) for l in fh if "," in l]
+        # 只计能拼出地址的 rtp:// / udp:// 行（按地址去重），与 second_stage 实际组合的数量一致
+        rtp_counts[f] = len({addr for _, addr in lines if "://" in addr})
+        names.extend(name for name, _ in lines)
+    inputs = {}
+    for rel in ("py/live.txt", "py/IPTV2.txt", "py/livezubo.txt"):
+        path = os.path.join(repo, rel)
+        inputs[rel] = _count_lines(path) if os.path.exists(path) else 0
+    return {"ip": ip_counts, "rtp": rtp_counts, "names": sorted(set(names)), "inputs": inputs}
+
+
+def _random_servers(rng, n, used):
+    """生成 n 个不重复的 ip:port，按 /24 聚集（真实数据里同一网段常有多台 udpxy）"""
+    out = []
+    while len(out) < n:
+        subnet = f"{rng.randint(1, 223)}.{rng.randint(0, 255)}.{rng.randint(0, 255)}"
+        for _ in range(rng.randint(1, 6)):
+            ip_port = f"{subnet}.{rng.randint(1, 254)}:{rng.choice(UDPXY_PORTS)}"
+            if ip_port not in used:
+                used.add(ip_port)
+                out.append(ip_port)
+            if len(out) >= n:
+                break
+    return out
+
+
+def _category_of(name):
+    for category, key in CATEGORIES:
+        if key in name:
+            return category
+    return CATEGORIES[-1][0]
+
+
+def _write_live(path, rng, n, entries, header=None, spaced=True):
+    """按 分组,#genre# / 频道,url$地区 格式写出 n 条线路（header 为 更新时间 或单一分组名）"""
+    groups = {}
+    for _ in range(n):
+        region, ip_port, name, addr = rng.choice(entries)
+        line = f"{name},http://{ip_port}/rtp/{addr}${region}"
+        groups.setdefault(header if header and not spaced else _category_of(name), []).append(line)
+    with open(path, "w", encoding="utf-8") as f:
+        if header and spaced:
+            f.write(f"更新时间,#genre#\n{header},#genre#\n\n")
+        for category, lines in groups.items():
+            f.write(f"{category},#genre#\n" + "\n".join(lines) + ("\n\n" if spaced else "\n"))
+
+
+def generate_tree(root, scale, profile, seed=SEED):
+    """在 root 下生成与仓库相同布局的合成数据（ip/ rtp/ py/ test/），返回规模统计"""
+    rng = random.Random(seed + scale)
+    for d in ("ip", "rtp", "py", "test"):
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+    used, entries = set(), []
+    channels = {}
+    for fname, n in profile["rtp"].items():
+        lines = []
+        for i in range(n):
+            name = rng.choice(profile["names"])
+            addr = f"239.{rng.randint(0, 255)}.{i // 250}.{i % 250 + 1}:{rng.choice((5140, 8000, 1234))}"
+            lines.append((name, addr))
+        channels[fname] = lines
+        with open(os.path.join(root, "rtp", fname), "w", encoding="utf-8") as f:
+            f.write("".join(f"{name},rtp://{addr}\n" for name, addr in lines))
+    ip_lines = 0
+    for fname, n in profile["ip"].items():
+        servers = _random_servers(rng, n * scale, used)
+        ip_lines += len(servers)
+        with open(os.path.join(root, "ip", fname), "w", encoding="utf-8") as f:
+            f.write("".join(s + "\n" for s in servers))
+        if fname in channels and channels[fname]:
+            region = fname[:-4]
+            for ip_port in servers[:max(1, len(servers) // 10)]:
+                name, addr = rng.choice(channels[fname])
+                entries.append((region, ip_port, name, addr))
+    inputs = profile["inputs"]
+    if entries:
+        _write_live(os.path.join(root, "py", "live.txt"), rng, inputs["py/live.txt"] * scale, entries, header="2024-06-01 00:00:00")
+        _write_live(os.path.join(root, "py", "IPTV2.txt"), rng, inputs["py/IPTV2.txt"] * scale, entries, header="全量更新", spaced=False)
+        _write_live(os.path.join(root, "py", "livezubo.txt"), rng, inputs["py/livezubo.txt"] * scale, entries)
+        shutil.copy(os.path.join(root, "py", "live.txt"), os.path.join(root, "test", "IPTV.txt"))
+    open(os.path.join(root, "py", "blacklist.txt"), "w").close()
+    return {
+        "ip_files": len(profile["ip"]), "ip_lines": ip_lines,
+        "rtp_files": len(profile["rtp"]), "rtp_lines": sum(profile["rtp"].values()),
+        **{os.path.basename(k): v * scale for k, v in inputs.items()},
+    }
+
+
+# ===============================
+# 各阶段：在合成数据目录内调用仓库里的真实函数，只计时纯 CPU / 本地文件部分（不联网）
+def _rm(*paths):
+    for p in paths:
+        if os.path.exists(p):
+            os.remove(p)
+
+
+def stage_second_stage(incremental=False):
+    import AmJiB
+    import snapshot
+    if not incremental:
+        _rm(AmJiB.ZUBO_FILE, AmJiB.ZUBO_MANIFEST, snapshot.snap_path(AmJiB.ZUBO_FILE))
+    elif not os.path.exists(AmJiB.ZUBO_MANIFEST):
+        AmJiB.second_stage()
+    t0 = time.perf_counter()
+    AmJiB.second_stage()
+    return time.perf_counter() - t0, _count_lines(AmJiB.ZUBO_FILE)
+
+
+def stage_zubo_groups(use_snapshot):
+    import AmJiB
+    import snapshot
+    if not use_snapshot:
+        snapshot.open_fresh = lambda txt_path: None
+    elif snapshot.open_fresh(AmJiB.ZUBO_FILE) is None:
+        AmJiB.second_stage()
+    t0 = time.perf_counter()
+    groups = AmJiB.load_zubo_groups()
+    return time.perf_counter() - t0, sum(len(v) for v in groups.values())
+
+
+def stage_speed_filter_io():
+    import speed_filter
+    speed_filter.OUTPUT_FILE = "py/livezubo_bench.txt"   # 不覆盖后续阶段要用的 livezubo.txt
+    t0 = time.perf_counter()
+    pl = speed_filter.load_inputs(set())
+    speed_filter.write_result(pl, set(pl.servers))
+    return time.perf_counter() - t0, len(pl)
+
+
+def stage_pgen_generate():
+    import importlib.util
+    # 文件名带点，不能直接 import
+    spec = importlib.util.spec_from_file_location(
+        "pgen_custom_list", os.path.join(os.path.dirname(os.path.abspath(__file__)), "zubo.pgen_custom_list.py"))
+    pgen = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(pgen)
+    t0 = time.perf_counter()
+    pgen.generate()
+    return time.perf_counter() - t0, _count_lines(pgen.OUTPUT_TXT)
+
+
+def stage_convert_full_m3u():
+    import convert_full_m3u
+    import snapshot
+    if not os.path.exists(convert_full_m3u.INPUT_FILE):
+        stage_pgen_generate()
+    snapshot.open_fresh = lambda txt_path: None
+    t0 = time.perf_counter()
+    convert_full_m3u.convert()
+    return time.perf_counter() - t0, _count_lines(convert_full_m3u.INPUT_FILE)
+
+
+def stage_convert_to_m3u():
+    import convert_to_m3u
+    t0 = time.perf_counter()
+    convert_to_m3u.main()
+    return time.perf_counter() - t0, _count_lines(convert_to_m3u.INPUT_FILE)
+
+
+_STAGE_FUNCS = {
+    "second_stage": lambda: stage_second_stage(False),
+    "second_stage_incremental": lambda: stage_second_stage(True),
+    "zubo_groups_text": lambda: stage_zubo_groups(False),
+    "zubo_groups_snapshot": lambda: stage_zubo_groups(True),
+    "speed_filter_io": stage_speed_filter_io,
+    "pgen_generate": stage_pgen_generate,
+    "convert_full_m3u": stage_convert_full_m3u,
+    "convert_to_m3u": stage_convert_to_m3u,
+}
+
+
+def _peak_rss_mb():
+    # Linux 下 ru_maxrss 会继承 fork 时父进程的峰值，优先读本进程 exec 后重新计数的 VmHWM
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(rss / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def run_stage(name, tree):
+    """子进程入口：在 tree 目录里跑一个阶段，向 stdout 输出一行 JSON（阶段自身的打印被丢弃）"""
+    os.chdir(tree)
+    os.environ["REGISTRY_DB"] = os.path.join(tree, "py", "servers.db")
+    os.environ["THROUGHPUT_DB"] = os.path.join(tree, "py", "throughput.db")
+    os.environ["GEO_CACHE_DB"] = os.path.join(tree, "py", "geo_cache.db")
+    baseline = _peak_rss_mb()
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            seconds, lines = _STAGE_FUNCS[name]()
+        result = {"seconds": seconds, "lines": lines, "baseline_rss_mb": baseline, "peak_rss_mb": _peak_rss_mb()}
+    except Exception as e:
+        result = {"error": f"{type(e).__name__}: {e}"}
+    print(json.dumps(result))
+
+
+def _measure(name, tree, repeat):
+    runs = []
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), "_stage", name, tree],
+                              capture_output=True, text=True)
+        try:
+            res = json.loads(proc.stdout.strip().splitlines()[-1])
+        except (ValueError, IndexError):
+            res = {"error": (proc.stderr.strip().splitlines() or ["无输出"])[-1]}
+        if "error" in res:
+            return res
+        runs.append(res)
+    best = min(r["seconds"] for r in runs)
+    peaks = [r["peak_rss_mb"] for r in runs if r["peak_rss_mb"] is not None]
+    return {
+        "seconds": round(best, 4),
+        "runs": [round(r["seconds"], 4) for r in runs],
+        "lines": runs[0]["lines"],
+        "lines_per_sec": round(runs[0]["lines"] / best) if best > 0 else None,
+        "peak_rss_mb": max(peaks) if peaks else None,
+        "baseline_rss_mb": runs[0]["baseline_rss_mb"],
+    }
+
+
+def _git_revision():
+    try:
+        out = subprocess.run(["git", "-C", REPO_DIR, "rev-parse", "--short", "HEAD"], capture_output=True, text=True)
+        return out.stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run(scales=SCALES, stages=STAGES, repeat=REPEAT, keep=False):
+    profile = base_profile()
+    report = {
+        "created": time.strftime("%Y-%m-%d %H:%M:%S"), "revision": _git_revision(),
+        "python": platform.python_version(), "platform": platform.platform(),
+        "repeat": repeat, "scales": {},
+    }
+    work = tempfile.mkdtemp(prefix="iptv_bench_")
+    try:
+        for scale in scales:
+            tree = os.path.join(work, f"x{scale}")
+            print(f"🏗️  生成 {scale}× 合成数据...", file=sys.stderr)
+            stats = generate_tree(tree, scale, profile)
+            entry = report["scales"][str(scale)] = {"tree": stats, "stages": {}}
+            for name in stages:
+                res = entry["stages"][name] = _measure(name, tree, repeat)
+                if "error" in res:
+                    print(f"  ❌ {name:26} {res['error']}", file=sys.stderr)
+                else:
+                    print(f"  ⏱️  {name:26} {res['seconds']:8.3f}s  {res['lines_per_sec'] or 0:>10} 行/秒  "
+                          f"峰值 {res['peak_rss_mb']} MB", file=sys.stderr)
+    finally:
+        if keep:
+            print(f"📁 合成数据保留在 {work}", file=sys.stderr)
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    return report
+
+
+def compare(old, new, threshold=REGRESSION_THRESHOLD):
+    """对比两份报告，返回退化的 (规模, 阶段, 比值) 列表"""
+    regressions = []
+    for scale, entry in new["scales"].items():
+        base = old["scales"].get(scale)
+        if not base:
+            continue
+        print(f"📏 {scale}×")
+        for name, res in entry["stages"].items():
+            prev = base["stages"].get(name)
+            if not prev or "error" in prev or "error" in res:
+                print(f"  ➖ {name:26} 无法对比")
+                continue
+            ratio = res["seconds"] / prev["seconds"] if prev["seconds"] else float("inf")
+            icon = "⚠️ " if ratio > 1 + threshold else ("🚀" if ratio < 1 - threshold else "✅")
+            rss = ""
+            if res.get("peak_rss_mb") and prev.get("peak_rss_mb"):
+                rss = f"  内存 {prev['peak_rss_mb']} -> {res['peak_rss_mb']} MB"
+            print(f"  {icon} {name:26} {prev['seconds']:.3f}s -> {res['seconds']:.3f}s  ×{ratio:.2f}{rss}")
+            if ratio > 1 + threshold:
+                regressions.append((scale, name, ratio))
+    return regressions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_stage":
+        run_stage(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="解析 / 组合 / 渲染各阶段的合成规模基准测试（不联网）")
+    sub = parser.add_subparsers(dest="cmd")
+    p_run = sub.add_parser("run", help="生成合成数据并计时，输出 JSON")
+    p_run.add_argument("--scales", default=",".join(map(str, SCALES)), help="规模倍数，逗号分隔")
+    p_run.add_argument("--stages", default=",".join(STAGES), help="要跑的阶段，逗号分隔")
+    p_run.add_argument("--repeat", type=int, default=REPEAT)
+    p_run.add_argument("--out", help="JSON 写入文件（默认输出到 stdout）")
+    p_run.add_argument("--keep", action="store_true", help="保留合成数据目录")
+    p_cmp = sub.add_parser("compare", help="对比两份 JSON 报告，有退化时退出码为 1")
+    p_cmp.add_argument("old")
+    p_cmp.add_argument("new")
+    p_cmp.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(sys.argv[1:] or ["run"])
+
+    if args.cmd == "compare":
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        found = compare(old, new, args.threshold)
+        print(f"{'⚠️ 发现 ' + str(len(found)) + ' 处退化' if found else '✅ 无明显退化'}")
+        sys.exit(1 if found else 0)
+
+    report = run([int(s) for s in args.scales.split(",")], args.stages.split(","), args.repeat, args.keep)
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"💾 结果已写入 {args.out}", file=sys.stderr)
+    else:
+        print(text)
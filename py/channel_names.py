@@ -0,0 +1,245 @@
+import os
+import re
+import sys
+import time
+import random
+from functools import lru_cache
+
+# ===============================
+# 配置区
+RTP_DIR = "rtp"
+CACHE_SIZE = 65536   # normalize / logo_key 的 LRU 缓存条数（频道名重复度很高）
+
+# ===== 映射（别名 -> 标准名） =====
+CHANNEL_MAPPING = {
+    "CCTV1": ["CCTV-1", "CCTV-1 HD", "CCTV1 HD", "CCTV-1综合"],
+    "CCTV2": ["CCTV-2", "CCTV-2 HD", "CCTV2 HD", "CCTV-2财经"],
+    "CCTV3": ["CCTV-3", "CCTV-3 HD", "CCTV3 HD", "CCTV-3综艺"],
+    "CCTV4": ["CCTV-4", "CCTV-4 HD", "CCTV4 HD", "CCTV-4中文国际"],
+    "CCTV4欧洲": ["CCTV-4欧洲", "CCTV-4欧洲", "CCTV4欧洲 HD", "CCTV-4 欧洲", "CCTV-4中文国际欧洲", "CCTV4中文欧洲"],
+    "CCTV4美洲": ["CCTV-4美洲", "CCTV-4北美", "CCTV4美洲 HD", "CCTV-4 美洲", "CCTV-4中文国际美洲", "CCTV4中文美洲"],
+    "CCTV5": ["CCTV-5", "CCTV-5 HD", "CCTV5 HD", "CCTV-5体育"],
+    "CCTV5+": ["CCTV-5+", "CCTV-5+ HD", "CCTV5+ HD", "CCTV-5+体育赛事"],
+    "CCTV6": ["CCTV-6", "CCTV-6 HD", "CCTV6 HD", "CCTV-6电影"],
+    "CCTV7": ["CCTV-7", "CCTV-7 HD", "CCTV7 HD", "CCTV-7国防军事"],
+    "CCTV8": ["CCTV-8", "CCTV-8 HD", "CCTV8 HD", "CCTV-8电视剧"],
+    "CCTV9": ["CCTV-9", "CCTV-9 HD", "CCTV9 HD", "CCTV-9纪录"],
+    "CCTV10": ["CCTV-10", "CCTV-10 HD", "CCTV10 HD", "CCTV-10科教"],
+    "CCTV11": ["CCTV-11", "CCTV-11 HD", "CCTV11 HD", "CCTV-11戏曲"],
+    "CCTV12": ["CCTV-12", "CCTV-12 HD", "CCTV12 HD", "CCTV-12社会与法"],
+    "CCTV13": ["CCTV-13", "CCTV-13 HD", "CCTV13 HD", "CCTV-13新闻"],
+    "CCTV14": ["CCTV-14", "CCTV-14 HD", "CCTV14 HD", "CCTV-14少儿"],
+    "CCTV15": ["CCTV-15", "CCTV-15 HD", "CCTV15 HD", "CCTV-15音乐"],
+    "CCTV16": ["CCTV-16", "CCTV-16 HD", "CCTV-16 4K", "CCTV-16奥林匹克", "CCTV16 4K", "CCTV-16奥林匹克4K"],
+    "CCTV17": ["CCTV-17", "CCTV-17 HD", "CCTV17 HD", "CCTV-17农业农村"],
+    "CCTV4K": ["CCTV4K超高清", "CCTV-4K超高清", "CCTV-4K 超高清", "CCTV 4K"],
+    "CCTV8K": ["CCTV8K超高清", "CCTV-8K超高清", "CCTV-8K 超高清", "CCTV 8K"],
+    "兵器科技": ["CCTV-兵器科技", "CCTV兵器科技"],
+    "风云音乐": ["CCTV-风云音乐", "CCTV风云音乐"],
+    "第一剧场": ["CCTV-第一剧场", "CCTV第一剧场"],
+    "风云足球": ["CCTV-风云足球", "CCTV风云足球"],
+    "风云剧场": ["CCTV-风云剧场", "CCTV风云剧场"],
+    "怀旧剧场": ["CCTV-怀旧剧场", "CCTV怀旧剧场"],
+    "女性时尚": ["CCTV-女性时尚", "CCTV女性时尚"],
+    "世界地理": ["CCTV-世界地理", "CCTV世界地理"],
+    "央视台球": ["CCTV-央视台球", "CCTV央视台球"],
+    "高尔夫网球": ["CCTV-高尔夫网球", "CCTV高尔夫网球", "CCTV央视高网", "CCTV-高尔夫·网球", "央视高网"],
+    "央视文化精品": ["CCTV-央视文化精品", "CCTV央视文化精品", "CCTV文化精品", "CCTV-文化精品", "文化精品"],
+    "卫生健康": ["CCTV-卫生健康", "CCTV卫生健康"],
+    "电视指南": ["CCTV-电视指南", "CCTV电视指南"],
+    "农林卫视": ["陕西农林卫视"],
+    "三沙卫视": ["海南三沙卫视"],
+    "兵团卫视": ["新疆兵团卫视"],
+    "延边卫视": ["吉林延边卫视"],
+    "安多卫视": ["青海安多卫视"],
+    "康巴卫视": ["四川康巴卫视"],
+    "山东教育卫视": ["山东教育"],
+    "中国教育1台": ["CETV1", "中国教育一台", "中国教育1", "CETV-1 综合教育", "CETV-1"],
+    "中国教育2台": ["CETV2", "中国教育二台", "中国教育2", "CETV-2 空中课堂", "CETV-2"],
+    "中国教育3台": ["CETV3", "中国教育三台", "中国教育3", "CETV-3 教育服务", "CETV-3"],
+    "中国教育4台": ["CETV4", "中国教育四台", "中国教育4", "CETV-4 职业教育", "CETV-4"],
+    "早期教育": ["中国教育5台", "中国教育五台", "CETV早期教育", "华电早期教育", "CETV 早期教育"],
+    "CHC影迷电影": ["CHC高清电影", "CHC-影迷电影", "影迷电影", "chc高清电影"],
+    "淘电影": ["IPTV淘电影", "北京IPTV淘电影", "北京淘电影"],
+    "淘精彩": ["IPTV淘精彩", "北京IPTV淘精彩", "北京淘精彩"],
+    "淘剧场": ["IPTV淘剧场", "北京IPTV淘剧场", "北京淘剧场"],
+    "淘4K": ["IPTV淘4K", "北京IPTV4K超清", "北京淘4K", "淘4K", "淘 4K"],
+    "淘娱乐": ["IPTV淘娱乐", "北京IPTV淘娱乐", "北京淘娱乐"],
+    "淘BABY": ["IPTV淘BABY", "北京IPTV淘BABY", "北京淘BABY", "IPTV淘baby", "北京IPTV淘baby", "北京淘baby"],
+    "淘萌宠": ["IPTV淘萌宠", "北京IPTV萌宠TV", "北京淘萌宠"],
+    "魅力足球": ["上海魅力足球"],
+    "睛彩青少": ["睛彩羽毛球"],
+    "求索纪录": ["求索记录", "求索纪录4K", "求索记录4K", "求索纪录 4K", "求索记录 4K"],
+    "金鹰纪实": ["湖南金鹰纪实", "金鹰记实"],
+    "纪实科教": ["北京纪实科教", "BRTV纪实科教", "纪实科教8K"],
+    "星空卫视": ["星空衛視", "星空衛视", "星空卫視"],
+    "CHANNEL[V]": ["CHANNEL-V", "Channel[V]"],
+    "凤凰卫视中文台": ["凤凰中文", "凤凰中文台", "凤凰卫视中文", "凤凰卫视"],
+    "凤凰卫视香港台": ["凤凰香港台", "凤凰卫视香港", "凤凰香港"],
+    "凤凰卫视资讯台": ["凤凰资讯", "凤凰资讯台", "凤凰咨询", "凤凰咨询台", "凤凰卫视咨询台", "凤凰卫视资讯", "凤凰卫视咨询"],
+    "凤凰卫视电影台": ["凤凰电影", "凤凰电影台", "凤凰卫视电影", "鳳凰衛視電影台", " 凤凰电影"],
+    "茶频道": ["湖南茶频道"],
+    "快乐垂钓": ["湖南快乐垂钓"],
+    "先锋乒羽": ["湖南先锋乒羽"],
+    "天元围棋": ["天元围棋频道"],
+    "汽摩": ["重庆汽摩", "汽摩频道", "重庆汽摩频道"],
+    "梨园频道": ["河南梨园频道", "梨园", "河南梨园"],
+    "文物宝库": ["河南文物宝库"],
+    "武术世界": ["河南武术世界"],
+    "乐游": ["乐游频道", "上海乐游频道", "乐游纪实", "SiTV乐游频道", "SiTV 乐游频道"],
+    "欢笑剧场": ["上海欢笑剧场4K", "欢笑剧场 4K", "欢笑剧场4K", "上海欢笑剧场"],
+    "生活时尚": ["生活时尚4K", "SiTV生活时尚", "上海生活时尚"],
+    "都市剧场": ["都市剧场4K", "SiTV都市剧场", "上海都市剧场"],
+    "游戏风云": ["游戏风云4K", "SiTV游戏风云", "上海游戏风云"],
+    "金色学堂": ["金色学堂4K", "SiTV金色学堂", "上海金色学堂"],
+    "动漫秀场": ["动漫秀场4K", "SiTV动漫秀场", "上海动漫秀场"],
+    "卡酷少儿": ["北京KAKU少儿", "BRTV卡酷少儿", "北京卡酷少儿", "卡酷动画"],
+    "哈哈炫动": ["炫动卡通", "上海哈哈炫动"],
+    "优漫卡通": ["江苏优漫卡通", "优漫漫画"],
+    "金鹰卡通": ["湖南金鹰卡通"],
+    "中国交通": ["中国交通频道"],
+    "中国天气": ["中国天气频道"],
+    "华数4K": ["华数低于4K", "华数4K电影", "华数爱上4K"],
+    "山西卫视": ["山西卫视高清"],
+    "山西黄河HD": ["山西黄河", "黄河电视台高清"],
+    "山西经济与科技HD": ["山西经济与科技", "山西经济与科技高清"],
+    "山西社会与法治HD": ["山西社会与法治", "山西社会与法治高清"],
+    "山西文体生活HD": ["山西文体生活", "山西文体生活高清"],
+    "山西影视HD": ["山西影视", "山西影视高清"]  
+}# 如需更多别名，可自行补回
+
+# ===============================
+
+# 别名精确匹配表（别名 -> 标准名），按别名原样与去首尾空白后各登记一次
+_ALIASES = {}
+for _main, _aliases in CHANNEL_MAPPING.items():
+    for _alias in _aliases:
+        _ALIASES.setdefault(_alias, _main)
+        _ALIASES.setdefault(_alias.strip(), _main)
+
+# 洗版规则：先去括号内容，再去干扰词。两遍不能合并成一个正则，
+# 否则被括号隔开的干扰词（如 "H(x)D"）结果与原来的两次 re.sub 不同
+_BRACKET_RE = re.compile(r"[\(\[\uff08].*?[\)\]\uff09]")
+_NOISE_RE = re.compile(r"HD|SD|高清|标清|超清|超高|超准|频道|-", re.IGNORECASE)
+_CCTV_NUM_RE = re.compile(r"CCTV(\d+)")
+# 台标后缀规则（保持原 convert_to_m3u.get_logo_url 的写法，注意 [ -_] 是字符区间）
+_LOGO_SUFFIX_RE = re.compile(r"[ -_]?(HD|高清|4K|超清|超高清|8K|plus|\+|\s*Ⅰ|Ⅱ|Ⅲ|Ⅳ|Ⅴ)$", re.IGNORECASE)
+
+
+def canonical(name):
+    """别名 -> 标准名（精确匹配 CHANNEL_MAPPING），不在表里原样返回"""
+    return _ALIASES.get(name, name)
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def normalize(name):
+    """频道名洗版：保留 4K，剔除括号内容与清晰度等干扰词，CCTV-1 -> CCTV1"""
+    is_4k = "4K" in name.upper()
+    clean = _NOISE_RE.sub("", _BRACKET_RE.sub("", name)).replace(" ", "").upper()
+    if "CCTV" in clean:
+        match = _CCTV_NUM_RE.search(clean)
+        if match:
+            # CCTV5+ 特殊保护
+            if "5+" in name or "5PLUS" in name.upper():
+                clean = "CCTV5+"
+            else:
+                clean = f"CCTV{match.group(1)}"
+    if is_4k and "4K" not in clean:
+        clean += "4K"
+    return clean
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def logo_key(name):
+    """台标文件名（不含扩展名）：去掉清晰度后缀、空格和 &"""
+    return _LOGO_SUFFIX_RE.sub("", name.strip()).replace(" ", "").replace("&", "")
+
+
+# ===============================
+# 基准测试：与各脚本原来的正则链对比
+def _legacy_clean_channel_name(name):
+    is_4k = "4K" in name.upper()
+    clean = re.sub(r'[\(\[\uff08].*?[\)\]\uff09]', '', name)
+    clean = re.sub(r'HD|SD|高清|标清|超清|超高|超准|频道|-', '', clean, flags=re.IGNORECASE)
+    clean = clean.replace(" ", "").upper()
+    if "CCTV" in clean:
+        match = re.search(r'CCTV(\d+)', clean)
+        if match:
+            num = match.group(1)
+            if "5+" in name or "5PLUS" in name.upper():
+                clean = "CCTV5+"
+            else:
+                clean = f"CCTV{num}"
+    if is_4k and "4K" not in clean:
+        clean += "4K"
+    return clean
+
+
+def _legacy_logo_key(ch_name):
+    name = ch_name.strip()
+    name = re.sub(r"[ -_]?(HD|高清|4K|超清|超高清|8K|plus|\+|\s*Ⅰ|Ⅱ|Ⅲ|Ⅳ|Ⅴ)$", "", name, flags=re.IGNORECASE)
+    return name.replace(" ", "").replace("&", "")
+
+
+def _legacy_alias(name, alias_map={}):
+    if not alias_map:
+        for main_name, aliases in CHANNEL_MAPPING.items():
+            for alias in aliases:
+                alias_map[alias] = main_name
+    return alias_map.get(name, name)
+
+
+def load_rtp_names(rtp_dir=RTP_DIR):
+    names = []
+    for fname in sorted(os.listdir(rtp_dir)):
+        if fname.endswith(".txt"):
+            with open(os.path.join(rtp_dir, fname), encoding="utf-8") as f:
+                names.extend(line.split(",", 1)[0] for line in f if "," in line and "#genre#" not in line)
+    return names
+
+
+# 容易让合并后的正则与原写法不一致的名字
+_EDGE_NAMES = ("H(x)D", "高(标)清", "S[测试]D", "CCTV-1(HD)", "CCTV5+ 高清", "频（x）道4K")
+
+
+def benchmark(n=100_000, rtp_dir=RTP_DIR):
+    base = load_rtp_names(rtp_dir) if os.path.isdir(rtp_dir) else []
+    base = base or list(_ALIASES)
+    rnd = random.Random(0)
+    names = [rnd.choice(base) for _ in range(n)]
+
+    def legacy(name):
+        return _legacy_alias(name), _legacy_clean_channel_name(name), _legacy_logo_key(name)
+
+    def engine(name):
+        return canonical(name), normalize(name), logo_key(name)
+
+    def engine_nocache(name):
+        return canonical(name), normalize.__wrapped__(name), logo_key.__wrapped__(name)
+
+    normalize.cache_clear()
+    logo_key.cache_clear()
+    results = {}
+    for label, fn in (("regex_chain", legacy), ("engine_nocache", engine_nocache),
+                      ("engine_cold", engine), ("engine_warm", engine)):
+        t0 = time.perf_counter()
+        out = [fn(x) for x in names]
+        elapsed = time.perf_counter() - t0
+        results[label] = {"seconds": elapsed, "us_per_name": elapsed / n * 1e6, "out": out}
+
+    # 一致性按 rtp/ 全部频道名 + 跨括号的边界写法逐个比对，不只看随机抽样
+    mismatch = [x for x in sorted(set(base) | set(_EDGE_NAMES)) if legacy(x) != engine(x)]
+    print(f"📊 {n} 个频道名（来源 {len(base)} 条，去重 {len(set(base))} 个）")
+    for label, r in results.items():
+        print(f"  {label:14} {r['seconds']:.3f}s  {r['us_per_name']:.2f} µs/名")
+    print(f"  结果一致：{'✅' if not mismatch else f'❌ {len(mismatch)} 个不同，如 {mismatch[:3]}'}")
+    return results, mismatch
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "bench"
+    if cmd == "bench":
+        benchmark()
+    else:
+        for name in sys.argv[1:]:
+            print(f"{name} -> 标准名 {canonical(name)} | 洗版 {normalize(name)} | 台标 {logo_key(name)}")
@@ -0,0 +1,141 @@
+import argparse
+import asyncio
+import ipaddress
+import os
+import time
+
+import metrics
+import probe_scheduler
+import server_registry
+import stream_probe
+import tcp_scan
+
+# ===============================
+# 配置区
+# 邻段发现：已验证可用的 ip:port 往往成片出现（同一 /24 多台 udpxy 用同一端口），
+# 对每个已验证地址所在的 /24（可选 /22）同端口做 TCP 连接扫描，再用 udpxy 特征确认，新地址登记到对应省份运营商
+IP_DIR = "ip"
+DISCOVER_PREFIX = int(os.environ.get("DISCOVER_PREFIX", "24"))   # 24 为同一 /24（254 个地址），22 为 /22（1022 个）
+RESWEEP_AFTER = 7 * 24 * 3600      # 同一网段 + 端口扫过后多久才重扫（秒）
+MAX_CANDIDATES = 100_000           # 单轮最多扫描多少个候选地址
+CONNECT_TIMEOUT = 1.0              # 连接扫描的单目标时限（秒）
+SIGNATURE_TIMEOUT = 3.0            # 特征检查的单目标时限（秒）
+SIGNATURE_CONCURRENCY = 256
+SIGNATURE_PATH = "/status"         # udpxy 的状态页；其它路径也会带 Server 头
+SIGNATURE_BYTES = 4096
+SIGNATURES = (b"udpxy", b"msd_lite", b"rtp2httpd")   # 响应头或正文里出现任一即认为是组播转发服务
+# ===============================
+
+
+def block_of(ip, prefix=DISCOVER_PREFIX):
+    return str(ipaddress.ip_network(f"{ip}/{prefix}", strict=False))
+
+
+def plan_candidates(seeds, known, skip=(), prefix=DISCOVER_PREFIX, limit=MAX_CANDIDATES):
+    """seeds {ip_port: (省份, 运营商)} -> (候选 {ip_port: (省份, 运营商)}, 本轮扫的 [(网段, 端口)])。
+    同一网段 + 端口只扫一次，已登记的地址不再扫"""
+    candidates, blocks, planned = {}, [], set()
+    for ip_port, group in sorted(seeds.items()):
+        ip, port = ip_port.rsplit(":", 1)
+        try:
+            block = block_of(ip, prefix)
+        except ValueError:
+            continue
+        key = (block, int(port))
+        if key in skip or key in planned:
+            continue
+        hosts = [f"{host}:{port}" for host in ipaddress.ip_network(block).hosts()]
+        hosts = [h for h in hosts if h not in known and h not in candidates]
+        if len(candidates) + len(hosts) > limit:
+            break
+        blocks.append(key)
+        planned.add(key)
+        for h in hosts:
+            candidates[h] = group
+    return candidates, blocks
+
+
+async def signature(ip_port, timeout=SIGNATURE_TIMEOUT):
+    """请求状态页，响应里带 udpxy 等特征返回 True"""
+    host, port = ip_port.rsplit(":", 1)
+    writer = None
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout)
+        writer.write(f"GET {SIGNATURE_PATH} HTTP/1.0\r\nHost: {ip_port}\r\n"
+                     f"User-Agent: {stream_probe.USER_AGENT}\r\n\r\n".encode("latin-1"))
+        await writer.drain()
+        data = b""
+        deadline = time.monotonic() + timeout
+        while len(data) < SIGNATURE_BYTES:
+            chunk = await asyncio.wait_for(reader.read(SIGNATURE_BYTES - len(data)),
+                                           max(deadline - time.monotonic(), 0.01))
+            if not chunk:
+                break
+            data += chunk
+            if any(sig in data.lower() for sig in SIGNATURES):
+                return True
+        return any(sig in data.lower() for sig in SIGNATURES)
+    except (asyncio.TimeoutError, OSError, ValueError):
+        return False
+    finally:
+        if writer:
+            writer.close()
+
+
+def check_signatures(targets, limit=SIGNATURE_CONCURRENCY):
+    """并发检查特征，返回命中的 set"""
+    async def _all():
+        stream_probe.raise_nofile_limit()
+        done = await probe_scheduler.run_async(signature, targets, failed=lambda r: not r, limit=limit)
+        return {ip_port for ip_port, ok in done if ok}
+    return asyncio.run(_all()) if targets else set()
+
+
+def run(prefix=DISCOVER_PREFIX, resweep_after=RESWEEP_AFTER, ip_dir=IP_DIR):
+    """从已验证服务器出发扫邻段，新发现的登记进注册表并导出 ip/*.txt；返回新地址数"""
+    seeds = server_registry.verified()
+    known = set(server_registry.group_of())
+    skip = server_registry.swept_since(time.time() - resweep_after) if resweep_after else set()
+    candidates, blocks = plan_candidates(seeds, known, skip, prefix)
+    print(f"🛰️ 邻段发现：已验证服务器 {len(seeds)} 个，本轮扫描 {len(blocks)} 个 /{prefix} 网段"
+          f"（跳过近期扫过的 {len(skip)} 个），候选地址 {len(candidates)} 个")
+    metrics.set_value("seeds", len(seeds))
+    metrics.set_value("blocks", len(blocks))
+    metrics.set_value("candidates", len(candidates))
+    if not candidates:
+        return 0
+
+    # 候选地址绝大多数本来就不开放，漏掉的下次重扫再找，不做失败重连
+    rtts = tcp_scan.scan(candidates, CONNECT_TIMEOUT, retry_timeout=0)
+    open_ports = [ip_port for ip_port, rtt in rtts.items() if rtt is not None]
+    print(f"🔌 端口开放 {len(open_ports)} 个，检查 udpxy 特征...")
+    hits = check_signatures(open_ports)
+    print(f"🎯 确认 {len(hits)} 个新的组播转发服务")
+    metrics.set_value("open", len(open_ports))
+    metrics.set_value("hits", len(hits))
+
+    per_block = {}
+    for ip_port in hits:
+        ip, port = ip_port.rsplit(":", 1)
+        key = (block_of(ip, prefix), int(port))
+        per_block[key] = per_block.get(key, 0) + 1
+    entries = [(ip_port, *candidates[ip_port]) for ip_port in sorted(hits)]
+    try:
+        server_registry.upsert(entries)
+        server_registry.mark_swept([(block, port, per_block.get((block, port), 0)) for block, port in blocks])
+        if entries:
+            for name, n in sorted(server_registry.export_views(ip_dir).items()):
+                print(f"📥 {os.path.join(ip_dir, name + '.txt')}：共 {n} 个地址")
+    except Exception as e:
+        print(f"❌ 更新服务器注册表失败：{e}")
+    return len(entries)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="已验证服务器的邻段发现（TCP 扫描 + udpxy 特征确认）")
+    parser.add_argument("--prefix", type=int, default=DISCOVER_PREFIX, choices=range(16, 31), metavar="16-30",
+                        help="扫描网段大小，默认 /24")
+    parser.add_argument("--all", action="store_true", help="忽略扫描记录，近期扫过的网段也重扫")
+    args = parser.parse_args()
+    with metrics.stage("discover"):
+        run(args.prefix, 0 if args.all else RESWEEP_AFTER)
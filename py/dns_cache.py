@@ -0,0 +1,224 @@
+import asyncio
+import os
+import random
+import socket
+import sqlite3
+import struct
+import threading
+import time
+
+import metrics
+
+# ===============================
+# 配置区
+# 异步 DNS 解析 + 本地缓存：直接向递归 DNS 发 A 记录查询，按应答里的 TTL 缓存成功结果，
+# NXDOMAIN / 无 A 记录按 SOA 的否定 TTL 缓存；超时、SERVFAIL 不缓存，下次再查
+DNS_CACHE_DB = os.environ.get("DNS_CACHE_DB", "py/dns_cache.db")
+DNS_SERVER = os.environ.get("DNS_SERVER", "")   # 形如 127.0.0.1:5353；留空读取 /etc/resolv.conf
+RESOLV_CONF = "/etc/resolv.conf"
+DNS_TIMEOUT = 2.0             # 单次查询时限（秒）
+DNS_TRIES = 2                 # 超时重发次数
+DNS_MIN_TTL = 60              # 成功结果至少缓存多久（秒），防止 TTL 为 0 的域名每次都查
+DNS_MAX_TTL = 24 * 3600       # 成功结果最多缓存多久
+DNS_NEGATIVE_TTL = 600        # 应答没带 SOA 时否定结果缓存多久
+DNS_NEGATIVE_MAX_TTL = 3600   # 否定结果最多缓存多久（域名可能很快恢复）
+# ===============================
+
+_QTYPE_A = 1
+_QTYPE_SOA = 6
+_RCODE_NXDOMAIN = 3
+
+_lock = threading.Lock()
+_conn = None
+stats = {"lookups": 0, "cache_hits": 0, "negative_hits": 0, "failures": 0}
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(DNS_CACHE_DB) or ".", exist_ok=True)
+        _conn = sqlite3.connect(DNS_CACHE_DB, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS dns ("
+            "host TEXT PRIMARY KEY, ips TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        _conn.commit()
+    return _conn
+
+
+def get(host):
+    """只查本地缓存：未过期的成功结果返回 [ip]，否定结果返回 []，没有或已过期返回 None"""
+    with _lock:
+        row = _db().execute("SELECT ips, expires_at FROM dns WHERE host = ?", (host.lower(),)).fetchone()
+    if not row or row[1] <= time.time():
+        return None
+    return row[0].split(",") if row[0] else []
+
+
+def put(host, ips, ttl):
+    with _lock:
+        _db().execute("INSERT OR REPLACE INTO dns (host, ips, expires_at) VALUES (?, ?, ?)",
+                      (host.lower(), ",".join(ips), time.time() + ttl))
+        _db().commit()
+
+
+def nameserver():
+    """(地址, 端口)：DNS_SERVER 优先，其次 /etc/resolv.conf 的第一个 nameserver；都没有返回 None"""
+    if DNS_SERVER:
+        host, _, port = DNS_SERVER.rpartition(":") if ":" in DNS_SERVER else (DNS_SERVER, "", "53")
+        return host, int(port or 53)
+    try:
+        with open(RESOLV_CONF, encoding="utf-8") as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0] == "nameserver" and ":" not in parts[1]:
+                    return parts[1], 53
+    except OSError:
+        pass
+    return None
+
+
+def build_query(host, qid, qtype=_QTYPE_A):
+    """DNS 查询报文：标准查询、期望递归"""
+    qname = b"".join(bytes([len(label)]) + label for label in host.rstrip(".").encode("idna").split(b"."))
+    return struct.pack(">HHHHHH", qid, 0x0100, 1, 0, 0, 0) + qname + b"\x00" + struct.pack(">HH", qtype, 1)
+
+
+def _skip_name(data, off):
+    while True:
+        n = data[off]
+        if n == 0:
+            return off + 1
+        if n & 0xC0 == 0xC0:
+            return off + 2
+        off += n + 1
+
+
+def parse_response(data, qid):
+    """解析应答 -> (rcode, [(ip, ttl)], 否定 TTL 或 None, 是否被截断)；报文 ID 不符或格式错误抛 ValueError"""
+    if len(data) < 12:
+        raise ValueError("short dns response")
+    rid, flags, qdcount, ancount, nscount, _ = struct.unpack(">HHHHHH", data[:12])
+    if rid != qid or not flags & 0x8000:
+        raise ValueError("unexpected dns response")
+    try:
+        off = 12
+        for _ in range(qdcount):
+            off = _skip_name(data, off) + 4
+        answers, negative_ttl = [], None
+        for i in range(ancount + nscount):
+            off = _skip_name(data, off)
+            rtype, _, ttl, rdlength = struct.unpack(">HHIH", data[off:off + 10])
+            off += 10
+            rdata = data[off:off + rdlength]
+            off += rdlength
+            if i < ancount and rtype == _QTYPE_A and rdlength == 4:
+                answers.append((socket.inet_ntoa(rdata), ttl))
+            elif i >= ancount and rtype == _QTYPE_SOA:
+                # RFC 2308：否定缓存时长取 SOA 记录 TTL 与 SOA.MINIMUM 的较小值
+                minimum = struct.unpack(">I", data[off - 4:off])[0]
+                negative_ttl = min(ttl, minimum)
+    except (IndexError, struct.error) as e:
+        raise ValueError(f"malformed dns response: {e}")
+    return flags & 0x000F, answers, negative_ttl, bool(flags & 0x0200)
+
+
+class _Query(asyncio.DatagramProtocol):
+    def __init__(self, qid):
+        self.qid = qid
+        self.future = asyncio.get_running_loop().create_future()
+
+    def datagram_received(self, data, addr):
+        if self.future.done():
+            return
+        try:
+            self.future.set_result(parse_response(data, self.qid))
+        except ValueError:
+            pass   # 不是本次查询的应答，继续等
+
+    def error_received(self, exc):
+        if not self.future.done():
+            self.future.set_exception(exc)
+
+
+async def query(host, server, timeout=DNS_TIMEOUT, tries=DNS_TRIES):
+    """向 server 查询 host 的 A 记录，返回 parse_response 的结果；全部超时抛 asyncio.TimeoutError"""
+    loop = asyncio.get_running_loop()
+    qid = random.getrandbits(16)
+    transport, proto = await loop.create_datagram_endpoint(lambda: _Query(qid), remote_addr=server)
+    try:
+        packet = build_query(host, qid)
+        for attempt in range(tries):
+            transport.sendto(packet)
+            try:
+                return await asyncio.wait_for(asyncio.shield(proto.future), timeout)
+            except asyncio.TimeoutError:
+                if attempt == tries - 1:
+                    raise
+    finally:
+        transport.close()
+
+
+class Resolver:
+    """带缓存的异步解析器：resolve(host) -> [ip]（失败为空列表）；同一域名并发解析只查一次"""
+
+    def __init__(self, server=None):
+        self.server = server or nameserver()
+        self._inflight = {}
+
+    async def resolve(self, host):
+        host = host.lower().rstrip(".")
+        cached = get(host)
+        if cached is not None:
+            stats["cache_hits"] += 1
+            metrics.inc("dns_cache_hits")
+            if not cached:
+                stats["negative_hits"] += 1
+                metrics.inc("dns_negative_hits")
+            return cached
+        task = self._inflight.get(host)
+        if task is None:
+            task = self._inflight[host] = asyncio.ensure_future(self._lookup(host))
+            task.add_done_callback(lambda _: self._inflight.pop(host, None))
+        return await asyncio.shield(task)
+
+    async def _lookup(self, host):
+        stats["lookups"] += 1
+        metrics.inc("dns_lookups")
+        if self.server is None:
+            return await self._fallback(host)
+        try:
+            rcode, answers, negative_ttl, truncated = await query(host, self.server)
+        except (asyncio.TimeoutError, OSError) as e:
+            stats["failures"] += 1
+            metrics.inc("dns_failures")
+            print(f"⚠️ DNS 查询失败（不缓存）：{host}：{str(e) or type(e).__name__}")
+            return []
+        if truncated and not answers:
+            return await self._fallback(host)
+        if answers:
+            ips = list(dict.fromkeys(ip for ip, _ in answers))
+            ttl = min(max(min(t for _, t in answers), DNS_MIN_TTL), DNS_MAX_TTL)
+            put(host, ips, ttl)
+            return ips
+        if rcode in (0, _RCODE_NXDOMAIN):
+            # NXDOMAIN 或域名存在但没有 A 记录：否定缓存
+            ttl = DNS_NEGATIVE_TTL if negative_ttl is None else negative_ttl
+            put(host, [], min(max(ttl, DNS_MIN_TTL), DNS_NEGATIVE_MAX_TTL))
+        else:
+            stats["failures"] += 1
+            metrics.inc("dns_failures")
+        return []
+
+    async def _fallback(self, host):
+        """没有可用的 nameserver 或应答被截断时走系统解析（拿不到 TTL，按 DNS_MIN_TTL 缓存）"""
+        loop = asyncio.get_running_loop()
+        try:
+            infos = await loop.getaddrinfo(host, None, family=socket.AF_INET, type=socket.SOCK_STREAM)
+        except (socket.gaierror, OSError):
+            stats["failures"] += 1
+            metrics.inc("dns_failures")
+            return []
+        ips = list(dict.fromkeys(info[4][0] for info in infos))
+        put(host, ips, DNS_MIN_TTL)
+        return ips
@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import json
+import socket
+import struct
+import threading
+
+# ===============================
+# 配置区
+# 本地 DNS 替身：用法 python py/fake_dns.py --port 5353 --data hosts.json
+# 再以 DNS_SERVER=127.0.0.1:5353 运行 AmJiB.py（配合 fake_geo.py 可离线跑完整的第一阶段）
+DEFAULT_PORT = 5353
+DEFAULT_TTL = 300
+SOA_TTL = 600                 # 否定应答里 SOA 记录的 TTL
+SOA_MINIMUM = 120             # SOA.MINIMUM：NXDOMAIN 应缓存 min(SOA_TTL, SOA_MINIMUM) 秒
+# ===============================
+#
+# 数据格式：{"域名": {"ips": ["1.2.3.4"], "ttl": 300}}，也可简写为 {"域名": "1.2.3.4"}；
+# "ips" 为空列表时返回 NOERROR 无记录，{"rcode": 2} 模拟 SERVFAIL，其余域名一律 NXDOMAIN
+
+
+def _parse_question(data):
+    """-> (qid, flags, 域名, qtype, 问题段结束位置)"""
+    qid, flags = struct.unpack(">HH", data[:4])
+    labels, off = [], 12
+    while data[off]:
+        n = data[off]
+        labels.append(data[off + 1:off + 1 + n].decode("ascii", "replace"))
+        off += n + 1
+    qtype, _ = struct.unpack(">HH", data[off + 1:off + 5])
+    return qid, flags, ".".join(labels).lower(), qtype, off + 5
+
+
+def _soa_rdata():
+    mname = b"\x02ns\x04fake\x00"
+    rname = b"\x05admin\x04fake\x00"
+    return mname + rname + struct.pack(">IIIII", 1, 3600, 600, 86400, SOA_MINIMUM)
+
+
+def build_reply(data, records):
+    """按 records 生成应答报文"""
+    qid, flags, name, qtype, end = _parse_question(data)
+    rec = records.get(name)
+    if isinstance(rec, str):
+        rec = {"ips": [rec]}
+    answers, authority = [], []
+    if rec is None:
+        rcode = 3
+        authority.append(b"\xc0\x0c" + struct.pack(">HHIH", 6, 1, SOA_TTL, len(_soa_rdata())) + _soa_rdata())
+    else:
+        rcode = rec.get("rcode", 0)
+        if rcode == 0 and qtype == 1:
+            for ip in rec.get("ips", []):
+                answers.append(b"\xc0\x0c" + struct.pack(">HHIH", 1, 1, rec.get("ttl", DEFAULT_TTL), 4)
+                               + socket.inet_aton(ip))
+        if rcode == 0 and not answers:
+            authority.append(b"\xc0\x0c" + struct.pack(">HHIH", 6, 1, SOA_TTL, len(_soa_rdata())) + _soa_rdata())
+    header = struct.pack(">HHHHHH", qid, 0x8180 | (flags & 0x0100) | rcode, 1, len(answers), len(authority), 0)
+    return header + data[12:end] + b"".join(answers) + b"".join(authority)
+
+
+class FakeDNS(asyncio.DatagramProtocol):
+    def __init__(self, records):
+        self.records = records
+        self.queries = {}     # 域名 -> 收到的查询次数（测试缓存是否生效）
+        self.transport = None
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        try:
+            name = _parse_question(data)[2]
+            reply = build_reply(data, self.records)
+        except (IndexError, struct.error, ValueError, OSError):
+            return
+        self.queries[name] = self.queries.get(name, 0) + 1
+        self.transport.sendto(reply, addr)
+
+
+def start(records, port=0):
+    """后台线程启动替身服务，返回 (协议对象（含 queries 统计）, "127.0.0.1:端口")"""
+    loop = asyncio.new_event_loop()
+    transport, proto = loop.run_until_complete(
+        loop.create_datagram_endpoint(lambda: FakeDNS(records), local_addr=("127.0.0.1", port)))
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return proto, f"127.0.0.1:{transport.get_extra_info('sockname')[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 DNS 替身服务（只答 A 记录）")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--data", help="JSON 文件：{域名: {ips, ttl}}")
+    args = parser.parse_args()
+    records = {}
+    if args.data:
+        with open(args.data, encoding="utf-8") as f:
+            records = {k.lower(): v for k, v in json.load(f).items()}
+    proto, addr = start(records, args.port)
+    print(f"🌐 DNS 替身已启动：{addr}（{len(records)} 个域名）")
+    threading.Event().wait()
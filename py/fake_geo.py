@@ -0,0 +1,118 @@
+import argparse
+import json
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import isp_index
+
+# ===============================
+# 配置区
+# 本地 ip-api 替身：用法 python py/fake_geo.py --port 8399
+# 再以 IP_API_BASE=http://127.0.0.1:8399 运行 speed_filter.py / AmJiB.py
+DEFAULT_PORT = 8399
+REGIONS = ["Shanghai", "Jiangsu", "Zhejiang", "Guangdong", "Sichuan", "Hubei", "Henan", "Beijing", "Tianjin", "Liaoning"]
+ISP_NAMES = {"电信": "Chinanet", "联通": "China Unicom", "移动": "China Mobile"}
+# ===============================
+
+
+def fake_record(query, overrides=None):
+    """按 IP 生成确定性的归属地（可用 overrides 指定个别 IP）"""
+    if overrides and query in overrides:
+        return dict(overrides[query], query=query)
+    isp = isp_index.lookup(query)
+    if isp == "未知":
+        return {"status": "fail", "message": "private range", "query": query}
+    region = REGIONS[zlib.crc32(query.encode()) % len(REGIONS)]
+    return {"status": "success", "regionName": region, "isp": ISP_NAMES[isp], "query": query}
+
+
+class FakeGeoServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, addr, overrides=None, batch_limit=15, single_limit=45):
+        super().__init__(addr, FakeGeoHandler)
+        self.overrides = overrides or {}
+        self.limits = {"batch": batch_limit, "json": single_limit}
+        self.windows = {"batch": [0, time.time()], "json": [0, time.time()]}
+        self.counts = {"batch": 0, "json": 0, "rejected": 0}
+        self.lock = threading.Lock()
+
+    def take(self, kind):
+        """按 60 秒窗口计数，返回 (是否放行, 剩余额度, 窗口剩余秒数)"""
+        with self.lock:
+            used, start = self.windows[kind]
+            now = time.time()
+            if now - start >= 60:
+                used, start = 0, now
+            ttl = int(60 - (now - start))
+            if used >= self.limits[kind]:
+                self.counts["rejected"] += 1
+                self.windows[kind] = [used, start]
+                return False, 0, ttl
+            used += 1
+            self.windows[kind] = [used, start]
+            self.counts[kind] += 1
+            return True, self.limits[kind] - used, ttl
+
+
+class FakeGeoHandler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, code, body, remaining, ttl):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.send_header("X-Rl", str(remaining))
+        self.send_header("X-Ttl", str(ttl))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if not path.startswith("/json/"):
+            self._reply(404, {"status": "fail", "message": "not found"}, 0, 0)
+            return
+        ok, remaining, ttl = self.server.take("json")
+        if not ok:
+            self._reply(429, {"status": "fail", "message": "rate limited"}, 0, ttl)
+            return
+        self._reply(200, fake_record(path[len("/json/"):], self.server.overrides), remaining, ttl)
+
+    def do_POST(self):
+        if urlsplit(self.path).path != "/batch":
+            self._reply(404, {"status": "fail", "message": "not found"}, 0, 0)
+            return
+        ok, remaining, ttl = self.server.take("batch")
+        if not ok:
+            self._reply(429, {"status": "fail", "message": "rate limited"}, 0, ttl)
+            return
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"[]")
+        queries = [q["query"] if isinstance(q, dict) else q for q in body[:100]]
+        self._reply(200, [fake_record(q, self.server.overrides) for q in queries], remaining, ttl)
+
+
+def start(port=0, overrides=None, **limits):
+    """后台线程启动替身服务，返回 (server, base_url)"""
+    server = FakeGeoServer(("127.0.0.1", port), overrides, **limits)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="本地 ip-api 替身服务")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--data", help="JSON 文件：{ip: {status, regionName, isp}} 覆盖默认结果")
+    parser.add_argument("--batch-limit", type=int, default=15)
+    args = parser.parse_args()
+    overrides = None
+    if args.data:
+        with open(args.data, encoding="utf-8") as f:
+            overrides = json.load(f)
+    server = FakeGeoServer(("127.0.0.1", args.port), overrides, batch_limit=args.batch_limit)
+    print(f"🌐 ip-api 替身已启动：http://127.0.0.1:{args.port}")
+    server.serve_forever()
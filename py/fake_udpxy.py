@@ -0,0 +1,435 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+import stream_probe
+
+# ===============================
+# 配置区
+# 本地 udpxy 替身集群：用法 python py/fake_udpxy.py serve --count 1000 --manifest farm.json
+# 端到端压测：python py/fake_udpxy.py e2e --count 300（third_stage 与 speed_filter 都跑一遍并统计准确率）
+FARM_NET = 127 * 256 + 77       # 服务器地址 127.77.x.y 起（Linux 下整个 127/8 都落在回环上）
+SERVERS_PER_SUBNET = 4          # 每个 /24 放几台（真实数据里同一网段常有多台 udpxy）
+UDPXY_PORT = 4022
+BASE_PORT = 20000               # --ports 模式：全部监听在 127.0.0.1，从此端口起递增（macOS 等不支持 127.x 别名时用）
+BITRATES = (6_000_000, 8_000_000, 10_000_000)   # 合成 TS 码率（bit/s），按服务器轮流分配
+LOOP_SECONDS = 4.0              # 预生成多少秒的 TS 循环发送（大于测速保留的开头部分，PCR 不会在校验范围内回绕）
+BURST_SECONDS = 0.5             # 新连接先突发发送多少秒的内容（udpxy 缓冲区）
+TICK = 0.1                      # 按码率节流的发送粒度（秒）
+MAX_CLIENTS = 3                 # 单台服务器同时服务的客户端数，超过返回 503（udpxy -c 默认值）
+TTFB_DELAY = 3.0                # slow_ttfb：响应头延迟（小于各探测的超时）
+STALL_AFTER = 1.0               # stall：发送多少秒后停住但不断开
+SLOW_RATE_FACTOR = 0.5          # slow_rate：实际发送速率相对码率的比例
+# 各故障占比；expected 为 (third_stage 应判可播放, speed_filter 应判合格)
+FAULTS = {
+    "ok":            (0.55, (True, True)),
+    "refused":       (0.10, (False, False)),   # 端口不监听，连接被拒绝
+    "slow_ttfb":     (0.05, (True, True)),
+    "stall":         (0.08, (True, False)),    # 开头正常、随后断流：只读开头的探测发现不了
+    "html":          (0.06, (False, False)),   # 200 + HTML 错误页
+    "wrong_content": (0.06, (False, False)),   # 200 + 非 TS 数据
+    "busy":          (0.05, (False, False)),   # 客户端数已满，一律 503
+    "slow_rate":     (0.05, (True, False)),    # 上行不足，速率跟不上码率
+}
+E2E_REGIONS = ("北京市电信", "广东移动", "湖北联通", "四川电信")
+E2E_CHANNELS = ("CCTV1", "CCTV2", "CCTV5", "湖南卫视", "浙江卫视", "东方卫视")
+# ===============================
+
+_ts_cache = {}
+
+
+def _crc32_mpeg(data):
+    crc = 0xFFFFFFFF
+    for b in data:
+        crc ^= b << 24
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x04C11DB7) if crc & 0x80000000 else crc << 1
+            crc &= 0xFFFFFFFF
+    return crc
+
+
+def _psi_packet(pid, section, cc):
+    section += _crc32_mpeg(section).to_bytes(4, "big")
+    pkt = bytes([0x47, 0x40 | (pid >> 8), pid & 0xFF, 0x10 | cc, 0]) + section
+    return pkt + b"\xff" * (188 - len(pkt))
+
+
+def _media_packet(pid, cc, pcr=None):
+    if pcr is None:
+        return bytes([0x47, pid >> 8, pid & 0xFF, 0x10 | cc]) + b"\x00" * 184
+    base, ext = divmod(pcr, 300)
+    af = bytes([7, 0x10, (base >> 25) & 0xFF, (base >> 17) & 0xFF, (base >> 9) & 0xFF, (base >> 1) & 0xFF,
+                ((base & 1) << 7) | 0x7E | (ext >> 8), ext & 0xFF])
+    return bytes([0x47, pid >> 8, pid & 0xFF, 0x30 | cc]) + af + b"\x00" * (184 - len(af))
+
+
+def synthetic_ts(bitrate, seconds=LOOP_SECONDS):
+    """生成可循环发送的 TS：PAT/PMT + H.264 视频(PID 0x101, 带 PCR) + AAC 音频(PID 0x102)，
+    各 PID 的包数都是 16 的倍数，循环衔接处连续计数不出错"""
+    key = (bitrate, seconds)
+    if key in _ts_cache:
+        return _ts_cache[key]
+    pat = bytes([0, 0xB0, 13, 0, 1, 0xC1, 0, 0, 0, 1, 0xE1, 0x00])
+    es = bytes([0x1B, 0xE1, 0x01, 0xF0, 0, 0x0F, 0xE1, 0x02, 0xF0, 0])
+    pmt = bytes([2, 0xB0, 13 + len(es), 0, 1, 0xC1, 0, 0, 0xE1, 0x01, 0xF0, 0]) + es
+    rounds = int(bitrate * seconds / 8 / 188 / 2)
+    rounds = max(1600, (rounds + 1599) // 1600 * 1600)
+    out, cc = [], {}
+
+    def next_cc(pid):
+        cc[pid] = (cc.get(pid, -1) + 1) & 0x0F
+        return cc[pid]
+
+    for i in range(rounds):
+        if i % 100 == 0:
+            out.append(_psi_packet(0, pat, next_cc(0)))
+            out.append(_psi_packet(0x100, pmt, next_cc(0x100)))
+        pcr = int(len(out) * 188 * 8 / bitrate * 27_000_000) if i % 20 == 0 else None
+        out.append(_media_packet(0x101, next_cc(0x101), pcr))
+        out.append(_media_packet(0x102, next_cc(0x102)))
+    data = _ts_cache[key] = b"".join(out)
+    return data
+
+
+def farm_address(i, ports=False):
+    if ports:
+        return "127.0.0.1", BASE_PORT + i
+    subnet, host = divmod(i, SERVERS_PER_SUBNET)
+    net = FARM_NET * 256 + subnet
+    return f"{net >> 16}.{(net >> 8) & 0xFF}.{net & 0xFF}.{host + 1}", UDPXY_PORT
+
+
+def plan_farm(count, seed=0, faults=None, ports=False):
+    """确定性地给每台服务器分配地址、故障类型、码率和地区，返回 {ip_port: spec}"""
+    rng = random.Random(seed)
+    faults = faults or FAULTS
+    names = list(faults)
+    weights = [faults[n][0] for n in names]
+    plan = {}
+    for i in range(count):
+        host, port = farm_address(i, ports)
+        fault = rng.choices(names, weights)[0]
+        plan[f"{host}:{port}"] = {
+            "host": host, "port": port, "fault": fault,
+            "bitrate": BITRATES[i % len(BITRATES)], "region": E2E_REGIONS[i % len(E2E_REGIONS)],
+            "expected": list(faults[fault][1]),
+        }
+    return plan
+
+
+class FakeUdpxy:
+    """单台替身：按 spec["fault"] 决定响应方式"""
+
+    def __init__(self, spec, stats):
+        self.spec = spec
+        self.stats = stats
+        self.clients = 0
+
+    async def _reply(self, writer, status, content_type, body):
+        writer.write((f"HTTP/1.1 {status}\r\nServer: udpxy 1.0-23.12\r\nContent-Type: {content_type}\r\n"
+                      f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+    async def handle(self, reader, writer):
+        self.stats["requests"] += 1
+        fault = self.spec["fault"]
+        streaming = False
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 10)
+            path = request.split(b" ", 2)[1].decode("latin-1")
+            if not path.startswith(("/rtp/", "/udp/")):
+                self.stats["status"]["404"] += 1
+                await self._reply(writer, "404 Not Found", "text/html", b"<html><body>Not found</body></html>")
+                return
+            if fault == "html":
+                self.stats["status"]["html"] += 1
+                await self._reply(writer, "200 OK", "text/html",
+                                  b"<html><head><title>udpxy status</title></head><body>Error: no multicast</body></html>")
+                return
+            if fault == "busy" or self.clients >= MAX_CLIENTS:
+                self.stats["status"]["503"] += 1
+                await self._reply(writer, "503 Service Unavailable", "text/html", b"<html><body>Too many clients</body></html>")
+                return
+            if fault == "slow_ttfb":
+                await asyncio.sleep(TTFB_DELAY)
+            self.clients += 1
+            streaming = True
+            self.stats["status"]["200"] += 1
+            self.stats["active"] += 1
+            self.stats["peak_active"] = max(self.stats["peak_active"], self.stats["active"])
+            writer.write(b"HTTP/1.1 200 OK\r\nServer: udpxy 1.0-23.12\r\nContent-Type: application/octet-stream\r\n\r\n")
+            await self._stream(reader, writer)
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, asyncio.LimitOverrunError,
+                ConnectionError, IndexError):
+            pass
+        finally:
+            if streaming:
+                self.clients -= 1
+                self.stats["active"] -= 1
+            writer.close()
+
+    async def _stream(self, reader, writer):
+        fault = self.spec["fault"]
+        rate = self.spec["bitrate"] / 8 * (SLOW_RATE_FACTOR if fault == "slow_rate" else 1.0)
+        data = synthetic_ts(self.spec["bitrate"])
+        if fault == "wrong_content":
+            data = random.Random(self.spec["port"]).randbytes(len(data) // 4)
+        burst = int(rate * BURST_SECONDS)
+        chunk = max(int(rate * TICK) // 188 * 188, 188)
+        pos = sent = 0
+        t0 = time.monotonic()
+        while True:
+            n = burst if sent == 0 else chunk
+            piece = data[pos:pos + n]
+            if len(piece) < n:
+                piece += data[:n - len(piece)]
+            pos = (pos + n) % len(data)
+            writer.write(piece)
+            await writer.drain()
+            sent += n
+            self.stats["bytes"] += n
+            elapsed = time.monotonic() - t0
+            if fault == "stall" and elapsed >= STALL_AFTER:
+                await reader.read()   # 不再发送也不断开，直到客户端自己关闭
+                return
+            wait = (sent - burst) / rate - elapsed
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+
+class Farm:
+    """一组替身服务器（同一个事件循环内）"""
+
+    def __init__(self, plan):
+        self.plan = plan
+        self.servers = []
+        self.stats = {"requests": 0, "bytes": 0, "active": 0, "peak_active": 0,
+                      "status": {"200": 0, "404": 0, "503": 0, "html": 0}}
+
+    async def start(self):
+        stream_probe.raise_nofile_limit()
+        for spec in self.plan.values():
+            if spec["fault"] == "refused":
+                continue
+            udpxy = FakeUdpxy(spec, self.stats)
+            self.servers.append(await asyncio.start_server(udpxy.handle, spec["host"], spec["port"], backlog=64))
+        return self
+
+    def close(self):
+        for server in self.servers:
+            server.close()
+
+
+async def serve(plan, manifest=None, stats_path=None):
+    farm = await Farm(plan).start()
+    if manifest:
+        tmp = manifest + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(plan, f, ensure_ascii=False)
+        os.replace(tmp, manifest)   # 清单出现即表示全部端口已就绪
+    print(f"📡 udpxy 替身已启动：{len(farm.servers)} 台监听，{len(plan) - len(farm.servers)} 台模拟拒绝连接", flush=True)
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            pass
+    try:
+        await stop.wait()
+    finally:
+        farm.close()
+        if stats_path:
+            with open(stats_path, "w", encoding="utf-8") as f:
+                json.dump(farm.stats, f)
+
+
+# ===============================
+# 端到端：替身集群跑在独立进程里，流水线在另一个子进程里按真实代码运行
+def build_tree(root, plan):
+    """按清单生成 ip/ rtp/ 目录（每个地区一个文件对），返回根目录"""
+    for d in ("ip", "rtp", "py", "test"):
+        os.makedirs(os.path.join(root, d), exist_ok=True)
+    by_region = {}
+    for ip_port, spec in plan.items():
+        by_region.setdefault(spec["region"], []).append(ip_port)
+    for r, (region, ip_ports) in enumerate(by_region.items()):
+        with open(os.path.join(root, "ip", region + ".txt"), "w", encoding="utf-8") as f:
+            f.write("".join(ip + "\n" for ip in ip_ports))
+        with open(os.path.join(root, "rtp", region + ".txt"), "w", encoding="utf-8") as f:
+            f.write("".join(f"{name},rtp://239.{r}.1.{i + 1}:5140\n" for i, name in enumerate(E2E_CHANNELS)))
+    open(os.path.join(root, "py", "blacklist.txt"), "w").close()
+    return root
+
+
+def write_speed_input(path, plan):
+    """speed_filter 的输入：全部服务器（不只 third_stage 判活的），才能统计它自己的准确率"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("央视频道,#genre#\n")
+        for ip_port, spec in plan.items():
+            for i, name in enumerate(E2E_CHANNELS[:3]):
+                f.write(f"{name},http://{ip_port}/rtp/239.0.1.{i + 1}:5140${spec['region']}\n")
+
+
+def _servers_in(path):
+    if not os.path.exists(path):
+        return []
+    import playlist
+    return list(playlist.load_txt(path).servers)
+
+
+def run_pipeline(name, tree, speed_seconds):
+    """子进程入口：在 tree 目录里运行真实流水线，输出一行 JSON {seconds, passed}"""
+    import contextlib
+    import functools
+    import io
+    import metrics
+    os.chdir(tree)
+    log = io.StringIO()
+    with contextlib.redirect_stdout(log), metrics.stage(name):
+        if name == "third_stage":
+            import AmJiB
+            import server_registry
+            server_registry.merge_from_dir(AmJiB.IP_DIR)
+            AmJiB.second_stage()
+            t0 = time.perf_counter()
+            AmJiB.third_stage()
+            seconds = time.perf_counter() - t0
+            passed = _servers_in(AmJiB.LIVE_BACKUP_FILE)
+        else:
+            import speed_filter
+            import throughput
+            if speed_seconds:
+                speed_filter.SUSTAIN_SECONDS = speed_seconds
+                throughput.measure = functools.partial(throughput.measure, duration=speed_seconds + 1)
+            t0 = time.perf_counter()
+            speed_filter.main()
+            seconds = time.perf_counter() - t0
+            passed = _servers_in(speed_filter.OUTPUT_FILE)
+    rec = metrics.load()[-1]
+    print(json.dumps({"seconds": seconds, "passed": passed, "log_tail": log.getvalue().splitlines()[-5:],
+                      "metrics": {"counters": rec["counters"], "histograms": rec["histograms"]}},
+                     ensure_ascii=False))
+
+
+def score(plan, passed, column):
+    """按清单里的期望结论统计混淆矩阵与各故障类型的通过率"""
+    passed = set(passed)
+    matrix = {"tp": 0, "fp": 0, "fn": 0, "tn": 0}
+    by_fault = {}
+    for ip_port, spec in plan.items():
+        expected, got = spec["expected"][column], ip_port in passed
+        matrix[("t" if expected == got else "f") + ("p" if got else "n")] += 1
+        entry = by_fault.setdefault(spec["fault"], {"servers": 0, "passed": 0, "expected": expected})
+        entry["servers"] += 1
+        entry["passed"] += got
+    total = len(plan)
+    matrix["accuracy"] = round((matrix["tp"] + matrix["tn"]) / total, 4) if total else None
+    return matrix, by_fault
+
+
+def e2e(count, seed, pipelines, speed_seconds, ports=False, keep=False):
+    import fake_geo
+    plan = plan_farm(count, seed, ports=ports)
+    work = tempfile.mkdtemp(prefix="fake_udpxy_")
+    manifest, stats_path = os.path.join(work, "farm.json"), os.path.join(work, "farm_stats.json")
+    farm = subprocess.Popen([sys.executable, os.path.abspath(__file__), "serve", "--count", str(count),
+                             "--seed", str(seed), "--manifest", manifest, "--stats", stats_path]
+                            + (["--ports"] if ports else []))
+    geo, geo_url = fake_geo.start()
+    report = {"servers": count, "seed": seed, "faults": {}, "pipelines": {}}
+    for spec in plan.values():
+        report["faults"][spec["fault"]] = report["faults"].get(spec["fault"], 0) + 1
+    try:
+        while not os.path.exists(manifest):
+            if farm.poll() is not None:
+                raise RuntimeError("替身集群启动失败")
+            time.sleep(0.1)
+        env = dict(os.environ, IP_API_BASE=geo_url, SCHEDULE_MODE="full",
+                   REGISTRY_DB=os.path.join(work, "servers.db"), THROUGHPUT_DB=os.path.join(work, "throughput.db"),
+                   GEO_CACHE_DB=os.path.join(work, "geo_cache.db"))
+        for column, name in enumerate(("third_stage", "speed_filter")):
+            if name not in pipelines:
+                continue
+            tree = build_tree(os.path.join(work, name), plan)
+            if name == "speed_filter":
+                write_speed_input(os.path.join(tree, "py", "live.txt"), plan)
+            print(f"🚀 {name}：{count} 台替身服务器...", file=sys.stderr)
+            proc = subprocess.run([sys.executable, os.path.abspath(__file__), "_pipeline", name, tree, str(speed_seconds)],
+                                  capture_output=True, text=True, env=env)
+            try:
+                res = json.loads(proc.stdout.strip().splitlines()[-1])
+            except (ValueError, IndexError):
+                report["pipelines"][name] = {"error": (proc.stderr.strip().splitlines() or ["无输出"])[-1]}
+                print(f"  ❌ {report['pipelines'][name]['error']}", file=sys.stderr)
+                continue
+            matrix, by_fault = score(plan, res["passed"], column)
+            report["pipelines"][name] = {
+                "seconds": round(res["seconds"], 3),
+                "servers_per_sec": round(count / res["seconds"], 1) if res["seconds"] else None,
+                "passed": len(res["passed"]), **matrix, "by_fault": by_fault, "metrics": res["metrics"],
+            }
+            print(f"  ⏱️  {res['seconds']:.2f}s  {count / max(res['seconds'], 1e-9):.1f} 台/秒  "
+                  f"准确率 {matrix['accuracy']:.1%}（误判可用 {matrix['fp']}，漏判 {matrix['fn']}）", file=sys.stderr)
+            for fault, entry in by_fault.items():
+                icon = "✅" if entry["passed"] == (entry["servers"] if entry["expected"] else 0) else "⚠️ "
+                print(f"     {icon} {fault:14} 通过 {entry['passed']}/{entry['servers']}"
+                      f"（应{'通过' if entry['expected'] else '拒绝'}）", file=sys.stderr)
+    finally:
+        farm.send_signal(signal.SIGTERM)
+        try:
+            farm.wait(10)
+        except subprocess.TimeoutExpired:
+            farm.kill()
+        geo.shutdown()
+        if os.path.exists(stats_path):
+            with open(stats_path, encoding="utf-8") as f:
+                report["farm"] = json.load(f)
+        if keep:
+            print(f"📁 数据保留在 {work}", file=sys.stderr)
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    return report
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "_pipeline":
+        run_pipeline(sys.argv[2], sys.argv[3], float(sys.argv[4]))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="本地 udpxy 替身集群（合成 TS + 故障注入）")
+    sub = parser.add_subparsers(dest="cmd")
+    p_serve = sub.add_parser("serve", help="启动替身集群，直到收到 SIGINT/SIGTERM")
+    p_e2e = sub.add_parser("e2e", help="启动集群并对 third_stage / speed_filter 做端到端压测")
+    for p in (p_serve, p_e2e):
+        p.add_argument("--count", type=int, default=300)
+        p.add_argument("--seed", type=int, default=0)
+        p.add_argument("--ports", action="store_true", help="全部监听在 127.0.0.1 的连续端口上")
+    p_serve.add_argument("--manifest", help="写出 {ip:port: 故障/码率/期望结论} 清单")
+    p_serve.add_argument("--stats", help="退出时写出请求统计")
+    p_e2e.add_argument("--pipelines", default="third_stage,speed_filter")
+    p_e2e.add_argument("--speed-seconds", type=float, default=0, help="缩短 speed_filter 的持续测速时长（0 为默认值）")
+    p_e2e.add_argument("--out", help="JSON 报告写入文件")
+    p_e2e.add_argument("--keep", action="store_true", help="保留临时目录")
+    args = parser.parse_args(sys.argv[1:] or ["serve"])
+
+    if args.cmd == "e2e":
+        result = e2e(args.count, args.seed, args.pipelines.split(","), args.speed_seconds, args.ports, args.keep)
+        text = json.dumps(result, ensure_ascii=False, indent=1)
+        if args.out:
+            with open(args.out, "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        else:
+            print(text)
+    else:
+        if args.cmd is None:
+            args = parser.parse_args(["serve"])
+        asyncio.run(serve(plan_farm(args.count, args.seed, ports=args.ports), args.manifest, args.stats))
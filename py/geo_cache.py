@@ -0,0 +1,181 @@
+import os
+import sqlite3
+import threading
+import time
+
+import requests
+
+import metrics
+
+# ===============================
+# 配置区
+GEO_CACHE_DB = os.environ.get("GEO_CACHE_DB", "py/geo_cache.db")
+GEO_CACHE_TTL = 30 * 24 * 3600       # 成功结果缓存 30 天
+GEO_NEGATIVE_TTL = 24 * 3600         # 查询失败（私有地址等）缓存 1 天
+IP_API_BASE = os.environ.get("IP_API_BASE", "http://ip-api.com")
+API_RATE_PER_MIN = 45                # ip-api 单条查询：每分钟 45 次
+BATCH_RATE_PER_MIN = 15              # ip-api 批量查询：每分钟 15 次，每次至多 100 个
+BATCH_SIZE = 100
+API_TIMEOUT = 10
+# ===============================
+
+
+class TokenBucket:
+    """线程安全的令牌桶：rate 个/分钟，容量 burst"""
+
+    def __init__(self, rate_per_min, burst=None):
+        self.rate = rate_per_min / 60.0
+        self.capacity = burst or rate_per_min
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def drain(self, seconds):
+        """服务端返回限流时清空令牌，并顺延 seconds 秒"""
+        with self.lock:
+            self.tokens = -seconds * self.rate
+            self.updated = time.monotonic()
+
+
+_lock = threading.Lock()
+_conn = None
+_single_bucket = TokenBucket(API_RATE_PER_MIN)
+_batch_bucket = TokenBucket(BATCH_RATE_PER_MIN)
+stats = {"api_calls": 0, "cache_hits": 0}
+
+
+def _db():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(GEO_CACHE_DB) or ".", exist_ok=True)
+        _conn = sqlite3.connect(GEO_CACHE_DB, check_same_thread=False)
+        _conn.execute(
+            "CREATE TABLE IF NOT EXISTS geo ("
+            "ip TEXT NOT NULL, lang TEXT NOT NULL, status TEXT, "
+            "region TEXT, isp TEXT, fetched_at REAL, "
+            "PRIMARY KEY (ip, lang))"
+        )
+        _conn.commit()
+    return _conn
+
+
+def get(ip, lang="en"):
+    """只查本地缓存，命中且未过期返回 dict，否则返回 None"""
+    with _lock:
+        row = _db().execute(
+            "SELECT status, region, isp, fetched_at FROM geo WHERE ip = ? AND lang = ?",
+            (ip, lang),
+        ).fetchone()
+    if not row:
+        return None
+    status, region, isp, fetched_at = row
+    ttl = GEO_CACHE_TTL if status == "success" else GEO_NEGATIVE_TTL
+    if time.time() - fetched_at > ttl:
+        return None
+    return {"status": status, "regionName": region, "isp": isp}
+
+
+def put(ip, lang, data):
+    """写入一条查询结果（ip-api 的 json 格式）"""
+    put_many(lang, [(ip, data)])
+
+
+def put_many(lang, items):
+    """批量写入 [(ip, data)]，单个事务提交"""
+    now = time.time()
+    with _lock:
+        _db().executemany(
+            "INSERT OR REPLACE INTO geo (ip, lang, status, region, isp, fetched_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(ip, lang, d.get("status"), d.get("regionName"), d.get("isp"), now) for ip, d in items],
+        )
+        _db().commit()
+
+
+def lookup(ip, lang="en"):
+    """先查缓存，未命中再请求 ip-api 并写回；网络异常返回 None"""
+    cached = get(ip, lang)
+    if cached is not None:
+        stats["cache_hits"] += 1
+        metrics.inc("geo_cache_hits")
+        return cached
+
+    _single_bucket.acquire()
+    try:
+        stats["api_calls"] += 1
+        metrics.inc("geo_api_calls")
+        data = requests.get(
+            f"{IP_API_BASE}/json/{ip}?fields=status,regionName,isp&lang={lang}",
+            timeout=API_TIMEOUT,
+        ).json()
+    except Exception:
+        return None
+    put(ip, lang, data)
+    return {"status": data.get("status"), "regionName": data.get("regionName"), "isp": data.get("isp")}
+
+
+def _post_batch(chunk, lang):
+    """请求一次 /batch；遇到 429 按 X-Ttl 等待后重试一次"""
+    for _ in range(2):
+        _batch_bucket.acquire()
+        stats["api_calls"] += 1
+        metrics.inc("geo_api_calls")
+        res = requests.post(
+            f"{IP_API_BASE}/batch?fields=status,regionName,isp,query&lang={lang}",
+            json=chunk,
+            timeout=API_TIMEOUT,
+        )
+        if res.status_code == 429:
+            ttl = int(res.headers.get("X-Ttl", "60") or 60)
+            _batch_bucket.drain(ttl)
+            continue
+        # 剩余额度用完时提前让出，避免下一次被服务端拒绝
+        if res.headers.get("X-Rl") == "0":
+            _batch_bucket.drain(int(res.headers.get("X-Ttl", "60") or 60))
+        return res.json()
+    return []
+
+
+def lookup_many(ips, lang="en"):
+    """批量查询：先查缓存，剩余的按 BATCH_SIZE 分批走 /batch，返回 {ip: data}"""
+    results = {}
+    misses = []
+    for ip in dict.fromkeys(ips):
+        cached = get(ip, lang)
+        if cached is not None:
+            stats["cache_hits"] += 1
+            metrics.inc("geo_cache_hits")
+            results[ip] = cached
+        else:
+            misses.append(ip)
+
+    for i in range(0, len(misses), BATCH_SIZE):
+        chunk = misses[i:i + BATCH_SIZE]
+        try:
+            rows = _post_batch(chunk, lang)
+        except Exception as e:
+            print(f"⚠️ 批量归属地查询失败：{e}")
+            continue
+        # 服务端出错时可能返回 {"status": "fail", "message": ...} 之类的对象而不是列表，按整批失败处理
+        if not isinstance(rows, list) or not all(isinstance(data, dict) for data in rows):
+            print(f"⚠️ 批量归属地查询返回格式异常，本批 {len(chunk)} 个跳过：{str(rows)[:100]}")
+            continue
+        fetched = []
+        for ip, data in zip(chunk, rows):
+            data = {"status": data.get("status"), "regionName": data.get("regionName"), "isp": data.get("isp")}
+            results[ip] = data
+            fetched.append((ip, data))
+        put_many(lang, fetched)
+    return results
@@ -2,6 +2,10 @@ import re
 import os
 import requests
 
+import channel_names
+import metrics
+import playlist
+
 # ===============================
 # 配置区
 # ===============================
@@ -19,13 +23,7 @@ def clean_group_name(text: str) -> str:
     return text.strip().rstrip(":：")
 
 def get_logo_url(name: str) -> str:
-    n = name.strip()
-    n = re.sub(r"[ -_]HD|高清|超清|4K|8K|\+|PLUS|Ⅰ|Ⅱ|Ⅲ|Ⅳ|Ⅴ", "", n, flags=re.IGNORECASE)
-    if n.upper().startswith("CCTV"):
-        n = n.replace("-", "").replace(" ", "")
-        if "欧洲" in n or "美洲" in n:
-            n = "CCTV4"
-    return f"{LOGO_BASE}{n.upper()}.png"
+    return f"{LOGO_BASE}{channel_names.logo_key(name)}.png"
 
 def is_valid_url(url: str) -> bool:
     return bool(re.match(r"^(https?|rtp|udp)://", url, re.IGNORECASE))
@@ -40,35 +38,15 @@ def main():
         return
 
     print(f"📖 正在处理本地文件: {TARGET_FILE}")
-    with open(TARGET_FILE, "r", encoding="utf-8") as f:
-        lines = f.readlines()
-
-    current_group = "未分类"
-    m3u_lines = [f'#EXTM3U x-tvg-url="{EPG_URL}"'] # 注意这里去掉内部换行，后面统一join
-
-    for line in lines:
-        line = line.strip()
-        if not line: continue
-        if "#genre#" in line:
-            raw_group = line.split(",", 1)[0]
-            current_group = clean_group_name(raw_group)
-            continue
-        if "," not in line: continue
-
-        parts = line.split(",", 1)
-        name, url = parts[0].strip(), parts[1].strip()
-
-        if not name or not is_valid_url(url): continue
-
-        logo = get_logo_url(name)
-        m3u_lines.append(f'#EXTINF:-1 tvg-name="{name}" tvg-logo="{logo}" group-title="{current_group}",{name}')
-        m3u_lines.append(url)
+    pl = playlist.load_txt(TARGET_FILE, clean_group=clean_group_name, keep=lambda name, url: is_valid_url(url))
 
-    # 写入文件
+    # 写入文件（逐行相连，末尾不换行）
     with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        f.write("\n".join(m3u_lines))
+        playlist.render_m3u(pl, f, EPG_URL, get_logo_url, spaced=False)
+    metrics.set_value("lines_out", len(pl))
 
     print(f"✅ 转换完成：{OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("iptv_to_m3u"):
+        main()
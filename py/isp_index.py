@@ -0,0 +1,244 @@
+import os
+import re
+import sys
+import time
+import random
+import socket
+import struct
+from array import array
+from bisect import bisect_right
+
+# ===============================
+# 配置区
+CIDR_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "isp_cidr.txt")
+IP_DIR = "ip"
+# update 子命令的数据来源：按运营商整理的 APNIC 地址段
+# 仓库内置的 isp_cidr.txt 只是 100 个主要大段（当前 ip/ 约一半地址能判断），完整列表由 update 下载生成；
+# ip.yml 每次运行前执行 update --max-age 7，数据超过 7 天或仍是内置版本时重新下载
+UPDATE_MAX_AGE_DAYS = 7
+UPDATE_SOURCES = {
+    "电信": "https://raw.githubusercontent.com/gaoyifan/china-operator-ip/ip-lists/chinanet.txt",
+    "联通": "https://raw.githubusercontent.com/gaoyifan/china-operator-ip/ip-lists/unicom.txt",
+    "移动": "https://raw.githubusercontent.com/gaoyifan/china-operator-ip/ip-lists/cmcc.txt",
+}
+# ===============================
+
+_IPV4_RE = re.compile(r"^\d{1,3}(\.\d{1,3}){3}$")
+_unpack_ip = struct.Struct("!I").unpack
+_index = None
+
+
+def ip_to_int(ip):
+    return _unpack_ip(socket.inet_aton(ip))[0]
+
+
+def parse_cidr(cidr):
+    """'1.2.0.0/16' -> (start, end)"""
+    net, _, plen = cidr.partition("/")
+    plen = int(plen or 32)
+    start = ip_to_int(net) & ((0xFFFFFFFF << (32 - plen)) & 0xFFFFFFFF)
+    return start, start | ((1 << (32 - plen)) - 1)
+
+
+class IspIndex:
+    """有序区间数组 + 二分查找的运营商前缀索引（嵌套网段按最长前缀生效）"""
+
+    __slots__ = ("starts", "ends", "isps", "names")
+
+    def __init__(self, blocks):
+        # blocks: [(start, end, isp)]，CIDR 只会嵌套或不相交，外层在前排序后用栈展开
+        blocks = sorted(blocks, key=lambda b: (b[0], -b[1]))
+        segments = []
+        stack = []
+        pos = 0
+
+        def emit(lo, hi, isp):
+            if lo > hi:
+                return
+            if segments and segments[-1][1] == lo - 1 and segments[-1][2] == isp:
+                segments[-1][1] = hi
+            else:
+                segments.append([lo, hi, isp])
+
+        for start, end, isp in blocks:
+            while stack and stack[-1][1] < start:
+                top = stack.pop()
+                emit(pos, top[1], top[2])
+                pos = top[1] + 1
+            if stack:
+                emit(pos, start - 1, stack[-1][2])
+            pos = start
+            stack.append((start, end, isp))
+        while stack:
+            top = stack.pop()
+            emit(pos, top[1], top[2])
+            pos = top[1] + 1
+
+        self.names = sorted({s[2] for s in segments})
+        code = {n: i for i, n in enumerate(self.names)}
+        self.starts = array("I", (s[0] for s in segments))
+        self.ends = array("I", (s[1] for s in segments))
+        self.isps = array("B", (code[s[2]] for s in segments))
+
+    def __len__(self):
+        return len(self.starts)
+
+    def lookup(self, ip):
+        """返回 '电信'/'联通'/'移动'，不在任何网段或非 IPv4 返回 '未知'"""
+        try:
+            n = _unpack_ip(socket.inet_aton(ip))[0]
+        except (OSError, ValueError):
+            return "未知"
+        i = bisect_right(self.starts, n) - 1
+        if i >= 0 and n <= self.ends[i]:
+            return self.names[self.isps[i]]
+        return "未知"
+
+
+def load_index(path=CIDR_FILE):
+    blocks = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            cidr, isp = line.split()[:2]
+            start, end = parse_cidr(cidr)
+            blocks.append((start, end, isp))
+    return IspIndex(blocks)
+
+
+def get_index():
+    global _index
+    if _index is None:
+        _index = load_index()
+    return _index
+
+
+def lookup(ip):
+    return get_index().lookup(ip)
+
+
+def classify_dir(ip_dir=IP_DIR):
+    """批量判断 ip/ 目录：返回 {文件名: {"total", "match", "mismatch": [(ip_port, isp)]}}"""
+    index = get_index()
+    report = {}
+    for fname in sorted(os.listdir(ip_dir)):
+        if not fname.endswith(".txt"):
+            continue
+        file_isp = fname[:-4][-2:]
+        entry = {"total": 0, "match": 0, "mismatch": []}
+        with open(os.path.join(ip_dir, fname), encoding="utf-8") as f:
+            for ip_port in sorted({line.strip() for line in f if line.strip()}):
+                isp = index.lookup(ip_port.split(":")[0])
+                entry["total"] += 1
+                if isp == file_isp:
+                    entry["match"] += 1
+                elif isp != "未知":
+                    entry["mismatch"].append((ip_port, isp))
+        report[fname] = entry
+    return report
+
+
+def data_age_days(path=CIDR_FILE):
+    """数据文件由 update 生成了多少天；内置的精简版本或读不出日期返回 None"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            head = [next(f, "") for _ in range(3)]
+    except OSError:
+        return None
+    for line in head:
+        m = re.search(r"update 生成于 (\d{4}-\d{2}-\d{2})", line)
+        if m:
+            return (time.time() - time.mktime(time.strptime(m.group(1), "%Y-%m-%d"))) / 86400
+    return None
+
+
+def update_data(path=CIDR_FILE, max_age=None):
+    """从 UPDATE_SOURCES 下载完整地址段，重写数据文件；max_age 天内已更新过则跳过"""
+    age = data_age_days(path)
+    if max_age is not None and age is not None and age <= max_age:
+        print(f"ℹ️ {path} 已于 {age:.1f} 天前更新，跳过")
+        return False
+    import requests
+
+    lines = ["# 三大运营商 IPv4 地址段（CIDR 运营商），供 isp_index.py 离线判断运营商",
+             f"# 由 python py/isp_index.py update 生成于 {time.strftime('%Y-%m-%d')}"]
+    for isp, url in UPDATE_SOURCES.items():
+        r = requests.get(url, timeout=30)
+        r.raise_for_status()
+        cidrs = [x.strip() for x in r.text.splitlines() if x.strip() and not x.startswith("#")]
+        lines.extend(f"{c} {isp}" for c in cidrs)
+        print(f"📥 {isp}: {len(cidrs)} 个网段")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    print(f"✅ 已写入 {path}")
+    return True
+
+
+# ===============================
+# 基准测试：与旧版 AmJiB.get_isp_by_regex 对比
+def _legacy_regex_isp(ip):
+    if re.match(r"^(1[0-9]{2}|2[0-3]{2}|42|43|58|59|60|61|110|111|112|113|114|115|116|117|118|119|120|121|122|123|124|125|126|127|175|180|182|183|184|185|186|187|188|189|223)\.", ip):
+        return "电信"
+    elif re.match(r"^(42|43|58|59|60|61|110|111|112|113|114|115|116|117|118|119|120|121|122|123|124|125|126|127|175|180|182|183|184|185|186|187|188|189|223)\.", ip):
+        return "联通"
+    elif re.match(r"^(223|36|37|38|39|100|101|102|103|104|105|106|107|108|109|134|135|136|137|138|139|150|151|152|157|158|159|170|178|182|183|184|187|188|189)\.", ip):
+        return "移动"
+    return "未知"
+
+
+def benchmark(n=200_000, ip_dir=IP_DIR):
+    index = get_index()
+    sample = []
+    if os.path.isdir(ip_dir):
+        for fname in os.listdir(ip_dir):
+            if fname.endswith(".txt"):
+                with open(os.path.join(ip_dir, fname), encoding="utf-8") as f:
+                    sample.extend(h for h in (x.strip().split(":")[0] for x in f) if _IPV4_RE.match(h))
+    rnd = random.Random(0)
+    while len(sample) < 1000:
+        sample.append(".".join(str(rnd.randint(1, 223)) for _ in range(4)))
+    ips = [rnd.choice(sample) for _ in range(n)]
+
+    results = {}
+    for name, fn in (("regex", _legacy_regex_isp), ("cidr_index", index.lookup)):
+        t0 = time.perf_counter()
+        counts = {}
+        for ip in ips:
+            isp = fn(ip)
+            counts[isp] = counts.get(isp, 0) + 1
+        elapsed = time.perf_counter() - t0
+        results[name] = {"seconds": elapsed, "us_per_ip": elapsed / n * 1e6, "counts": counts}
+
+    print(f"📊 {n} 次查询，索引 {len(index)} 个区间")
+    for name, r in results.items():
+        print(f"  {name:11} {r['seconds']:.3f}s  {r['us_per_ip']:.2f} µs/IP  {r['counts']}")
+    return results
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "classify"
+    if cmd == "update":
+        # update [--max-age 天数]
+        max_age = float(sys.argv[3]) if len(sys.argv) > 3 and sys.argv[2] == "--max-age" else None
+        update_data(max_age=max_age)
+    elif cmd == "bench":
+        benchmark()
+    elif cmd == "classify":
+        target = sys.argv[2] if len(sys.argv) > 2 else IP_DIR
+        report = classify_dir(target)
+        for fname, r in report.items():
+            flag = "✅" if not r["mismatch"] else "⚠️"
+            print(f"{flag} {fname}: {r['match']}/{r['total']} 一致，{len(r['mismatch'])} 个运营商不符")
+            for ip_port, isp in r["mismatch"][:5]:
+                print(f"     {ip_port} → {isp}")
+        total = sum(r["total"] for r in report.values())
+        match = sum(r["match"] for r in report.values())
+        mismatch = sum(len(r["mismatch"]) for r in report.values())
+        age = data_age_days()
+        print(f"📊 覆盖率：{match + mismatch}/{total} 个地址能判断（与文件名一致 {match}，不符 {mismatch}），"
+              f"数据{'为内置精简版' if age is None else f'更新于 {age:.0f} 天前'}")
+    else:
+        for ip in sys.argv[1:]:
+            print(ip, lookup(ip))
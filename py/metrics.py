@@ -0,0 +1,198 @@
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# ===============================
+# 配置区
+# 每个阶段结束时追加一行 JSON 到 METRICS_FILE；METRICS_PROM 非空时另写 Prometheus textfile（只保留各阶段最新一次）
+METRICS_FILE = os.environ.get("METRICS_FILE", "py/metrics.jsonl")
+METRICS_PROM = os.environ.get("METRICS_PROM", "")
+METRICS_KEEP = 5000           # jsonl 最多保留多少行（随 actions/cache 跨运行保存，超出丢弃最旧的）
+RUN_ID = os.environ.get("GITHUB_RUN_ID") or f"local-{os.getpid()}-{int(time.time())}"
+LATENCY_BUCKETS_MS = (10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+# ===============================
+
+_lock = threading.Lock()
+_active = []     # 正在进行的阶段（嵌套时内外层都计数）
+
+
+class Histogram:
+    """固定桶直方图（上界含等于），最后一个桶为 +Inf"""
+
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {"buckets": list(self.bounds), "counts": self.counts, "sum": round(self.sum, 3), "count": self.count}
+
+
+class Stage:
+    """一个阶段的计数器 / 数值 / 直方图，结束时写出一条记录"""
+
+    def __init__(self, name, script=None):
+        self.name = name
+        self.script = script or os.path.basename(sys.argv[0] or "python")
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self.started = time.time()
+        self._t0 = time.perf_counter()
+
+    def inc(self, key, n=1):
+        with _lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+
+    def set(self, key, value):
+        with _lock:
+            self.gauges[key] = value
+
+    def observe(self, key, value, bounds=LATENCY_BUCKETS_MS):
+        if value is None:
+            return
+        with _lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = Histogram(bounds)
+            hist.observe(value)
+
+    def record(self, status="ok"):
+        return {
+            "ts": datetime.fromtimestamp(self.started, timezone.utc).isoformat(timespec="seconds"),
+            "run_id": RUN_ID, "script": self.script, "stage": self.name, "status": status,
+            "seconds": round(time.perf_counter() - self._t0, 3),
+            "counters": dict(self.counters), "gauges": dict(self.gauges),
+            "histograms": {k: h.to_dict() for k, h in self.histograms.items()},
+        }
+
+
+# 叶子模块（stream_probe / throughput / geo_cache）直接调用下面三个函数，没有进行中的阶段时什么也不做
+def inc(key, n=1):
+    for stage in _active:
+        stage.inc(key, n)
+
+
+def set_value(key, value):
+    for stage in _active:
+        stage.set(key, value)
+
+
+def observe(key, value, bounds=LATENCY_BUCKETS_MS):
+    for stage in _active:
+        stage.observe(key, value, bounds)
+
+
+@contextmanager
+def stage(name, script=None):
+    """with metrics.stage("third_stage") as m: ...  结束（含异常）时写出记录，写入失败不影响主流程"""
+    st = Stage(name, script)
+    _active.append(st)
+    status = "ok"
+    try:
+        yield st
+    except BaseException as e:
+        status = "error" if isinstance(e, Exception) else "interrupted"
+        raise
+    finally:
+        _active.remove(st)
+        try:
+            write(st.record(status))
+        except Exception as e:
+            print(f"⚠️ 写入运行指标失败：{e}")
+
+
+def write(record, path=None):
+    path = path or METRICS_FILE
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with _lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        _trim(path)
+    if METRICS_PROM:
+        write_prom(METRICS_PROM, path)
+
+
+def _trim(path, keep=METRICS_KEEP):
+    with open(path, encoding="utf-8") as f:
+        lines = f.readlines()
+    if len(lines) > keep:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.writelines(lines[-keep:])
+        os.replace(tmp, path)
+
+
+def load(path=None):
+    path = path or METRICS_FILE
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _prom_name(key):
+    return "iptv_" + "".join(c if c.isalnum() else "_" for c in key)
+
+
+def write_prom(prom_path, path=None):
+    """把各 (脚本, 阶段) 的最新一条记录导出为 node_exporter textfile 格式"""
+    latest = {}
+    for rec in load(path):
+        latest[(rec["script"], rec["stage"])] = rec
+    lines = []
+    for (script, name), rec in sorted(latest.items()):
+        labels = f'script="{script}",stage="{name}"'
+        lines.append(f'iptv_stage_seconds{{{labels},status="{rec["status"]}"}} {rec["seconds"]}')
+        lines.append(f"iptv_stage_timestamp_seconds{{{labels}}} "
+                     f"{int(datetime.fromisoformat(rec['ts']).timestamp())}")
+        for key, value in sorted({**rec["counters"], **rec["gauges"]}.items()):
+            if isinstance(value, (int, float)):
+                lines.append(f"{_prom_name(key)}{{{labels}}} {value}")
+        for key, h in sorted(rec["histograms"].items()):
+            metric, cumulative = _prom_name(key), 0
+            for bound, count in zip(h["buckets"] + ["+Inf"], h["counts"]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{metric}_sum{{{labels}}} {h['sum']}")
+            lines.append(f"{metric}_count{{{labels}}} {h['count']}")
+    tmp = prom_path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+    os.replace(tmp, prom_path)
+
+
+def summary(records, last=10):
+    """按 (脚本, 阶段) 汇总最近 last 次的耗时：[(脚本, 阶段, 次数, 最近一次, 中位数, 最大值)]"""
+    by_stage = {}
+    for rec in records:
+        by_stage.setdefault((rec["script"], rec["stage"]), []).append(rec["seconds"])
+    rows = []
+    for (script, name), secs in sorted(by_stage.items()):
+        recent = sorted(secs[-last:])
+        rows.append((script, name, len(secs), secs[-1], recent[len(recent) // 2], recent[-1]))
+    return rows
+
+
+if __name__ == "__main__":
+    cmd = sys.argv[1] if len(sys.argv) > 1 else "summary"
+    if cmd == "prom":
+        write_prom(sys.argv[2] if len(sys.argv) > 2 else "metrics.prom")
+    else:
+        records = load(sys.argv[2] if len(sys.argv) > 2 else None)
+        print(f"📊 {METRICS_FILE}：共 {len(records)} 条记录（最近 10 次的耗时）")
+        for script, name, n, latest, median, worst in summary(records):
+            print(f"  {script:26} {name:18} {n:5} 次  最近 {latest:8.2f}s  中位 {median:8.2f}s  最慢 {worst:8.2f}s")
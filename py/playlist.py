@@ -0,0 +1,228 @@
+import re
+
+# ===============================
+# 配置区
+NOTE_CATEGORY = "更新时间"            # TXT 开头的更新时间分组（下一行分组名即时间）
+NOTICE_KEYWORDS = ("更新时间", "GitHub", "作者")
+NOTICE_GROUP = "公告说明"
+# ===============================
+
+_SERVER_RE = re.compile(r"^[A-Za-z]+://([^/]+)/")
+
+
+class Channel:
+    """一条频道线路：url 不含 $ 后缀，归属（如 四川电信）单独存放在 region"""
+
+    __slots__ = ("name", "url", "category", "server", "region")
+
+    def __init__(self, name, url, category="", server="", region=""):
+        self.name = name
+        self.url = url
+        self.category = category
+        self.server = server
+        self.region = region
+
+    @property
+    def full_url(self):
+        return f"{self.url}${self.region}" if self.region else self.url
+
+    def line(self):
+        return f"{self.name},{self.full_url}"
+
+
+class Server:
+    __slots__ = ("ip_port", "region", "channels")
+
+    def __init__(self, ip_port, region=""):
+        self.ip_port = ip_port
+        self.region = region
+        self.channels = []
+
+
+class Region:
+    __slots__ = ("name", "servers")
+
+    def __init__(self, name):
+        self.name = name
+        self.servers = {}   # ip_port -> Server，保持首次出现顺序；同一服务器可属于多个地区
+
+
+class Playlist:
+    """内存中的播放列表：按分组、服务器、地区三个索引，渲染器都从这里单遍输出"""
+
+    __slots__ = ("updated", "categories", "servers", "regions")
+
+    def __init__(self, updated=None):
+        self.updated = updated
+        self.categories = {}   # 分组名 -> [Channel]（保持顺序，允许空分组）
+        self.servers = {}
+        self.regions = {}
+
+    def __len__(self):
+        return sum(len(chs) for chs in self.categories.values())
+
+    def __iter__(self):
+        for chs in self.categories.values():
+            yield from chs
+
+    def category(self, name):
+        return self.categories.setdefault(name, [])
+
+    def add(self, name, url, category, region=None):
+        """添加一条线路；url 可带 $归属 后缀，region 显式给出时以其为准"""
+        if region is None:
+            url, _, region = url.partition("$")
+        m = _SERVER_RE.match(url)
+        server = m.group(1) if m else ""
+        ch = Channel(name, url, category, server, region)
+        self.category(category).append(ch)
+        if server:
+            srv = self.servers.get(server)
+            if srv is None:
+                srv = self.servers[server] = Server(server, region)
+            # 同一服务器出现在多个地区时每个地区都列出（与旧版 convert_full_m3u 一致）
+            if region:
+                self.regions.setdefault(region, Region(region)).servers.setdefault(server, srv)
+            srv.channels.append(ch)
+        return ch
+
+    def by_category(self, name):
+        return self.categories.get(name, [])
+
+    def by_server(self, ip_port):
+        srv = self.servers.get(ip_port)
+        return srv.channels if srv else []
+
+    def grouped_by_server(self):
+        """返回新的 Playlist：各分组内按服务器首次出现的顺序聚合（同一服务器内保持原顺序）"""
+        out = Playlist(self.updated)
+        for name, chs in self.categories.items():
+            order = {}
+            for ch in chs:
+                order.setdefault(ch.server, len(order))
+            out.category(name)
+            for ch in sorted(chs, key=lambda ch: order[ch.server]):
+                out.add(ch.name, ch.url, name, ch.region)
+        return out
+
+    def filter(self, keep):
+        """按 keep(channel) 过滤，返回新的 Playlist（分组顺序不变，空分组保留）"""
+        out = Playlist(self.updated)
+        for name, chs in self.categories.items():
+            out.category(name)
+            for ch in chs:
+                if keep(ch):
+                    out.add(ch.name, ch.url, name, ch.region)
+        return out
+
+
+def parse_txt(lines, playlist=None, default_category="未分类", clean_group=None, keep=None):
+    """解析 TXT 播放列表（分组名,#genre# / 频道名,url[$归属]），可多次调用合并到同一个 Playlist"""
+    pl = playlist if playlist is not None else Playlist()
+    category = default_category
+    expect_time = False
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        if "#genre#" in line:
+            name = line.split(",", 1)[0].strip()
+            if expect_time:
+                pl.updated = name
+                expect_time = False
+            elif name == NOTE_CATEGORY and not pl.categories:
+                expect_time = True
+            else:
+                category = clean_group(name) if clean_group else name
+                pl.category(category)
+            continue
+        if "," not in line:
+            continue
+        name, url = (x.strip() for x in line.split(",", 1))
+        if not name or (keep and not keep(name, url)):
+            continue
+        if any(k in line for k in NOTICE_KEYWORDS):
+            pl.add(name, url, NOTICE_GROUP)
+        else:
+            pl.add(name, url, category)
+    return pl
+
+
+def load_txt(path, playlist=None, **kwargs):
+    with open(path, encoding="utf-8") as f:
+        return parse_txt(f, playlist, **kwargs)
+
+
+class _Joiner:
+    """按 '\n'.join 的格式流式写出（末尾不带换行）"""
+
+    def __init__(self, out):
+        self.out = out
+        self.first = True
+
+    def __call__(self, line):
+        if not self.first:
+            self.out.write("\n")
+        self.out.write(line)
+        self.first = False
+
+
+def render_txt(pl, out, spaced=True, skip_empty=False):
+    """TXT 输出。spaced：每个分组后空一行（IPTV.txt 格式）；否则逐行相连、末尾无换行（live_full.txt 格式）"""
+    write = out.write if spaced else _Joiner(out)
+    nl = "\n" if spaced else ""
+    if pl.updated is not None:
+        write(f"{NOTE_CATEGORY},#genre#{nl}")
+        write(f"{pl.updated},#genre#{nl}")
+        if spaced:
+            write("\n")
+    for name, chs in pl.categories.items():
+        if skip_empty and not chs:
+            continue
+        write(f"{name},#genre#{nl}")
+        for ch in chs:
+            write(ch.line() + nl)
+        if spaced:
+            write("\n")
+
+
+def render_m3u(pl, out, epg_url, logo_url, spaced=True):
+    """按分组输出 M3U（tvg-name / tvg-logo / group-title），url 保留 $归属 后缀。
+    spaced：每条后空一行、分组后再空一行（convert_to_m3u 格式）；否则逐行相连、末尾无换行"""
+    write = out.write if spaced else _Joiner(out)
+    nl = "\n" if spaced else ""
+    write(f'#EXTM3U x-tvg-url="{epg_url}"{nl}')
+    if spaced:
+        write("\n")
+        if pl.updated is not None:
+            write("\n")
+    for group, chs in pl.categories.items():
+        for ch in chs:
+            if group == NOTICE_GROUP:
+                write(f'#EXTINF:-1 group-title="{NOTICE_GROUP}",{ch.name}{nl}')
+            else:
+                write(f'#EXTINF:-1 tvg-name="{ch.name}" tvg-logo="{logo_url(ch.name)}" '
+                      f'group-title="{group}",{ch.name}{nl}')
+            write(f"{ch.full_url}{nl}")
+            if spaced:
+                write("\n")
+        if spaced:
+            write("\n")
+
+
+def render_grouped_m3u(pl, out, epg_url, logo_url, sort_key, display_name=None):
+    """按 地区+服务器 分组输出 M3U（group-title 为 (地区序号)），组内按 sort_key 排序并按频道名去重；
+    url 不带 $ 后缀，逐行相连、末尾无换行"""
+    write = _Joiner(out)
+    write(f'#EXTM3U x-tvg-url="{epg_url}"')
+    for region in sorted(pl.regions):
+        for idx, srv in enumerate(pl.regions[region].servers.values()):
+            group = f"({region}{idx + 1})"
+            names = [(display_name(ch.name) if display_name else ch.name, ch) for ch in srv.channels]
+            seen = set()
+            for name, ch in sorted(names, key=lambda x: (sort_key(x[0]), x[0])):
+                if name in seen:
+                    continue
+                seen.add(name)
+                write(f'#EXTINF:-1 tvg-logo="{logo_url(name)}" group-title="{group}",{name}')
+                write(ch.url)
@@ -0,0 +1,125 @@
+import json
+import os
+import signal
+import time
+
+# ===============================
+# 配置区
+# 探测结果边完成边追加到 JSON lines 日志；任务被取消 / 超时后，下次运行跳过仍新鲜的结果接着测
+JOURNAL_DIR = os.environ.get("JOURNAL_DIR", "py")
+FSYNC_EVERY = 50      # 每追加多少条强制落盘一次（每条都会 flush，进程被杀不丢；fsync 防机器掉电）
+# ===============================
+#
+# 日志格式（每行一个 JSON）：
+#   {"k": "ip:port", "t": 时间戳, "r": [...]}   一条探测结果
+#   {"saved": 时间戳}                            之前的结果已写入服务器注册表
+#   {"done": 时间戳}                             本轮完整结束，之前的内容下次全部丢弃
+# 写到一半被杀掉的残行解析失败，直接忽略
+
+
+def journal_path(name):
+    return os.path.join(JOURNAL_DIR, f"journal_{name}.jsonl")
+
+
+def _read(path):
+    """读出最后一个 done 标记之后的结果：[(key, 时间戳, 结果, 是否已写入注册表)]"""
+    entries = []
+    if not os.path.exists(path):
+        return entries
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if "done" in rec:
+                entries = []
+            elif "saved" in rec:
+                entries = [(k, t, r, True) for k, t, r, _ in entries]
+            elif "k" in rec:
+                entries.append((rec["k"], rec["t"], rec["r"], False))
+    return entries
+
+
+def pending(name, ttl):
+    """上一轮是否没跑完、且还留有未过期的结果（用来决定本轮要不要补跑）"""
+    now = time.time()
+    return any(now - t <= ttl for _, t, _, _ in _read(journal_path(name)))
+
+
+class ProbeJournal:
+    """with ProbeJournal("third_stage", ttl) as journal: journal.results 为可复用的结果，
+    新结果用 record() 追加，写入注册表后 mark_saved()，整轮结束 complete()"""
+
+    def __init__(self, name, ttl, path=None):
+        self.path = path or journal_path(name)
+        self.results = {}    # {key: 结果}，上一轮中断时留下的、未过期的结果
+        self.saved = set()   # 其中已写入注册表的 key，不能重复计分
+        times = {}
+        now = time.time()
+        for key, t, result, saved in _read(self.path):
+            if now - t > ttl:
+                continue
+            self.results[key] = result
+            times[key] = t
+            if saved:
+                self.saved.add(key)
+            else:
+                self.saved.discard(key)
+        # 压缩：只保留仍可复用的结果（保留原时间戳，反复中断也不会一直续期），过期的和已结束轮次的内容丢掉
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            for key in self.saved:
+                self._write_line(f, {"k": key, "t": times[key], "r": self.results[key]})
+            if self.saved:
+                self._write_line(f, {"saved": now})
+            for key, result in self.results.items():
+                if key not in self.saved:
+                    self._write_line(f, {"k": key, "t": times[key], "r": result})
+        os.replace(tmp, self.path)
+        self._f = open(self.path, "a", encoding="utf-8")
+        self._unsynced = 0
+
+    @staticmethod
+    def _write_line(f, rec):
+        f.write(json.dumps(rec, ensure_ascii=False) + "\n")
+
+    def _append(self, rec, sync=False):
+        self._write_line(self._f, rec)
+        self._f.flush()
+        self._unsynced += 1
+        if sync or self._unsynced >= FSYNC_EVERY:
+            os.fsync(self._f.fileno())
+            self._unsynced = 0
+
+    def record(self, key, result):
+        self._append({"k": key, "t": time.time(), "r": list(result)})
+
+    def mark_saved(self):
+        self._append({"saved": time.time()}, sync=True)
+
+    def complete(self):
+        self._append({"done": time.time()}, sync=True)
+
+    def close(self):
+        if not self._f.closed:
+            self._f.flush()
+            os.fsync(self._f.fileno())
+            self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt(f"signal {signum}")
+
+
+def install_signal_handlers():
+    """GitHub Actions 取消 / 超时先发 SIGINT 再发 SIGTERM：两者都转成 KeyboardInterrupt，
+    让脚本停止派发新探测，用日志里已完成的结果生成输出"""
+    signal.signal(signal.SIGTERM, _interrupt)
@@ -0,0 +1,333 @@
+import asyncio
+import concurrent.futures
+import heapq
+import time
+from collections import Counter, deque
+
+import metrics
+
+# ===============================
+# 配置区
+GLOBAL_LIMIT = 64            # 全局同时进行的探测数
+PER_HOST_LIMIT = 2           # 同一 ip:port（同一台 udpxy）同时进行的探测数
+PER_SUBNET_LIMIT = 8         # 同一 /24 同时进行的探测数
+BACKOFF_BASE = 2.0           # 主机出错后退避秒数，连续出错翻倍
+BACKOFF_MAX = 60.0
+SUBNET_ERROR_THRESHOLD = 5   # 同一 /24 连续出错多少次后整段暂停
+SUBNET_PAUSE = 2.0           # 整段暂停秒数（固定值，避免大量死链的网段被拖成串行）
+# 截止时间模式：给定墙钟预算，按完成速率调节全局并发，预计做不完的探测不再派发
+ADAPT_INTERVAL = 2.0         # 每隔多少秒按完成速率调一次并发上限
+ADAPT_UP = 1.5               # 进度落后时并发上限的放大倍数
+ADAPT_DOWN = 0.8             # 进度远超预期（速率超过所需两倍）时的缩小倍数
+ADAPT_MAX_FACTOR = 4         # 并发上限最多放大到初始值的几倍 / 最少缩小到几分之一
+DEADLINE_MARGIN = 0.9        # 按预算的 90% 规划进度，留出写输出的时间
+# 期望价值：截止时间模式下先测价值高的（没测过的 > 上次可用的 > 上次不可用的，代表频道是 CCTV1 的加权）
+VALUE_UNKNOWN = 1.0
+VALUE_GOOD = 0.8
+VALUE_BAD = 0.2
+VALUE_CCTV1 = 1.5
+# ===============================
+
+
+def host_of(target):
+    """'http://1.2.3.4:8080/rtp/...' 或 '1.2.3.4:8080' -> '1.2.3.4:8080'"""
+    if "://" in target:
+        target = target.split("://", 1)[1]
+    return target.split("/", 1)[0]
+
+
+def subnet_of(host):
+    """'1.2.3.4:8080' -> '1.2.3'，非 IPv4 地址按主机名本身分组"""
+    name = host.rsplit(":", 1)[0]
+    parts = name.split(".")
+    if len(parts) == 4 and all(p.isdigit() for p in parts):
+        return ".".join(parts[:3])
+    return name
+
+
+class ProbeScheduler:
+    """按主机排队、主机间轮转派发的探测调度器：全局 / 单主机 / 单 /24 三级并发上限，出错主机指数退避。
+    只在派发线程（或事件循环）里调用，本身不加锁。
+    有待派发任务的主机只在以下之一：就绪堆、退避中、单主机并发已满、所在 /24 并发已满，
+    派发时只看就绪堆的堆顶，上万个目标也不用每次从头扫一遍"""
+
+    def __init__(self, limit=GLOBAL_LIMIT, per_host=PER_HOST_LIMIT, per_subnet=PER_SUBNET_LIMIT):
+        self.limit = limit
+        self.per_host = per_host
+        self.per_subnet = per_subnet
+        self.queues = {}               # host -> deque(item)
+        self.pending = 0
+        self.active = 0
+        self.host_active = Counter()
+        self.subnet_active = Counter()
+        self.errors = Counter()        # host 或 subnet 的连续出错次数
+        self.blocked_until = {}        # host 或 subnet -> 退避截止时刻
+        self.stats = {"dispatched": 0, "errors": 0, "backoffs": 0}
+        self._seq = 0
+        self._ready = []               # 堆 (序号, host)：序号小的先派发，派发后换新序号排到最后（轮转）
+        self._timed = []               # 堆 (解除时刻, 序号, host)：主机或所在 /24 退避中
+        self._host_full = {}           # host -> 序号：单主机并发已满
+        self._subnet_full = {}         # subnet -> 堆 (序号, host)：所在 /24 并发已满
+
+    def __len__(self):
+        return self.pending
+
+    def _push(self, host, seq=None):
+        if seq is None:
+            self._seq += 1
+            seq = self._seq
+        heapq.heappush(self._ready, (seq, host))
+
+    def _release(self, subnet):
+        """/24 空出一个并发名额：放回一个因该 /24 已满而等待的主机"""
+        parked = self._subnet_full.get(subnet)
+        if parked:
+            seq, host = heapq.heappop(parked)
+            self._push(host, seq)
+            if not parked:
+                del self._subnet_full[subnet]
+
+    def add(self, host, item):
+        if host not in self.queues:
+            self.queues[host] = deque()
+            self._push(host)
+        self.queues[host].append(item)
+        self.pending += 1
+
+    def next_job(self, now=None):
+        """取下一个可派发的 (host, item)；受限或队列为空返回 None"""
+        if self.active >= self.limit:
+            return None
+        now = now or time.monotonic()
+        while self._timed and self._timed[0][0] <= now:
+            _, seq, host = heapq.heappop(self._timed)
+            self._push(host, seq)
+        while self._ready:
+            seq, host = heapq.heappop(self._ready)
+            subnet = subnet_of(host)
+            until = max(self.blocked_until.get(host, 0), self.blocked_until.get(subnet, 0))
+            if until > now or self.host_active[host] >= self.per_host:
+                if until > now:
+                    heapq.heappush(self._timed, (until, seq, host))
+                else:
+                    self._host_full[host] = seq
+                # 它占不了 /24 的名额，让同段等待的下一个主机补上
+                if self.subnet_active[subnet] < self.per_subnet:
+                    self._release(subnet)
+                continue
+            if self.subnet_active[subnet] >= self.per_subnet:
+                heapq.heappush(self._subnet_full.setdefault(subnet, []), (seq, host))
+                continue
+            queue = self.queues[host]
+            item = queue.popleft()
+            self.pending -= 1
+            if queue:
+                self._push(host)   # 轮转：刚派发过的主机排到最后
+            else:
+                del self.queues[host]
+            self.active += 1
+            self.host_active[host] += 1
+            self.subnet_active[subnet] += 1
+            self.stats["dispatched"] += 1
+            return host, item
+        return None
+
+    def done(self, host, ok, now=None):
+        """回报一次探测结果：成功清零出错计数，失败按次数退避"""
+        now = now or time.monotonic()
+        subnet = subnet_of(host)
+        self.active -= 1
+        self.host_active[host] -= 1
+        self.subnet_active[subnet] -= 1
+        seq = self._host_full.pop(host, None)
+        if seq is not None:
+            self._push(host, seq)
+        self._release(subnet)
+        if ok:
+            self.errors.pop(host, None)
+            self.errors.pop(subnet, None)
+            return
+        self.stats["errors"] += 1
+        self.errors[host] += 1
+        self._backoff(host, self.errors[host] - 1, now)
+        self.errors[subnet] += 1
+        if self.errors[subnet] >= SUBNET_ERROR_THRESHOLD:
+            del self.errors[subnet]
+            self.blocked_until[subnet] = now + SUBNET_PAUSE
+            self.stats["backoffs"] += 1
+
+    def _backoff(self, host, n, now):
+        self.blocked_until[host] = now + min(BACKOFF_BASE * 2 ** n, BACKOFF_MAX)
+        self.stats["backoffs"] += 1
+
+    def wait_hint(self, now=None):
+        """没有可派发任务时，距离最早一个退避结束还有多少秒（无退避返回 None）"""
+        now = now or time.monotonic()
+        return max(self._timed[0][0] - now, 0.0) if self._timed else None
+
+
+def expected_value(last_ok, has_cctv1=False):
+    """截止时间模式的派发优先级，越大越先测；last_ok 为上次结论（None 为没测过）"""
+    value = VALUE_UNKNOWN if last_ok is None else VALUE_GOOD if last_ok else VALUE_BAD
+    return value * (VALUE_CCTV1 if has_cctv1 else 1.0)
+
+
+class Deadline:
+    """墙钟预算：按完成速率调节调度器的全局并发上限，单个探测来不及做完就不再派发，到点停止。
+    hit 表示是否因预算用完而留下了没测的目标"""
+
+    def __init__(self, seconds, max_factor=ADAPT_MAX_FACTOR):
+        self.seconds = seconds
+        self.end = time.monotonic() + seconds
+        self.max_factor = max_factor
+        self.hit = False
+        self.completed = 0
+        self.avg_job = 0.0            # 单个探测耗时的 EWMA
+        self.min_limit = self.max_limit = None
+        self._mark = (time.monotonic(), 0)
+
+    def attach(self, sched):
+        self.max_limit = sched.limit * self.max_factor
+        self.min_limit = max(1, sched.limit // self.max_factor)
+
+    def job_done(self, seconds):
+        self.completed += 1
+        self.avg_job = seconds if self.completed == 1 else 0.8 * self.avg_job + 0.2 * seconds
+
+    def over(self, now):
+        return now >= self.end
+
+    def open(self, now):
+        """新派发的探测预计能在截止前做完"""
+        return now + self.avg_job <= self.end
+
+    def adapt(self, sched, now):
+        t0, n0 = self._mark
+        if now - t0 < ADAPT_INTERVAL:
+            return
+        self._mark = (now, self.completed)
+        remaining = len(sched) + sched.active
+        left = (self.end - now) * DEADLINE_MARGIN
+        if not remaining or left <= 0:
+            return
+        rate, needed = (self.completed - n0) / (now - t0), remaining / left
+        if rate < needed and len(sched):
+            sched.limit = min(self.max_limit, int(sched.limit * ADAPT_UP) + 1)
+        elif rate > needed * 2:
+            sched.limit = max(self.min_limit, int(sched.limit * ADAPT_DOWN))
+
+    def stop(self, sched, running, now):
+        """到点，或预算已不够派发新探测且手上的都做完了：停止，队列里剩下的不再测"""
+        if self.over(now) or (not running and not self.open(now)):
+            self.hit = bool(len(sched) or running)
+            return True
+        return False
+
+
+def _next_job(sched, deadline, now):
+    if deadline is None:
+        return sched.next_job(now)
+    deadline.adapt(sched, now)
+    return sched.next_job(now) if deadline.open(now) else None
+
+
+def _wait_timeout(sched, deadline, now):
+    hint = sched.wait_hint(now)
+    if deadline is None:
+        return hint
+    return max(min(hint or ADAPT_INTERVAL, ADAPT_INTERVAL, deadline.end - now), 0.01)
+
+
+def _record(sched, deadline=None):
+    metrics.inc("scheduler_dispatched", sched.stats["dispatched"])
+    metrics.inc("scheduler_errors", sched.stats["errors"])
+    metrics.inc("scheduler_backoffs", sched.stats["backoffs"])
+    if deadline:
+        metrics.set_value("deadline_hit", int(deadline.hit))
+        metrics.set_value("scheduler_final_limit", sched.limit)
+
+
+def run_threads(fn, items, key=host_of, failed=None, deadline=None, **limits):
+    """线程池版：按调度器派发 fn(item)，按完成顺序产出 (item, result)。
+    failed(result) 为真或 fn 抛异常记为出错（异常时 result 为 None）；
+    deadline 为 Deadline 时按预算调节并发，到点停止产出（没测的目标不产出，deadline.hit 置位）"""
+    sched = ProbeScheduler(**limits)
+    for item in items:
+        sched.add(key(item), item)
+    if deadline:
+        deadline.attach(sched)
+    running = {}
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=deadline.max_limit if deadline else sched.limit)
+    try:
+        while len(sched) or running:
+            now = time.monotonic()
+            if deadline and deadline.stop(sched, running, now):
+                break
+            job = _next_job(sched, deadline, now)
+            while job:
+                running[executor.submit(fn, job[1])] = job + (now,)
+                job = _next_job(sched, deadline, now)
+            timeout = _wait_timeout(sched, deadline, now)
+            if not running:
+                time.sleep(max(timeout or 0.05, 0.01))
+                continue
+            done, _ = concurrent.futures.wait(running, timeout=timeout, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                host, item, started = running.pop(future)
+                try:
+                    result = future.result()
+                    ok = not (failed and failed(result))
+                except Exception:
+                    result, ok = None, False
+                sched.done(host, ok)
+                if deadline:
+                    deadline.job_done(time.monotonic() - started)
+                yield item, result
+    finally:
+        # 调用方中途退出（如被中断）或到达截止时间时不等待进行中的探测，尽快写出已有结果
+        executor.shutdown(wait=False, cancel_futures=True)
+        _record(sched, deadline)
+
+
+async def run_async(coro_fn, items, key=host_of, failed=None, on_result=None, deadline=None, **limits):
+    """asyncio 版：按调度器派发 await coro_fn(item)，返回按完成顺序的 [(item, result)]；
+    on_result(item, result) 可用于边完成边输出；deadline 同 run_threads，到点取消进行中的探测"""
+    sched = ProbeScheduler(**limits)
+    for item in items:
+        sched.add(key(item), item)
+    if deadline:
+        deadline.attach(sched)
+    running = {}
+    results = []
+    try:
+        while len(sched) or running:
+            now = time.monotonic()
+            if deadline and deadline.stop(sched, running, now):
+                break
+            job = _next_job(sched, deadline, now)
+            while job:
+                running[asyncio.ensure_future(coro_fn(job[1]))] = job + (now,)
+                job = _next_job(sched, deadline, now)
+            timeout = _wait_timeout(sched, deadline, now)
+            if not running:
+                await asyncio.sleep(max(timeout or 0.05, 0.01))
+                continue
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                host, item, started = running.pop(task)
+                try:
+                    result = task.result()
+                    ok = not (failed and failed(result))
+                except Exception:
+                    result, ok = None, False
+                sched.done(host, ok)
+                if deadline:
+                    deadline.job_done(time.monotonic() - started)
+                results.append((item, result))
+                if on_result:
+                    on_result(item, result)
+    finally:
+        for task in running:
+            task.cancel()
+        _record(sched, deadline)
+    return results
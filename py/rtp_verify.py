@@ -0,0 +1,188 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from datetime import datetime, timezone
+
+import metrics
+import server_registry
+import stream_probe
+
+# ===============================
+# 配置区
+# 组播验证：用每个省份运营商最快的几台已验证服务器，把 rtp/ 里的每个组播都实际拉一次流，
+# 写出只含有效组播的精简列表（格式同 rtp/，第二阶段和 scan_sichuan 优先读取），同名 .json 记录每个组播的验证时间
+RTP_DIR = "rtp"
+VERIFIED_DIR = "rtp_verified"
+SERVERS_PER_GROUP = 3        # 每个省份运营商选几台已验证服务器来测
+PER_SERVER_LIMIT = 2         # 单台服务器同时转发几路（udpxy 默认最多 3 个客户端，留一个给别人）
+VERIFY_CONCURRENCY = 300     # 全部省份合计同时进行的探测数
+VERIFY_TIMEOUT = 4           # 单个探测的时限（秒）
+VERIFY_DEADLINE = 300        # 整轮验证的时限（秒），没来得及测的组播保持原状态
+TRIES = 2                    # 一个组播在几台不同服务器上都不通才判为不通
+KEEP_DAYS = 3                # 多少天内验证通过过的组播保留（偶尔一次不通不删）
+MAX_PER_CHANNEL = 2          # 同名频道最多保留几路组播（最近验证通过的优先）
+# ===============================
+
+
+def source_path(name, rtp_dir=RTP_DIR, verified_dir=VERIFIED_DIR):
+    """第二阶段读取的 rtp 文件：有精简列表用精简列表，否则用 rtp/ 原文件"""
+    verified = os.path.join(verified_dir, name)
+    return verified if os.path.exists(verified) else os.path.join(rtp_dir, name)
+
+
+def parse(lines):
+    """rtp 行 -> [(频道名, udpxy 路径, 原行)]，路径如 rtp/239.0.0.1:1234；不带 rtp:// 的裸地址按 rtp 处理"""
+    groups = []
+    for line in lines:
+        if "," not in line:
+            continue
+        name, addr = (x.strip() for x in line.split(",", 1))
+        if "udp://" in addr:
+            path = "udp/" + addr.split("udp://", 1)[1]
+        elif "rtp://" in addr:
+            path = "rtp/" + addr.split("rtp://", 1)[1]
+        elif addr[:1].isdigit():
+            path = "rtp/" + addr
+        else:
+            continue
+        groups.append((name, path, line))
+    return groups
+
+
+def load_state(name, verified_dir=VERIFIED_DIR):
+    path = os.path.join(verified_dir, name[:-4] + ".json")
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f).get("groups", {})
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(name, state, verified_dir=VERIFIED_DIR):
+    path = os.path.join(verified_dir, name[:-4] + ".json")
+    now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"updated": now, "groups": state}, f, ensure_ascii=False, indent=1, sort_keys=True)
+    os.replace(tmp, path)
+
+
+def prune(groups, state, now=None, keep_days=KEEP_DAYS, per_channel=MAX_PER_CHANNEL):
+    """保留：最近 keep_days 天内验证通过的、从没测过的；同名频道只留最近验证通过的 per_channel 路，按原顺序输出"""
+    now = now or time.time()
+    keep, seen = [], set()
+    for name, path, line in groups:
+        if path in seen:
+            continue
+        seen.add(path)
+        st = state.get(path)
+        if st is None or st.get("last_checked") is None:
+            keep.append((name, path, line, 0.0))
+        elif st.get("last_ok") and now - st["last_ok"] <= keep_days * 86400:
+            keep.append((name, path, line, st["last_ok"]))
+    by_name = {}
+    for entry in keep:
+        by_name.setdefault(entry[0], []).append(entry)
+    chosen = set()
+    for entries in by_name.values():
+        # 验证过的按最近通过时间，没测过的（0.0）排在后面
+        for entry in sorted(entries, key=lambda e: -e[3])[:per_channel]:
+            chosen.add(entry[1])
+    return [line for _, path, line, _ in keep if path in chosen]
+
+
+async def verify_all(jobs, deadline=VERIFY_DEADLINE):
+    """jobs {文件名: (服务器列表, [组播路径])} -> {文件名: {路径: True/False}}（超时没测完的不出现）"""
+    stream_probe.raise_nofile_limit()
+    sem = asyncio.Semaphore(VERIFY_CONCURRENCY)
+    server_sems = {}
+    results = {name: {} for name in jobs}
+
+    async def _one(name, servers, i, path):
+        # 从不同服务器起步分摊负载；换服务器重试，区分"服务器当时忙"和"组播确实不通"
+        for k in range(min(TRIES, len(servers))):
+            ip_port = servers[(i + k) % len(servers)]
+            server_sem = server_sems.setdefault(ip_port, asyncio.Semaphore(PER_SERVER_LIMIT))
+            async with sem, server_sem:
+                ok = await stream_probe.probe(f"http://{ip_port}/{path}", VERIFY_TIMEOUT)
+            if ok:
+                results[name][path] = True
+                return
+        results[name][path] = False
+
+    tasks = [asyncio.ensure_future(_one(name, servers, i, path))
+             for name, (servers, paths) in jobs.items() for i, path in enumerate(paths)]
+    if tasks:
+        _, pending = await asyncio.wait(tasks, timeout=deadline)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return results
+
+
+def run(only=None, rtp_dir=RTP_DIR, verified_dir=VERIFIED_DIR, deadline=VERIFY_DEADLINE):
+    os.makedirs(verified_dir, exist_ok=True)
+    fastest = server_registry.fastest(SERVERS_PER_GROUP)
+    jobs, parsed = {}, {}
+    for fname in sorted(os.listdir(rtp_dir)):
+        if not fname.endswith(".txt") or (only and fname[:-4] not in only):
+            continue
+        servers = fastest.get(fname[:-4])
+        if not servers:
+            continue
+        with open(os.path.join(rtp_dir, fname), encoding="utf-8") as f:
+            parsed[fname] = parse([x.strip() for x in f if x.strip()])
+        jobs[fname] = (servers, list(dict.fromkeys(path for _, path, _ in parsed[fname])))
+    total = sum(len(paths) for _, paths in jobs.values())
+    print(f"📡 组播验证：{len(jobs)} 个省份运营商有已验证服务器，共 {total} 个组播"
+          f"（每组最多 {SERVERS_PER_GROUP} 台服务器，单台并发 {PER_SERVER_LIMIT}）")
+    metrics.set_value("regions", len(jobs))
+    metrics.set_value("groups", total)
+
+    results = asyncio.run(verify_all(jobs, deadline))
+    now = int(time.time())
+    checked = live = lines_in = lines_out = 0
+    for fname, res in results.items():
+        groups = parsed[fname]
+        lines_in += len(groups)
+        if res and not any(res.values()):
+            # 一个都不通多半是选的服务器当时不可用，不据此删组播
+            print(f"⚠️ {fname[:-4]}：{len(res)} 个组播全部不通，疑似服务器问题，保留原列表")
+            lines_out += len(groups)
+            continue
+        state = load_state(fname, verified_dir)
+        names = {path: name for name, path, _ in groups}
+        for path, ok in res.items():
+            st = state.setdefault(path, {"name": names[path], "last_ok": None, "last_checked": None})
+            st["last_checked"] = now
+            if ok:
+                st["last_ok"] = now
+        # 已从 rtp/ 删掉的组播不再记录
+        state = {path: st for path, st in state.items() if path in names}
+        kept = prune(groups, state, now)
+        with open(os.path.join(verified_dir, fname), "w", encoding="utf-8") as f:
+            f.writelines(line + "\n" for line in kept)
+        save_state(fname, state, verified_dir)
+        ok_count = sum(res.values())
+        checked += len(res)
+        live += ok_count
+        lines_out += len(kept)
+        print(f"✅ {fname[:-4]:10} 测了 {len(res):4}/{len(jobs[fname][1]):<4} 个组播，有流 {ok_count:4} 个，"
+              f"精简后 {len(groups)} -> {len(kept)} 行")
+    metrics.set_value("checked", checked)
+    metrics.set_value("live", live)
+    metrics.set_value("lines_in", lines_in)
+    metrics.set_value("lines_out", lines_out)
+    print(f"🎯 组播验证完成：有流 {live}/{checked}，rtp 行数 {lines_in} -> {lines_out}")
+    return lines_out
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="用已验证服务器逐个验证 rtp/ 里的组播，写出精简列表")
+    parser.add_argument("names", nargs="*", help="只验证这些省份运营商（如 四川电信），默认全部")
+    parser.add_argument("--deadline", type=float, default=VERIFY_DEADLINE)
+    args = parser.parse_args()
+    with metrics.stage("rtp_verify"):
+        run(set(args.names) or None, deadline=args.deadline)
@@ -1,23 +1,31 @@
 import os
 import re
-import socket
 import urllib3
-from concurrent.futures import ThreadPoolExecutor
+
+import channel_names
+import metrics
+import rtp_verify
+import server_registry
+import tcp_scan
 
 # 1. 屏蔽 SSL 警告（虽然本地读取用不到，但保留以防万一）
 urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
 
 # --- 配置区 ---
-# 修正：直接指向本地库路径。假设脚本在 py/ 文件夹下。
 # 使用相对路径，确保在 GitHub Action 运行环境（根目录）下能找到。
-LOCAL_IP_FILE = "ip/重庆市联通.txt"
-LOCAL_RTP_FILE = "rtp/四川电信.txt"
+IP_DIR = "ip"
+RTP_DIR = "rtp"
+# 每组：用 ip/<ip>.txt 里的服务器转发 rtp/<rtp>.txt 里的组播，生成 test/<output>；
+# 所有组的服务器在一次 TCP 扫描里一起测
+SCAN_PAIRS = [
+    {"ip": "重庆市联通", "rtp": "四川电信", "output": "sc_telecom.m3u"},
+]
 LOGO_PREFIX = "https://gcore.jsdelivr.net/gh/kenye201/TVlog/img/"
+MAX_SERVERS = 10         # 每组最多取 RTT 最小的多少个可连接服务器，防止文件过大
 
-# 输出路径：项目根目录下的 test/sc_telecom.m3u
+# 输出路径：项目根目录下的 test/
 BASE_DIR = os.getcwd() 
 OUTPUT_DIR = os.path.join(BASE_DIR, "test")
-OUTPUT_FILE = os.path.join(OUTPUT_DIR, "sc_telecom.m3u")
 
 def read_local_file(file_path):
     """读取本地文件内容"""
@@ -31,52 +39,8 @@ def read_local_file(file_path):
         print(f"读取文件失败: {file_path}, 错误: {e}")
         return ""
 
-def check_port(server):
-    """探测单个端口存活"""
-    try:
-        host, port = server.split(':')
-        with socket.create_connection((host, int(port)), timeout=1.0):
-            return server
-    except:
-        return None
-
-def main():
-    # 自动创建 test 目录
-    if not os.path.exists(OUTPUT_DIR):
-        os.makedirs(OUTPUT_DIR)
-        print(f"📁 已创建目录: {OUTPUT_DIR}")
-
-    print("🚀 开始读取本地资源并扫描 (多线程模式)...")
-    
-    # 修改：改为从本地读取
-    ips_raw = read_local_file(LOCAL_IP_FILE)
-    rtps_raw = read_local_file(LOCAL_RTP_FILE)
-
-    if not ips_raw or not rtps_raw:
-        print("❌ 核心本地数据读取失败。请检查文件路径是否正确。")
-        return
-
-    # 提取 IP:PORT 格式
-    ip_list = sorted(list(set(re.findall(r'(\d+\.\d+\.\d+\.\d+:\d+)', ips_raw))))
-    print(f"📊 找到待测服务器: {len(ip_list)} 个")
-
-    # 多线程扫描
-    print(f"🔍 正在扫描端口 (并发数: 20)...")
-    alive_servers = []
-    with ThreadPoolExecutor(max_workers=20) as executor:
-        results = list(executor.map(check_port, ip_list))
-        for res in results:
-            if res:
-                print(f" [√] 在线: {res}")
-                alive_servers.append(res)
-                if len(alive_servers) >= 10: # 找到10个存活的就停下，防止文件过大
-                    break
-    
-    if not alive_servers:
-        print("❌ 未发现存活服务器，无法生成 M3U。")
-        return
-
-    # 频道解析
+def parse_channels(rtps_raw):
+    """rtp 文件 -> [{name, rtp, logo, is_4k}]"""
     channels = []
     for line in rtps_raw.split('\n'):
         line = line.strip()
@@ -90,24 +54,67 @@ def main():
                 channels.append({
                     "name": name,
                     "rtp": clean_rtp,
-                    "logo": f"{LOGO_PREFIX}{name}.png",
+                    "logo": f"{LOGO_PREFIX}{channel_names.logo_key(name)}.png",
                     "is_4k": "4K" in name.upper()
                 })
+    return channels
 
-    # 生成 M3U 内容
+def write_m3u(path, servers, channels, group_name, group_4k):
     m3u_content = '#EXTM3U x-tvg-url="https://live.fanmingming.cn/e.xml"\n\n'
-    for idx, server in enumerate(alive_servers, 1):
+    for idx, server in enumerate(servers, 1):
         for chan in channels:
-            group_prefix = "四川4K-" if chan['is_4k'] else "四川电信"
+            group_prefix = group_4k if chan['is_4k'] else group_name
             group_title = f"{group_prefix}{idx}"
             
             m3u_content += f'#EXTINF:-1 tvg-name="{chan["name"]}" tvg-logo="{chan["logo"]}" group-title="{group_title}",{chan["name"]}\n'
             m3u_content += f'http://{server}/rtp/{chan["rtp"]}\n\n'
 
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+    with open(path, "w", encoding="utf-8") as f:
         f.write(m3u_content)
-    
-    print(f"✅ 完成！有效服务器 {len(alive_servers)} 个，结果存至 {OUTPUT_FILE}")
+
+def main():
+    # 自动创建 test 目录
+    if not os.path.exists(OUTPUT_DIR):
+        os.makedirs(OUTPUT_DIR)
+        print(f"📁 已创建目录: {OUTPUT_DIR}")
+
+    print(f"🚀 开始读取本地资源（{len(SCAN_PAIRS)} 组）...")
+    jobs = []
+    for pair in SCAN_PAIRS:
+        ips_raw = read_local_file(os.path.join(IP_DIR, pair["ip"] + ".txt"))
+        rtps_raw = read_local_file(rtp_verify.source_path(pair["rtp"] + ".txt", RTP_DIR))
+        if not ips_raw or not rtps_raw:
+            print(f"❌ {pair['ip']} / {pair['rtp']} 本地数据读取失败，跳过该组。")
+            continue
+        # 提取 IP:PORT 格式
+        ip_list = sorted(set(re.findall(r'(\d+\.\d+\.\d+\.\d+:\d+)', ips_raw)))
+        print(f"📊 {pair['ip']} -> {pair['rtp']}：找到待测服务器 {len(ip_list)} 个")
+        jobs.append((pair, ip_list, parse_channels(rtps_raw)))
+
+    # 所有组的服务器一次性 asyncio 扫描，拿到每个目标的 RTT
+    targets = sorted({ip for _, ip_list, _ in jobs for ip in ip_list})
+    print(f"🔍 正在扫描端口（共 {len(targets)} 个，并发 {tcp_scan.SCAN_CONCURRENCY}）...")
+    rtts = tcp_scan.scan(targets)
+    alive_total = sum(rtt is not None for rtt in rtts.values())
+    metrics.set_value("servers", len(targets))
+    metrics.set_value("alive", alive_total)
+
+    lines_out = 0
+    for pair, ip_list, channels in jobs:
+        alive = sorted((ip for ip in ip_list if rtts.get(ip) is not None), key=lambda ip: rtts[ip])
+        alive_servers = sorted(alive[:MAX_SERVERS])
+        for server in alive_servers:
+            print(f" [√] 在线: {server} ({rtts[server]:.0f}ms)")
+        if not alive_servers:
+            print(f"❌ {pair['ip']} 未发现存活服务器，无法生成 {pair['output']}。")
+            continue
+        province, _ = server_registry.split_group(pair["rtp"])
+        output_file = os.path.join(OUTPUT_DIR, pair["output"])
+        write_m3u(output_file, alive_servers, channels, pair["rtp"], f"{province}4K-")
+        lines_out += len(alive_servers) * len(channels)
+        print(f"✅ 完成！有效服务器 {len(alive_servers)} 个，结果存至 {output_file}")
+    metrics.set_value("lines_out", lines_out)
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("scan_sichuan"):
+        main()
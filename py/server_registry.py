@@ -0,0 +1,251 @@
+import os
+import sqlite3
+import threading
+import time
+
+# ===============================
+# 配置区
+# 两个库分属两个工作流，各自缓存、互不覆盖：
+#   servers.db    服务器登记、延迟探测历史与 ip/*.txt 视图，只由 ip.yml（AmJiB.py / discover.py）读写
+#   throughput.db 测速吞吐历史与调度评分（scores），只由 zubo.yml（speed_filter.py）读写
+REGISTRY_DB = os.environ.get("REGISTRY_DB", "py/servers.db")
+THROUGHPUT_DB = os.environ.get("THROUGHPUT_DB", "py/throughput.db")
+IP_DIR = "ip"
+ISP_SUFFIXES = ("电信", "联通", "移动")
+HISTORY_LIMIT = 20      # 每个服务器保留最近多少条探测记录
+SCORE_ALPHA = 0.3       # 测速评分 EWMA 的平滑系数（越大越看重最近一次）
+SCORE_HALF_LIFE = 24 * 3600   # 有效样本数的半衰期：每次测试前先按距上次测试的时间衰减
+# ===============================
+
+_lock = threading.Lock()
+_conns = {}
+
+
+def _db(path=None):
+    """path 为空时打开服务器注册表 REGISTRY_DB；两个库表结构相同，各用各的表"""
+    path = path or REGISTRY_DB
+    conn = _conns.get(path)
+    if conn is None:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        conn = _conns[path] = sqlite3.connect(path, check_same_thread=False)
+        conn.executescript(
+            "CREATE TABLE IF NOT EXISTS servers ("
+            " ip_port TEXT PRIMARY KEY, province TEXT, isp TEXT,"
+            " first_seen REAL, last_seen REAL, last_probe_at REAL, last_probe_ok INTEGER);"
+            "CREATE TABLE IF NOT EXISTS probes ("
+            " ip_port TEXT NOT NULL, ts REAL NOT NULL, ok INTEGER,"
+            " latency_ms REAL, throughput REAL);"
+            "CREATE INDEX IF NOT EXISTS idx_probes_ip ON probes (ip_port, ts);"
+            "CREATE INDEX IF NOT EXISTS idx_servers_group ON servers (province, isp);"
+            "CREATE TABLE IF NOT EXISTS scores ("
+            " ip_port TEXT PRIMARY KEY, ewma_tput REAL, ewma_ok REAL, tests INTEGER, last_tested REAL);"
+            "CREATE TABLE IF NOT EXISTS sweeps ("
+            " block TEXT NOT NULL, port INTEGER NOT NULL, swept_at REAL, hits INTEGER,"
+            " PRIMARY KEY (block, port));"
+        )
+        conn.commit()
+    return conn
+
+
+def split_group(name):
+    """'四川电信' -> ('四川', '电信')，无法识别运营商返回 (name, '')"""
+    for suffix in ISP_SUFFIXES:
+        if name.endswith(suffix):
+            return name[:-len(suffix)], suffix
+    return name, ""
+
+
+def upsert(entries, seen_at=None):
+    """批量登记 [(ip_port, province, isp)]：新地址写 first_seen，已有地址刷新 last_seen 与归属"""
+    now = seen_at or time.time()
+    rows = [(ip_port, province, isp, now, now) for ip_port, province, isp in entries]
+    with _lock:
+        _db().executemany(
+            "INSERT INTO servers (ip_port, province, isp, first_seen, last_seen) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT(ip_port) DO UPDATE SET "
+            " province = excluded.province, isp = excluded.isp, last_seen = excluded.last_seen",
+            rows,
+        )
+        _db().commit()
+    return len(rows)
+
+
+def record_probes(results, probed_at=None, path=None):
+    """批量记录探测结果 [(ip_port, ok, latency_ms, throughput)]；测速结果传 path=THROUGHPUT_DB"""
+    now = probed_at or time.time()
+    rows = [(ip_port, now, int(bool(ok)), latency, throughput) for ip_port, ok, latency, throughput in results]
+    with _lock:
+        db = _db(path)
+        db.executemany(
+            "INSERT INTO probes (ip_port, ts, ok, latency_ms, throughput) VALUES (?, ?, ?, ?, ?)", rows
+        )
+        db.executemany(
+            "UPDATE servers SET last_probe_at = ?, last_probe_ok = ? WHERE ip_port = ?",
+            [(now, ok, ip_port) for ip_port, _, ok, _, _ in rows],
+        )
+        # 只保留每个服务器最近 HISTORY_LIMIT 条记录
+        db.executemany(
+            "DELETE FROM probes WHERE ip_port = ? AND rowid NOT IN ("
+            " SELECT rowid FROM probes WHERE ip_port = ? ORDER BY ts DESC LIMIT ?)",
+            [(ip_port, ip_port, HISTORY_LIMIT) for ip_port in {r[0] for r in rows}],
+        )
+        db.commit()
+
+
+def record_probe(ip_port, ok, latency_ms=None, throughput=None):
+    record_probes([(ip_port, ok, latency_ms, throughput)])
+
+
+def load_scores():
+    """返回跨轮次的测速评分 {ip_port: {"ewma_tput", "ewma_ok", "tests", "last_tested"}}（存在 THROUGHPUT_DB）"""
+    with _lock:
+        return {ip_port: {"ewma_tput": tput, "ewma_ok": ok, "tests": tests, "last_tested": ts}
+                for ip_port, tput, ok, tests, ts in _db(THROUGHPUT_DB).execute(
+                    "SELECT ip_port, ewma_tput, ewma_ok, tests, last_tested FROM scores")}
+
+
+def update_scores(results, tested_at=None, alpha=SCORE_ALPHA, half_life=SCORE_HALF_LIFE):
+    """把本轮测速 [(ip_port, ok, throughput)] 折算进 EWMA 评分，首次测试直接取本次结果；
+    tests 存的是衰减后的有效样本数 n = n * 0.5^(间隔/半衰期) + 1，不会随测试次数无限增长"""
+    now = tested_at or time.time()
+    with _lock:
+        db = _db(THROUGHPUT_DB)
+        old = {ip_port: (tput, ok, tests, ts) for ip_port, tput, ok, tests, ts in db.execute(
+            "SELECT ip_port, ewma_tput, ewma_ok, tests, last_tested FROM scores")}
+        rows = []
+        for ip_port, ok, throughput in results:
+            tput, ok = throughput or 0.0, float(bool(ok))
+            prev = old.get(ip_port)
+            if prev:
+                decay = 0.5 ** (max(now - (prev[3] or now), 0) / half_life)
+                tput = alpha * tput + (1 - alpha) * prev[0]
+                ok = alpha * ok + (1 - alpha) * prev[1]
+                rows.append((ip_port, tput, ok, (prev[2] or 0) * decay + 1, now))
+            else:
+                rows.append((ip_port, tput, ok, 1.0, now))
+            old[ip_port] = rows[-1][1:]
+        db.executemany(
+            "INSERT OR REPLACE INTO scores (ip_port, ewma_tput, ewma_ok, tests, last_tested) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        db.commit()
+
+
+# 视图条件：未探测过、最近一次探测可用，或探测失败后又被重新发现
+_LIVE_CONDITION = "(last_probe_ok IS NULL OR last_probe_ok = 1 OR last_seen > last_probe_at)"
+
+
+def groups(live_only=True):
+    """返回 {'省份运营商': [ip_port, ...]}"""
+    sql = "SELECT province, isp, ip_port FROM servers"
+    if live_only:
+        sql += " WHERE " + _LIVE_CONDITION
+    sql += " ORDER BY province, isp, ip_port"
+    result = {}
+    with _lock:
+        for province, isp, ip_port in _db().execute(sql):
+            result.setdefault(f"{province}{isp}", []).append(ip_port)
+    return result
+
+
+def group_of():
+    """返回 {ip_port: '省份运营商'}（全部登记的服务器）"""
+    with _lock:
+        return {ip_port: f"{province}{isp}"
+                for ip_port, province, isp in _db().execute("SELECT ip_port, province, isp FROM servers")}
+
+
+def last_probes():
+    """返回 {ip_port: 上次探测是否可用}，从没探测过的为 None"""
+    with _lock:
+        return {ip_port: None if ok is None else bool(ok)
+                for ip_port, ok in _db().execute("SELECT ip_port, last_probe_ok FROM servers")}
+
+
+def verified():
+    """最近一次探测可用的服务器 {ip_port: (省份, 运营商)}"""
+    with _lock:
+        return {ip_port: (province, isp) for ip_port, province, isp in _db().execute(
+            "SELECT ip_port, province, isp FROM servers WHERE last_probe_ok = 1")}
+
+
+def fastest(limit):
+    """每个 '省份运营商' 最近一次探测可用、且最近一次成功延迟最低的 limit 个服务器 {name: [ip_port]}"""
+    with _lock:
+        rows = _db().execute(
+            "SELECT s.ip_port, s.province, s.isp, (SELECT p.latency_ms FROM probes p"
+            " WHERE p.ip_port = s.ip_port AND p.ok = 1 ORDER BY p.ts DESC LIMIT 1)"
+            " FROM servers s WHERE s.last_probe_ok = 1").fetchall()
+    result = {}
+    for ip_port, province, isp, latency in sorted(rows, key=lambda r: (r[3] is None, r[3] or 0, r[0])):
+        servers = result.setdefault(f"{province}{isp}", [])
+        if len(servers) < limit:
+            servers.append(ip_port)
+    return result
+
+
+def swept_since(ts):
+    """ts 之后扫过的 {(网段, 端口)}"""
+    with _lock:
+        return set(_db().execute("SELECT block, port FROM sweeps WHERE swept_at >= ?", (ts,)))
+
+
+def mark_swept(rows, swept_at=None):
+    """记录邻段扫描 [(网段, 端口, 新发现数)]"""
+    now = swept_at or time.time()
+    with _lock:
+        db = _db()
+        db.executemany("INSERT OR REPLACE INTO sweeps (block, port, swept_at, hits) VALUES (?, ?, ?, ?)",
+                       [(block, port, now, hits) for block, port, hits in rows])
+        db.commit()
+
+
+def history(ip_port, limit=HISTORY_LIMIT, path=None):
+    """返回最近的探测记录 [(ts, ok, latency_ms, throughput)]，新的在前；吞吐历史传 path=THROUGHPUT_DB"""
+    with _lock:
+        return _db(path).execute(
+            "SELECT ts, ok, latency_ms, throughput FROM probes WHERE ip_port = ? ORDER BY ts DESC LIMIT ?",
+            (ip_port, limit),
+        ).fetchall()
+
+
+def count():
+    with _lock:
+        return _db().execute("SELECT COUNT(*) FROM servers").fetchone()[0]
+
+
+def merge_from_dir(ip_dir=IP_DIR):
+    """每轮把仓库里的 ip/*.txt 合并进注册表：注册表里没有的地址补登记，已有地址的归属和探测记录不动。
+    缓存失效、或恢复到较旧的注册表时，已提交的地址不会因此丢失；返回新补登记的地址数"""
+    if not os.path.isdir(ip_dir):
+        return 0
+    now = time.time()
+    rows = []
+    for fname in sorted(os.listdir(ip_dir)):
+        if not fname.endswith(".txt"):
+            continue
+        province, isp = split_group(fname[:-4])
+        with open(os.path.join(ip_dir, fname), encoding="utf-8") as f:
+            rows.extend((line.strip(), province, isp, now, now) for line in f if line.strip())
+    with _lock:
+        before = _db().total_changes
+        _db().executemany(
+            "INSERT OR IGNORE INTO servers (ip_port, province, isp, first_seen, last_seen) VALUES (?, ?, ?, ?, ?)",
+            rows,
+        )
+        _db().commit()
+        return _db().total_changes - before
+
+
+def export_views(ip_dir=IP_DIR):
+    """把可用服务器按 省份运营商 导出为 ip/*.txt，返回 {分组: 写出的地址数}。
+    整组都不可用时保留上一次的文件不动（与原来只覆盖有可用地址的分组一致）：
+    一轮 TCP 预筛抖动、或整省短暂断网不会让该省从 ip/ 消失，第二阶段下一轮照常复测这些地址"""
+    os.makedirs(ip_dir, exist_ok=True)
+    written = {}
+    for name, ip_ports in groups(live_only=True).items():
+        with open(os.path.join(ip_dir, name + ".txt"), "w", encoding="utf-8") as f:
+            for ip_port in ip_ports:
+                f.write(ip_port + "\n")
+        written[name] = len(ip_ports)
+    return written
@@ -0,0 +1,218 @@
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+import playlist
+
+# ===============================
+# 配置区
+# 二进制快照：与 zubo.txt / livezubo.txt / live_full.txt 同名、后缀 .snap，流水线内部交换数据用，文本仍作为导出视图
+MAGIC = b"IPTVSNP1"
+VERSION = 1
+TABLES = ("category", "channel", "server", "path", "region")   # 每行 5 个 uint32，依次指向这些字符串表
+# ===============================
+
+_HEADER = struct.Struct("<8sIIqq")   # magic, version, 行数, 源文本大小, 源文本 mtime_ns
+_U32 = struct.Struct("<I")
+
+
+def snap_path(txt_path):
+    return os.path.splitext(txt_path)[0] + ".snap"
+
+
+def split_url(url):
+    """'http://1.2.3.4:4022/rtp/239.1.1.1:5140' -> ('1.2.3.4:4022', 'rtp/239.1.1.1:5140')；其他格式整条放在 path"""
+    if url.startswith("http://"):
+        server, sep, path = url[7:].partition("/")
+        if sep:
+            return server, path
+    return "", url
+
+
+def join_url(server, path):
+    return f"http://{server}/{path}" if server else path
+
+
+class SnapshotWriter:
+    """逐行登记 (分组, 频道, url, 归属)，字符串全部驻留为表下标，最后一次写出"""
+
+    def __init__(self):
+        self.tables = [{} for _ in TABLES]
+        self.rows = array("I")
+
+    def _intern(self, col, value):
+        table = self.tables[col]
+        idx = table.get(value)
+        if idx is None:
+            idx = table[value] = len(table)
+        return idx
+
+    def add(self, category, name, url, region=""):
+        server, path = split_url(url)
+        self.rows.extend((
+            self._intern(0, category), self._intern(1, name), self._intern(2, server),
+            self._intern(3, path), self._intern(4, region),
+        ))
+
+    def copy_rows(self, snap, start, count):
+        """从另一份快照整段复制第 start 行起的 count 行：按下标逐列换成本快照的下标，不解码、不逐行拆分"""
+        width = len(TABLES)
+        block = array("I", snap._rows[start * width:(start + count) * width])
+        for col in range(width):
+            old, table = block[col::width], snap.tables[col]
+            remap = {i: self._intern(col, table[i]) for i in set(old)}
+            block[col::width] = array("I", [remap[i] for i in old])
+        self.rows.extend(block)
+
+    def add_playlist(self, pl):
+        for ch in pl:
+            self.add(ch.category, ch.name, ch.url, ch.region)
+        return self
+
+    def __len__(self):
+        return len(self.rows) // len(TABLES)
+
+    def save(self, path, source=None):
+        """写出快照；source 为对应的文本导出，记录其大小与 mtime 供读取时判断是否过期"""
+        size = mtime = -1
+        if source and os.path.exists(source):
+            st = os.stat(source)
+            size, mtime = st.st_size, st.st_mtime_ns
+        rows = self.rows
+        if sys.byteorder != "little":
+            rows = array("I", rows)
+            rows.byteswap()
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, len(self), size, mtime))
+            for table in self.tables:
+                blobs = [s.encode("utf-8") for s in table]
+                offsets = array("I", [0])
+                for b in blobs:
+                    offsets.append(offsets[-1] + len(b))
+                if sys.byteorder != "little":
+                    offsets.byteswap()
+                f.write(_U32.pack(len(blobs)))
+                f.write(offsets.tobytes())
+                blob = b"".join(blobs)
+                f.write(blob + b"\0" * (-len(blob) % 4))   # 4 字节对齐，行数组可直接 cast
+            f.write(rows.tobytes())
+        os.replace(tmp, path)
+        return path
+
+
+class Snapshot:
+    """mmap 读取快照：字符串表各解码一次，行数据留在映射内按需迭代"""
+
+    def __init__(self, path):
+        self.path = path
+        self._rows = self._mm = None
+        self._file = open(path, "rb")
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            # 解析失败时所有指向映射的 memoryview 必须先释放，否则 mmap.close() 抛 BufferError
+            with memoryview(self._mm) as view:
+                self._load(view)
+        except BaseException:
+            self.close()
+            raise
+
+    def _load(self, view):
+        magic, version, self.count, self.src_size, self.src_mtime = _HEADER.unpack_from(view, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"不是有效的快照文件：{self.path}")
+        pos = _HEADER.size
+        self.tables = []
+        for _ in TABLES:
+            n = _U32.unpack_from(view, pos)[0]
+            pos += 4
+            offsets = array("I")
+            offsets.frombytes(view[pos:pos + 4 * (n + 1)])
+            if sys.byteorder != "little":
+                offsets.byteswap()
+            pos += 4 * (n + 1)
+            with view[pos:pos + offsets[-1]] as blob:
+                self.tables.append([str(blob[offsets[i]:offsets[i + 1]], "utf-8") for i in range(n)])
+            pos += offsets[-1] + (-offsets[-1] % 4)
+        size = 4 * len(TABLES) * self.count
+        if pos + size > len(view):
+            raise ValueError(f"快照文件不完整：{self.path}")
+        if sys.byteorder == "little":
+            self._rows = view[pos:pos + size].cast("I")
+        else:
+            rows = array("I")
+            rows.frombytes(view[pos:pos + size])
+            rows.byteswap()
+            self._rows = rows
+
+    def close(self):
+        if isinstance(self._rows, memoryview):
+            self._rows.release()
+        self._rows = None
+        if self._mm is not None:
+            self._mm.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.count
+
+    def is_fresh(self, source):
+        """快照是否与文本导出一致（大小和 mtime 都相同）"""
+        if not source or not os.path.exists(source):
+            return False
+        st = os.stat(source)
+        return st.st_size == self.src_size and st.st_mtime_ns == self.src_mtime
+
+    def rows(self):
+        """逐行产出 (分组, 频道, 服务器, 路径, 归属)，字符串均为驻留表里的同一对象"""
+        cats, names, servers, paths, regions = self.tables
+        r = self._rows
+        for i in range(0, len(TABLES) * self.count, len(TABLES)):
+            yield cats[r[i]], names[r[i + 1]], servers[r[i + 2]], paths[r[i + 3]], regions[r[i + 4]]
+
+    def to_playlist(self, keep=None):
+        """还原为 Playlist；keep(name, url带$归属) 与 playlist.parse_txt 的同名参数一致"""
+        pl = playlist.Playlist()
+        for category, name, server, path, region in self.rows():
+            url = join_url(server, path)
+            if keep and not keep(name, f"{url}${region}" if region else url):
+                continue
+            pl.add(name, url, category, region)
+        return pl
+
+
+def open_fresh(txt_path):
+    """打开 txt 对应的快照；不存在、损坏或比文本旧时返回 None（调用方回退到解析文本）"""
+    path = snap_path(txt_path)
+    if not os.path.exists(path):
+        return None
+    try:
+        snap = Snapshot(path)
+    except (OSError, ValueError, IndexError, struct.error):
+        return None
+    if not snap.is_fresh(txt_path):
+        snap.close()
+        return None
+    return snap
+
+
+def load_playlist(txt_path, **parse_kwargs):
+    """优先从新鲜的快照构建 Playlist，否则解析文本"""
+    snap = open_fresh(txt_path)
+    if snap is not None:
+        with snap:
+            return snap.to_playlist(parse_kwargs.get("keep"))
+    return playlist.load_txt(txt_path, **parse_kwargs)
+
+
+def save_playlist(pl, txt_path):
+    """为已经写好的文本导出生成同名快照"""
+    return SnapshotWriter().add_playlist(pl).save(snap_path(txt_path), source=txt_path)
@@ -1,12 +1,22 @@
 import os
-import re
 import time
 import requests
-import concurrent.futures
 import sys
 import random
 import functools
 
+import channel_names
+import geo_cache
+import metrics
+import playlist
+import probe_journal
+import probe_scheduler
+import server_registry
+import snapshot
+import tcp_scan
+import throughput
+import ts_analyzer
+
 # 强制实时刷新输出
 print = functools.partial(print, flush=True)
 
@@ -19,35 +29,56 @@ BLACKLIST_FILE = "py/blacklist.txt"
 
 CHECK_COUNT = 3      
 CHECK_TIMEOUT = 10   
-MIN_PEAK_REQUIRED = 0.50  
+MIN_PEAK_REQUIRED = 0.50  # 持续速率门槛（MB/s，滑动窗口中位数）
+MAX_WORKERS = 32     # 归属地在测速前批量查询，测速并发不再受 ip-api 限流约束
+STREAM_CHECK = True  # 用 ts_analyzer 校验收到的数据确实是带音视频的 TS 流
+# 可持续性检查：从 PCR 推算频道标称码率，持续速率达不到码率或模拟播放出现断流的服务器不入选
+SUSTAIN_CHECK = True
+SUSTAIN_SECONDS = 5.0     # 至少读取多少秒再判断（抵消 udpxy 起始突发）
+MIN_HEADROOM = -0.05      # 持续速率相对标称码率的最低余量（直播流按码率下发，留 5% 估算误差）
+MAX_UNDERRUNS = 0         # 允许的模拟断流次数
+# 自适应调度：按跨轮次评分（throughput.db 的 scores 表）只复测新的、边缘的或太久没测的服务器
+SCHEDULE_MODE = os.environ.get("SCHEDULE_MODE", "adaptive")   # "full" 为每轮全部重测
+PROBE_BUDGET = int(os.environ.get("PROBE_BUDGET", "0"))        # 每轮最多测多少个服务器，0 为不限
+SCORE_HALF_LIFE = 24 * 3600   # 评分置信度半衰期：一天没测，有效样本数减半
+SCORE_CONFIDENT = 3.0         # 有效样本数达到此值才允许跳过
+SCORE_MAX_SKIP_AGE = 6 * 3600 # 无论评分多高，超过此时长（秒）没测的服务器本轮必测，失效的服务器最多在结果里留这么久
+SCORE_GOOD = 0.9              # 合格率 EWMA 高于此值且速率留有余量 -> 稳定可用
+SCORE_BAD = 0.1               # 合格率 EWMA 低于此值 -> 稳定不可用
+SCORE_MARGIN = 0.2            # 稳定可用要求 EWMA 速率高出门槛 20%
+# 测速模式："sustained" 分别测连接/首字节/滑动窗口持续吞吐；"legacy" 为旧版 1MB 单次计时
+SPEED_MODE = os.environ.get("SPEED_MODE", "sustained")
+# 测速结果边完成边写入 py/journal_speed_filter.jsonl；任务被取消后，多久以内的结果下次直接复用（秒）
+JOURNAL_TTL = 2 * 3600
+# 截止时间模式：测速的墙钟预算（秒），0 为不限。设置后按期望价值排序、自适应调节并发，
+# 到点停止并用已测完的结果生成输出，没测的沿用历史评分
+PROBE_DEADLINE = float(os.environ.get("PROBE_DEADLINE", "0"))
+TCP_PREFILTER = True      # 测速前先用 tcp_scan 做一轮 TCP 连接预筛，连不上的本轮不测
 
 # 屏蔽名单配置
 BLOCK_PROVINCES = ["Shanghai", "Jiangsu", "Zhejiang", "Guangdong"] # 江浙沪广
 BLOCK_ISP = "China Telecom" # 电信
 
-def get_ip_info(ip):
-    """查询 IP 归属地和运营商"""
-    try:
-        # 使用 ip-api.com (免费额度每分钟45次，并行测速时建议加少量延迟或限制并发)
-        # fields=status,message,regionName,isp
-        response = requests.get(f"http://ip-api.com/json/{ip}?fields=status,regionName,isp", timeout=5).json()
-        if response.get("status") == "success":
-            return response.get("regionName"), response.get("isp")
-    except:
-        pass
-    return None, None
-
-def is_blocked(ip):
-    """判断是否属于 江浙沪广电信"""
-    # 提取纯 IP (去掉端口)
-    pure_ip = ip.split(':')[0]
-    region, isp = get_ip_info(pure_ip)
-    
+def block_reason(region, isp):
+    """判断是否属于 江浙沪广电信，命中返回原因，否则返回 None"""
     if region and isp:
         # 判断省份是否在屏蔽名单，且运营商包含“Telecom”或“电信”
         if region in BLOCK_PROVINCES and ("Telecom" in isp or "电信" in isp):
-            return True, f"{region} {isp}"
-    return False, None
+            return f"{region} {isp}"
+    return None
+
+def geo_prefilter(ip_ports):
+    """测速前批量查询全部服务器归属地，返回 {ip_port: 屏蔽原因}"""
+    hosts = {ip_port: ip_port.split(':')[0] for ip_port in ip_ports}
+    infos = geo_cache.lookup_many(hosts.values())
+    blocked = {}
+    for ip_port, host in hosts.items():
+        data = infos.get(host)
+        if data and data.get("status") == "success":
+            reason = block_reason(data.get("regionName"), data.get("isp"))
+            if reason:
+                blocked[ip_port] = reason
+    return blocked
 
 def load_blacklist():
     if os.path.exists(BLACKLIST_FILE):
@@ -61,37 +92,107 @@ def save_to_blacklist(ip, reason=""):
         f.write(f"{ip}{comment}\n")
 
 def get_realtime_speed(url):
+    """测速并返回 throughput.measure 的结果；不可播放时 ok 为 False，
+    可持续性结论写在 sustain / sustainable 两个键里"""
+    if SPEED_MODE == "legacy":
+        return get_legacy_speed(url)
+    m = throughput.measure(url, min_seconds=SUSTAIN_SECONDS if SUSTAIN_CHECK else throughput.MIN_SECONDS)
+    m["sustainable"] = True
+    if not m["ok"]:
+        return m
+    report = ts_analyzer.analyze(m["head"]) if (STREAM_CHECK or SUSTAIN_CHECK) else None
+    if STREAM_CHECK and not report["playable"]:
+        m["ok"] = False
+        m["error"] = "非 TS 流"
+        return m
+    if SUSTAIN_CHECK:
+        m["sustain"] = throughput.sustainability(m, report["pcr_bitrate"])
+        if m["sustain"]["headroom"] is not None:
+            m["sustainable"] = (m["sustain"]["headroom"] >= MIN_HEADROOM
+                                and m["sustain"]["underruns"] <= MAX_UNDERRUNS)
+    return m
+
+def get_legacy_speed(url):
+    """旧版测速：整个请求 + 读 1MB 的耗时倒数，仅用于对比"""
+    m = throughput._empty(url)
     try:
         start_time = time.time()
         res = requests.get(url, timeout=CHECK_TIMEOUT, stream=True, headers={'User-Agent': 'vlc/3.0.8'})
-        if res.status_code != 200: return 0
+        if res.status_code != 200: return m
         
         chunk = res.raw.read(1024 * 1024) 
         duration = time.time() - start_time
-        return 1.0 / duration if duration > 0 else 0
+        if STREAM_CHECK and not ts_analyzer.is_playable(chunk): return m
+        speed = 1.0 / duration if duration > 0 else 0
+        m.update(ok=speed > 0.01, bytes=len(chunk), sustained=speed, peak=speed, average=speed, sustainable=True)
     except:
-        return 0
+        pass
+    return m
 
 def test_ip_group(ip_port, channels):
-    """测试某个IP下的随机频道"""
-    # --- 新增屏蔽逻辑 ---
-    blocked, reason = is_blocked(ip_port)
-    if blocked:
-        return ip_port, -1.0, False, f"屏蔽区域: {reason}"
-    # ------------------
-
+    """测试某个IP下的随机频道，返回 (ip_port, 持续速率, 是否存活, 是否跟得上码率, 说明)"""
     all_urls = [url for _, url in channels]
     test_targets = random.sample(all_urls, min(len(all_urls), CHECK_COUNT))
-    best_peak = 0.0
+    best = None
     alive_count = 0
 
     for url in test_targets:
-        speed = get_realtime_speed(url)
-        if speed > 0.01:
+        m = get_realtime_speed(url)
+        if m["ok"] and m["sustained"] > 0.01:
             alive_count += 1
-            if speed > best_peak: best_peak = speed
+            # 能持续播放的测量优先，其次比较持续速率
+            if best is None or (m["sustainable"], m["sustained"]) > (best["sustainable"], best["sustained"]): best = m
+
+    if best is None:
+        return ip_port, 0.0, False, False, ""
+    detail = (f"连接 {best['connect_ms'] or 0:4.0f}ms 首字节 {best['ttfb_ms'] or 0:5.0f}ms "
+              f"抖动 {best['jitter']:4.2f} 卡顿 {best['stalls']}")
+    sustain = best.get("sustain")
+    if sustain and sustain["headroom"] is not None:
+        detail += (f" | 码率 {sustain['nominal_mbps']:5.2f} Mbps 余量 {sustain['headroom']:+4.0%} "
+                   f"断流 {sustain['underruns']}")
+    return ip_port, best["sustained"], True, best["sustainable"], detail
+
+def plan_probes(ip_ports, scores, now=None):
+    """按评分决定本轮测谁：返回 (待测列表(按优先级), 跳过的稳定可用 {ip: 速率}, 跳过的稳定不可用 set)"""
+    now = now or time.time()
+    to_test, skip_good, skip_bad = [], {}, set()
+    for ip in ip_ports:
+        sc = scores.get(ip)
+        if SCHEDULE_MODE == "full" or not sc:
+            to_test.append(((0, 0.0, 0.0), ip))
+            continue
+        age = now - sc["last_tested"]
+        confidence = sc["tests"] * 0.5 ** (age / SCORE_HALF_LIFE)
+        if confidence >= SCORE_CONFIDENT and age < SCORE_MAX_SKIP_AGE:
+            if sc["ewma_ok"] >= SCORE_GOOD and sc["ewma_tput"] >= MIN_PEAK_REQUIRED * (1 + SCORE_MARGIN):
+                skip_good[ip] = sc["ewma_tput"]
+                continue
+            if sc["ewma_ok"] <= SCORE_BAD:
+                skip_bad.add(ip)
+                continue
+        # 新服务器最先，其次置信度低的、合格率接近 0.5 的
+        to_test.append(((1, confidence, abs(sc["ewma_ok"] - 0.5)), ip))
+    to_test.sort(key=lambda x: x[0])
+    return [ip for _, ip in to_test], skip_good, skip_bad
+
+def load_inputs(blacklist):
+    """两个输入合并成一个播放列表：同名分组合并，url 与 $归属 分开存放（测速用不带后缀的 url），去掉黑名单服务器"""
+    pl = playlist.Playlist()
+    for f_path in INPUT_FILES:
+        if os.path.exists(f_path):
+            playlist.load_txt(f_path, pl)
+    return pl.filter(lambda ch: ch.server and ch.server not in blacklist)
 
-    return ip_port, best_peak, (alive_count > 0), ""
+def write_result(pl, valid_ips):
+    """按分组、分组内按服务器聚合写出结果，只保留达标服务器，空分组不输出"""
+    result = pl.filter(lambda ch: ch.server in valid_ips).grouped_by_server()
+    result.updated = None
+    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
+        playlist.render_txt(result, f, skip_empty=True)
+    # 同时写出二进制快照，供 zubo.pgen_custom_list 直接读取
+    snapshot.save_playlist(result, OUTPUT_FILE)
+    return result
 
 def main():
     print(f"📅 任务启动时间: {time.strftime('%Y-%m-%d %H:%M:%S')}")
@@ -99,77 +200,152 @@ def main():
     if not os.path.exists(BLACKLIST_FILE):
         open(BLACKLIST_FILE, 'w').close()
 
-    blacklist = load_blacklist()
-    category_map = {}
-    
-    for f_path in INPUT_FILES:
-        if not os.path.exists(f_path): continue
-        current_category = "未分类"
-        with open(f_path, "r", encoding="utf-8") as f:
-            for line in f:
-                line = line.strip()
-                if not line or "#genre#" in line:
-                    if "#genre#" in line: current_category = line.split(",")[0].strip()
-                    continue
-                if "," in line and "http" in line:
-                    parts = line.split(",", 1)
-                    ch_name, url = parts[0].strip(), parts[1].strip()
-                    match = re.search(r'http://(.*?)/', url)
-                    if match:
-                        ip_port = match.group(1)
-                        if ip_port in blacklist: continue
-                        if current_category not in category_map: category_map[current_category] = {}
-                        if ip_port not in category_map[current_category]: category_map[current_category][ip_port] = []
-                        category_map[current_category][ip_port].append((ch_name, url))
-
-    unique_ips = {}
-    for cat_dict in category_map.values():
-        for ip, channels in cat_dict.items():
-            if ip not in unique_ips: unique_ips[ip] = channels
-
-    total_ips = len(unique_ips)
-    print(f"🚀 准备测试 {total_ips} 个服务器 (已启用江浙沪广电信屏蔽)")
-
-    valid_ips = {} 
+    pl = load_inputs(load_blacklist())
+    unique_ips = {ip: [(ch.name, ch.url) for ch in srv.channels] for ip, srv in pl.servers.items()}
+
+    # --- 预处理：批量归属地查询 + 江浙沪广电信屏蔽，命中的服务器不再打开任何流 ---
+    print(f"🌍 批量查询 {len(unique_ips)} 个服务器归属地...")
+    blocked = geo_prefilter(unique_ips)
+    for ip, reason in blocked.items():
+        print(f"🛡️  {ip:20} | 屏蔽区域: {reason}")
+        save_to_blacklist(ip, f"屏蔽区域: {reason}")
+    test_ips = {ip: chs for ip, chs in unique_ips.items() if ip not in blocked}
+
+    # --- 自适应调度：稳定可用/稳定不可用的服务器沿用历史结论，预算留给其余服务器 ---
+    try:
+        scores = server_registry.load_scores()
+    except Exception as e:
+        print(f"⚠️ 读取历史评分失败，本轮全部重测：{e}")
+        scores = {}
+    order, skip_good, skip_bad = plan_probes(test_ips, scores)
+    # 上一轮被取消时日志里留下的新鲜结果直接复用，不占本轮预算
+    journal = probe_journal.ProbeJournal("speed_filter", JOURNAL_TTL)
+    resumed = [tuple(journal.results[ip]) for ip in order if ip in journal.results]
+    order = [ip for ip in order if ip not in journal.results]
+    if PROBE_BUDGET and len(order) > PROBE_BUDGET:
+        deferred = order[PROBE_BUDGET:]
+        order = order[:PROBE_BUDGET]
+    else:
+        deferred = []
+    print(f"🧮 历史评分：跳过稳定可用 {len(skip_good)} 个、稳定不可用 {len(skip_bad)} 个，"
+          f"超出预算顺延 {len(deferred)} 个")
+    if resumed:
+        print(f"📒 从测速日志恢复 {len(resumed)} 个结果")
+
+    valid_ips = dict(skip_good)
+
+    def carry_over(ips):
+        """没测的服务器沿用上次评分的结论；从没测过的等下一轮"""
+        for ip in ips:
+            sc = scores.get(ip)
+            if sc and sc["ewma_ok"] >= 0.5 and sc["ewma_tput"] >= MIN_PEAK_REQUIRED:
+                valid_ips[ip] = sc["ewma_tput"]
+
+    carry_over(deferred)
+    # TCP 连接预筛：连不上的本轮判不合格（计入评分、不拉黑，下一轮再试），不占测速并发
+    rtts, unreachable = {}, []
+    if TCP_PREFILTER and order:
+        rtts = tcp_scan.scan(order)
+        unreachable = [ip for ip in order if rtts.get(ip) is None]
+        order = [ip for ip in order if rtts.get(ip) is not None]
+        print(f"🔌 TCP 预筛：{len(order)} 个可连接，{len(unreachable)} 个连不上")
+    # 截止时间模式：没测过的、上次合格的、带 CCTV1 的服务器先测，同等价值时 RTT 小的先测
+    deadline = None
+    if PROBE_DEADLINE:
+        def value(ip):
+            sc = scores.get(ip)
+            return probe_scheduler.expected_value(
+                sc and sc["ewma_ok"] >= 0.5, any(channel_names.normalize(name) == "CCTV1" for name, _ in test_ips[ip]))
+        order.sort(key=lambda ip: (-value(ip), rtts.get(ip, 0)))
+        deadline = probe_scheduler.Deadline(PROBE_DEADLINE)
+        print(f"⏱️ 截止时间模式：预算 {PROBE_DEADLINE:.0f} 秒，按期望价值排序并自适应调节并发")
+    test_ips = {ip: test_ips[ip] for ip in order}
+
+    total_ips = len(test_ips)
+    print(f"🚀 准备测试 {total_ips} 个服务器 (已屏蔽江浙沪广电信 {len(blocked)} 个)")
+
     new_dead_ips = []
+    slow_ips = []   # 存活但持续速率跟不上频道码率，不写入结果也不拉黑
+    probe_results = []
+    score_results = []
     done_count = 0
+    for ip in unreachable:
+        probe_results.append((ip, False, None, 0.0))
+        score_results.append((ip, False, 0.0))
+
+    tested = set()
+
+    def apply(result):
+        ip, peak, is_alive, sustainable, msg = result
+        tested.add(ip)
+        if ip not in journal.saved:
+            probe_results.append((ip, is_alive, None, peak))
+        if not is_alive:
+            new_dead_ips.append(ip)
+            save_to_blacklist(ip, "死链")
+        elif not sustainable:
+            slow_ips.append(ip)
+        elif peak >= MIN_PEAK_REQUIRED:
+            valid_ips[ip] = peak
+        if ip not in journal.saved:
+            score_results.append((ip, ip in valid_ips, peak))
+        metrics.observe("sustained_kbps", peak * 1024, (256, 512, 768, 1024, 1536, 2048, 4096, 8192))
 
-    # 注意：并发数不宜过高，否则 IP 查询 API 会封禁请求
-    with concurrent.futures.ThreadPoolExecutor(max_workers=3) as executor:
-        futures = {executor.submit(test_ip_group, ip, chs): ip for ip, chs in unique_ips.items()}
-        for future in concurrent.futures.as_completed(futures):
+    for result in resumed:
+        apply(result)
+
+    # 同一 /24 的并发由 probe_scheduler 限制，死链多的网段会短暂暂停
+    interrupted = False
+    try:
+        for (ip, _), result in probe_scheduler.run_threads(
+                lambda item: test_ip_group(*item), test_ips.items(), key=lambda item: item[0],
+                failed=lambda r: not r[2], deadline=deadline, limit=MAX_WORKERS):
             done_count += 1
-            ip, peak, is_alive, msg = future.result()
-            
-            if peak == -1.0:
-                print(f"[{done_count}/{total_ips}] 🛡️  {ip:20} | {msg}")
-                save_to_blacklist(ip, msg)
+            if result is None:
+                print(f"[{done_count}/{total_ips}] ⚠️ {ip:20} | 检测异常，本轮跳过")
                 continue
+            journal.record(ip, result)
+            ip, peak, is_alive, sustainable, msg = result
+            status_icon = ("✅" if sustainable else "🐢") if is_alive else "❌"
+            print(f"[{done_count}/{total_ips}] {status_icon} {ip:20} | 持续: {peak:5.2f} MB/s | {msg}")
+            apply(result)
+    except KeyboardInterrupt:
+        interrupted = True
+        print(f"⏸️ 测速被中断，已完成 {done_count}/{total_ips} 个，先用已有结果生成输出，下次从断点继续")
+    if deadline and deadline.hit:
+        print(f"⏰ 到达时间预算，已完成 {done_count}/{total_ips} 个，先用已有结果生成输出，下次从断点继续")
+    stopped = interrupted or bool(deadline and deadline.hit)
+    if stopped:
+        remaining = [ip for ip in order if ip not in tested]
+        carry_over(remaining)
+        print(f"♻️ 未测的 {len(remaining)} 个服务器沿用历史评分")
 
-            status_icon = "✅" if is_alive else "❌"
-            print(f"[{done_count}/{total_ips}] {status_icon} {ip:20} | 峰值: {peak:5.2f} MB/s")
-            
-            if not is_alive:
-                new_dead_ips.append(ip)
-                save_to_blacklist(ip, "死链")
-            elif peak >= MIN_PEAK_REQUIRED:
-                valid_ips[ip] = peak
+    # 测速结果写入吞吐库（本工作流独有，不动 ip.yml 的服务器注册表）；日志里已写过的不重复计分
+    try:
+        server_registry.record_probes(probe_results, path=server_registry.THROUGHPUT_DB)
+        server_registry.update_scores(score_results, half_life=SCORE_HALF_LIFE)
+        journal.mark_saved()
+    except Exception as e:
+        print(f"⚠️ 写入吞吐库失败：{e}")
 
-    # 写入结果 (保持原有逻辑)
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        for cat_name, ip_dict in category_map.items():
-            cat_content = []
-            for ip in ip_dict:
-                if ip in valid_ips:
-                    for ch_name, url in ip_dict[ip]:
-                        cat_content.append(f"{ch_name},{url}")
-            if cat_content:
-                f.write(f"{cat_name},#genre#\n")
-                for item in cat_content: f.write(f"{item}\n")
-                f.write("\n")
+    write_result(pl, valid_ips)
+    for key, value in (("servers", len(unique_ips)), ("blocked", len(blocked)), ("skipped_good", len(skip_good)),
+                       ("skipped_bad", len(skip_bad)), ("deferred", len(deferred)), ("tested", total_ips),
+                       ("valid", len(valid_ips)), ("dead", len(new_dead_ips)), ("slow", len(slow_ips)),
+                       ("resumed", len(resumed)), ("interrupted", int(interrupted)),
+                       ("tcp_unreachable", len(unreachable))):
+        metrics.set_value(key, value)
+    # 完整跑完才标记结束；被中断或到点时日志保留，下次运行接着测
+    if not stopped:
+        journal.complete()
+    journal.close()
 
     print("-" * 50)
+    print(f"🗂️ 归属地查询：缓存命中 {geo_cache.stats['cache_hits']} 次，API 调用 {geo_cache.stats['api_calls']} 次")
+    print(f"🐢 跟不上码率的服务器 {len(slow_ips)} 个，本轮未入选")
     print(f"✨ 任务结束！屏蔽且拉黑了探测到的江浙沪广电信源。")
 
 if __name__ == "__main__":
-    main()
+    probe_journal.install_signal_handlers()
+    with metrics.stage("speed_filter"):
+        main()
@@ -0,0 +1,214 @@
+import asyncio
+import concurrent.futures
+import subprocess
+import time
+from urllib.parse import urlsplit
+
+import metrics
+import ts_analyzer
+
+# ===============================
+# 配置区
+PROBE_TIMEOUT = 5            # 单个探测的截止时间（秒），包含连接、响应头和读包
+PROBE_PACKETS = 300          # 每个探测读取的 TS 包数量
+PROBE_CONCURRENCY = 1000     # 同时进行的探测数
+HEDGE_FANOUT = 2             # 对冲探测：同一服务器同时探测的代表频道数（udpxy 默认最多 3 个客户端，留一个给别人）
+HEDGE_DEADLINE = 10          # 对冲探测：单个服务器的总截止时间（秒）
+TS_PACKET_SIZE = ts_analyzer.TS_PACKET_SIZE
+USER_AGENT = "vlc/3.0.8"
+# ===============================
+
+
+def raise_nofile_limit():
+    """尽量把打开文件数软限制提到硬限制，避免上千个并发连接耗尽 fd"""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except Exception:
+        pass
+
+
+async def open_stream(url, timeout=PROBE_TIMEOUT):
+    """发送 HTTP/1.0 GET，返回 (status, headers, reader, writer)"""
+    parts = urlsplit(url)
+    host = parts.hostname
+    port = parts.port or 80
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    request = (
+        f"GET {path} HTTP/1.0\r\n"
+        f"Host: {parts.netloc}\r\n"
+        f"User-Agent: {USER_AGENT}\r\n"
+        f"Connection: close\r\n\r\n"
+    )
+    writer.write(request.encode("latin-1"))
+    await writer.drain()
+
+    status_line = await reader.readline()
+    try:
+        status = int(status_line.split(None, 2)[1])
+    except (IndexError, ValueError):
+        status = 0
+
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if not line or line in (b"\r\n", b"\n"):
+            break
+        if b":" in line:
+            k, v = line.decode("latin-1").split(":", 1)
+            headers[k.strip().lower()] = v.strip()
+    return status, headers, reader, writer
+
+
+async def read_body(reader, nbytes):
+    """读取至多 nbytes 字节，连接提前关闭时返回已收到的部分"""
+    try:
+        return await reader.readexactly(nbytes)
+    except asyncio.IncompleteReadError as e:
+        return e.partial
+
+
+def close_writer(writer):
+    try:
+        writer.close()
+    except Exception:
+        pass
+
+
+async def fetch_head(url, nbytes, timeout=PROBE_TIMEOUT):
+    """在截止时间内读取流的前 nbytes 字节，失败返回 None"""
+    async def _fetch():
+        status, _, reader, writer = await open_stream(url, timeout)
+        try:
+            if status != 200:
+                metrics.inc("probes_http_error")
+                return None
+            return await read_body(reader, nbytes)
+        finally:
+            close_writer(writer)
+
+    metrics.inc("probes_attempted")
+    start = time.monotonic()
+    try:
+        data = await asyncio.wait_for(_fetch(), timeout)
+    except asyncio.TimeoutError:
+        metrics.inc("probes_timeout")
+        return None
+    except asyncio.CancelledError:
+        metrics.inc("probes_cancelled")   # 对冲探测里被先成功的一路取消
+        raise
+    except Exception:
+        metrics.inc("probes_failed")
+        return None
+    if data:
+        metrics.inc("bytes_downloaded", len(data))
+        metrics.observe("probe_latency_ms", (time.monotonic() - start) * 1000)
+    return data
+
+
+async def probe_report(url, timeout=PROBE_TIMEOUT, packets=PROBE_PACKETS):
+    """读取若干 TS 包并返回 ts_analyzer 校验报告，连接失败返回 None"""
+    data = await fetch_head(url, packets * TS_PACKET_SIZE, timeout)
+    if not data:
+        return None
+    return ts_analyzer.analyze(data)
+
+
+async def probe(url, timeout=PROBE_TIMEOUT, packets=PROBE_PACKETS):
+    """进程内探测：打开 udpxy 流并读取若干 TS 包，判断是否可播放"""
+    report = await probe_report(url, timeout, packets)
+    if report:
+        metrics.inc("probes_ok" if report["playable"] else "probes_not_ts")
+    return bool(report) and report["playable"]
+
+
+async def probe_all(urls, concurrency=PROBE_CONCURRENCY, timeout=PROBE_TIMEOUT):
+    """并发探测一批 URL，返回 {url: bool}"""
+    sem = asyncio.Semaphore(concurrency)
+
+    async def _one(u):
+        async with sem:
+            return u, await probe(u, timeout)
+
+    results = await asyncio.gather(*(_one(u) for u in urls))
+    return dict(results)
+
+
+async def probe_first(urls, fanout=HEDGE_FANOUT, deadline=HEDGE_DEADLINE, timeout=PROBE_TIMEOUT):
+    """对冲探测：最多 fanout 个 URL 同时探测，失败一个补上下一个，
+    首个成功即取消其余；返回 (成功的 url 或 None, 耗时毫秒)"""
+    start = time.monotonic()
+    pending_urls = list(urls)
+    running = {}
+    end = start + deadline
+    try:
+        while pending_urls or running:
+            while pending_urls and len(running) < fanout:
+                u = pending_urls.pop(0)
+                running[asyncio.ensure_future(probe(u, timeout))] = u
+            remaining = end - time.monotonic()
+            if remaining <= 0:
+                break
+            done, _ = await asyncio.wait(running, timeout=remaining, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                break
+            for task in done:
+                u = running.pop(task)
+                if not task.cancelled() and task.exception() is None and task.result():
+                    return u, (time.monotonic() - start) * 1000
+        return None, (time.monotonic() - start) * 1000
+    finally:
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.gather(*running, return_exceptions=True)
+
+
+def check_first(urls, check, fanout=HEDGE_FANOUT, deadline=HEDGE_DEADLINE):
+    """线程版对冲探测（用于 ffprobe 等阻塞检测）：返回 (成功的 url 或 None, 耗时毫秒)；
+    已启动的阻塞检测无法中断，超时后放弃等待，由其自身超时结束"""
+    start = time.monotonic()
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=max(fanout, 1))
+    futures = {executor.submit(check, u): u for u in urls}
+    try:
+        for future in concurrent.futures.as_completed(futures, timeout=deadline):
+            try:
+                if future.result():
+                    return futures[future], (time.monotonic() - start) * 1000
+            except Exception:
+                pass
+    except concurrent.futures.TimeoutError:
+        pass
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+    return None, (time.monotonic() - start) * 1000
+
+
+def ffprobe_check(url, timeout=PROBE_TIMEOUT):
+    """ffprobe 兜底模式：与旧版 check_stream 行为一致，便于对比"""
+    metrics.inc("probes_attempted")
+    start = time.monotonic()
+    try:
+        result = subprocess.run(
+            ["ffprobe", "-v", "error", "-show_streams", "-i", url],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=timeout + 2
+        )
+    except subprocess.TimeoutExpired:
+        metrics.inc("probes_timeout")
+        return False
+    except Exception:
+        metrics.inc("probes_failed")
+        return False
+    ok = b"codec_type" in result.stdout
+    metrics.inc("probes_ok" if ok else "probes_failed")
+    if ok:
+        metrics.observe("probe_latency_ms", (time.monotonic() - start) * 1000)
+    return ok
@@ -0,0 +1,138 @@
+import argparse
+import asyncio
+import glob
+import json
+import os
+import re
+import time
+
+import metrics
+import probe_scheduler
+import stream_probe
+
+# ===============================
+# 配置区
+# asyncio TCP 连接扫描：只做三次握手并记录 RTT，作为 HTTP / 流探测之前的廉价预筛
+IP_DIR = "ip"
+CONNECT_TIMEOUT = 1.5        # 单个目标的连接时限（秒）
+SCAN_CONCURRENCY = 4000      # 同时进行的连接数
+SCAN_PER_SUBNET = 64         # 同一 /24 同时进行的连接数（connect 很轻，比流探测放宽）
+# 第一遍连不上的再以更长时限、更低并发重连一次：高并发下 SYN 排队、跨境或慢速主机会在第一遍超时，
+# 预筛的结论会作为不可用写进注册表，必须两遍都连不上才算
+RETRY_TIMEOUT = 5.0          # 重连的时限（秒），与流探测的时限相当
+RETRY_CONCURRENCY = 500
+RTT_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 1500)
+# ===============================
+
+IP_PORT_RE = re.compile(r"(\d+\.\d+\.\d+\.\d+:\d+)")
+
+
+async def connect_rtt(ip_port, timeout=CONNECT_TIMEOUT):
+    """连接一次 ip:port，成功返回握手耗时（毫秒），失败返回 None"""
+    host, port = ip_port.rsplit(":", 1)
+    metrics.inc("tcp_attempted")
+    t0 = time.perf_counter()
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, int(port)), timeout)
+    except asyncio.TimeoutError:
+        metrics.inc("tcp_timeout")
+        return None
+    except OSError:
+        metrics.inc("tcp_refused")
+        return None
+    rtt = (time.perf_counter() - t0) * 1000
+    writer.close()
+    metrics.inc("tcp_ok")
+    metrics.observe("tcp_rtt_ms", rtt, RTT_BUCKETS_MS)
+    return rtt
+
+
+async def scan_async(targets, timeout=CONNECT_TIMEOUT, limit=SCAN_CONCURRENCY, on_result=None):
+    """并发扫描 [ip:port]，返回 {ip:port: RTT 毫秒或 None}；on_result(ip_port, rtt) 可边扫边输出"""
+    stream_probe.raise_nofile_limit()
+    rtts = {}
+
+    async def _one(ip_port):
+        return await connect_rtt(ip_port, timeout)
+
+    def _done(ip_port, rtt):
+        rtts[ip_port] = rtt
+        if on_result:
+            on_result(ip_port, rtt)
+
+    # 每个目标只连一次，失败不做主机退避；同一 /24 的并发仍由 probe_scheduler 限制
+    await probe_scheduler.run_async(_one, list(dict.fromkeys(targets)), on_result=_done,
+                                    limit=limit, per_subnet=SCAN_PER_SUBNET)
+    return rtts
+
+
+def scan(targets, timeout=CONNECT_TIMEOUT, limit=SCAN_CONCURRENCY, retry_timeout=RETRY_TIMEOUT):
+    """同步入口：{ip:port: RTT 毫秒或 None}；retry_timeout 非 0 时第一遍失败的再重连一次"""
+    targets = list(targets)
+    if not targets:
+        return {}
+    rtts = asyncio.run(scan_async(targets, timeout, limit))
+    failed = [ip_port for ip_port, rtt in rtts.items() if rtt is None]
+    if retry_timeout and failed:
+        retried = asyncio.run(scan_async(failed, retry_timeout, min(limit, RETRY_CONCURRENCY)))
+        recovered = sum(rtt is not None for rtt in retried.values())
+        metrics.inc("tcp_retried", len(failed))
+        metrics.inc("tcp_recovered", recovered)
+        if recovered:
+            print(f"🔁 TCP 重连：第一遍连不上的 {len(failed)} 个中有 {recovered} 个第二遍连上")
+        rtts.update(retried)
+    return rtts
+
+
+def reachable(targets, timeout=CONNECT_TIMEOUT, limit=SCAN_CONCURRENCY, retry_timeout=RETRY_TIMEOUT):
+    """预筛：返回 (能连上的 {ip:port: RTT}，连不上的 [ip:port])"""
+    rtts = scan(targets, timeout, limit, retry_timeout)
+    return ({ip_port: rtt for ip_port, rtt in rtts.items() if rtt is not None},
+            [ip_port for ip_port, rtt in rtts.items() if rtt is None])
+
+
+def load_targets(ip_dir=IP_DIR):
+    """读取 ip/ 下全部 txt：{文件名（不含扩展名）: [ip:port]}"""
+    targets = {}
+    for path in sorted(glob.glob(os.path.join(ip_dir, "*.txt"))):
+        with open(path, encoding="utf-8") as f:
+            found = IP_PORT_RE.findall(f.read())
+        if found:
+            targets[os.path.splitext(os.path.basename(path))[0]] = list(dict.fromkeys(found))
+    return targets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="asyncio TCP 连接扫描 ip/ 下全部服务器")
+    parser.add_argument("--ip-dir", default=IP_DIR)
+    parser.add_argument("--timeout", type=float, default=CONNECT_TIMEOUT)
+    parser.add_argument("--concurrency", type=int, default=SCAN_CONCURRENCY)
+    parser.add_argument("--retry-timeout", type=float, default=RETRY_TIMEOUT, help="失败重连的时限，0 为不重连")
+    parser.add_argument("--out", help="把 {ip:port: RTT 毫秒或 null} 写入 JSON 文件")
+    args = parser.parse_args()
+
+    by_file = load_targets(args.ip_dir)
+    targets = [t for ts in by_file.values() for t in ts]
+    print(f"🔍 扫描 {len(by_file)} 个文件共 {len(set(targets))} 个 ip:port（并发 {args.concurrency}，"
+          f"超时 {args.timeout}s）...")
+    t0 = time.perf_counter()
+    rtts = scan(targets, args.timeout, args.concurrency, args.retry_timeout)
+    seconds = time.perf_counter() - t0
+    alive = sorted(rtt for rtt in rtts.values() if rtt is not None)
+    for name, ts in by_file.items():
+        ok = sum(rtts.get(t) is not None for t in ts)
+        print(f"  {name:16} {ok:5}/{len(ts):<5} 可连接")
+    if alive:
+        print(f"📶 RTT 中位 {alive[len(alive) // 2]:.1f}ms，P90 {alive[int(len(alive) * 0.9)]:.1f}ms")
+    print(f"✅ 可连接 {len(alive)}/{len(rtts)} 个，用时 {seconds:.2f}s（{len(rtts) / max(seconds, 1e-9):.0f} 个/秒）")
+    metrics.set_value("targets", len(rtts))
+    metrics.set_value("reachable", len(alive))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({t: None if r is None else round(r, 2) for t, r in rtts.items()}, f, ensure_ascii=False)
+        print(f"📝 结果写入 {args.out}")
+
+
+if __name__ == "__main__":
+    with metrics.stage("tcp_scan"):
+        main()
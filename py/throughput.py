@@ -0,0 +1,215 @@
+import socket
+import statistics
+import time
+from urllib.parse import urlsplit
+
+import metrics
+
+# ===============================
+# 配置区
+MEASURE_SECONDS = 8.0     # 单次测量最长读取时间
+MIN_SECONDS = 3.0         # 提前结束前至少读取的时间
+BUCKET = 0.25             # 统计桶宽度（秒）
+WINDOW_BUCKETS = 4        # 滑动窗口 = 4 个桶 = 1 秒
+STABLE_WINDOWS = 4        # 连续多少个窗口速率稳定即可提前结束
+STABLE_TOLERANCE = 0.10   # 稳定判定：窗口速率相对均值的偏差
+STALL_GAP = 0.5           # 两次收包间隔超过此值记一次卡顿
+HEAD_BYTES = 1024 * 1024  # 保留开头多少字节供 TS 校验
+PREBUFFER_SECONDS = 1.0   # 播放器起播前缓冲多少秒的内容（可持续性模拟用）
+CONNECT_TIMEOUT = 5
+RECV_SIZE = 64 * 1024
+USER_AGENT = "vlc/3.0.8"
+MB = 1024 * 1024
+# ===============================
+
+
+def _empty(url):
+    return {
+        "url": url, "ok": False, "status": 0, "error": "",
+        "connect_ms": None, "ttfb_ms": None, "bytes": 0, "elapsed": 0.0,
+        "sustained": 0.0, "peak": 0.0, "average": 0.0, "jitter": 0.0, "stalls": 0,
+        "early_stop": False, "head": b"", "timeline": [],
+    }
+
+
+def _window_rates(buckets):
+    """每个桶结尾处的滑动窗口速率（MB/s）"""
+    rates = []
+    for i in range(WINDOW_BUCKETS - 1, len(buckets)):
+        rates.append(sum(buckets[i - WINDOW_BUCKETS + 1:i + 1]) / (WINDOW_BUCKETS * BUCKET) / MB)
+    return rates
+
+
+def _is_stable(rates):
+    if len(rates) < STABLE_WINDOWS:
+        return False
+    recent = rates[-STABLE_WINDOWS:]
+    mean = sum(recent) / len(recent)
+    return mean > 0 and all(abs(r - mean) <= mean * STABLE_TOLERANCE for r in recent)
+
+
+def measure(url, duration=MEASURE_SECONDS, min_seconds=MIN_SECONDS, early_stop=True):
+    """分别测量连接耗时、首字节时间和持续吞吐（按实际收到的字节计算）"""
+    result = _empty(url)
+    metrics.inc("probes_attempted")
+    parts = urlsplit(url)
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+
+    t0 = time.monotonic()
+    try:
+        sock = socket.create_connection((parts.hostname, parts.port or 80), timeout=CONNECT_TIMEOUT)
+    except Exception as e:
+        result["error"] = f"connect: {e}"
+        metrics.inc("probes_timeout" if isinstance(e, socket.timeout) else "probes_failed")
+        return result
+    t_conn = time.monotonic()
+    result["connect_ms"] = (t_conn - t0) * 1000
+    t_first = None
+
+    try:
+        sock.sendall((
+            f"GET {path} HTTP/1.0\r\nHost: {parts.netloc}\r\n"
+            f"User-Agent: {USER_AGENT}\r\nConnection: close\r\n\r\n"
+        ).encode("latin-1"))
+
+        # 读响应头
+        raw = b""
+        while b"\r\n\r\n" not in raw:
+            sock.settimeout(max(CONNECT_TIMEOUT - (time.monotonic() - t_conn), 0.01))
+            data = sock.recv(RECV_SIZE)
+            if not data:
+                break
+            raw += data
+        header, _, body = raw.partition(b"\r\n\r\n")
+        try:
+            result["status"] = int(header.split(None, 2)[1])
+        except (IndexError, ValueError):
+            result["status"] = 0
+        if result["status"] != 200:
+            result["error"] = f"status {result['status']}"
+            metrics.inc("probes_http_error")
+            return result
+
+        # 读数据体：按 BUCKET 分桶统计，首字节时刻为计时起点
+        head = bytearray(body[:HEAD_BYTES])
+        total = len(body)
+        if body:
+            t_first = time.monotonic()
+            result["ttfb_ms"] = (t_first - t_conn) * 1000
+        buckets = [len(body)] if body else []
+        timeline = [(0.0, len(body))] if body else []
+        last_arrival = t_first
+        stalls = 0
+        deadline = t0 + CONNECT_TIMEOUT + duration
+
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            sock.settimeout(max(deadline - now, 0.01))
+            try:
+                data = sock.recv(RECV_SIZE)
+            except socket.timeout:
+                if t_first is not None and time.monotonic() - last_arrival > STALL_GAP:
+                    stalls += 1
+                break
+            if not data:
+                break
+            now = time.monotonic()
+            if t_first is None:
+                t_first = now
+                result["ttfb_ms"] = (now - t_conn) * 1000
+                deadline = now + duration
+            elif now - last_arrival > STALL_GAP:
+                stalls += 1
+            last_arrival = now
+
+            total += len(data)
+            if len(head) < HEAD_BYTES:
+                head += data[:HEAD_BYTES - len(head)]
+            offset = now - t_first
+            timeline.append((offset, len(data)))
+            idx = int(offset / BUCKET)
+            while len(buckets) <= idx:
+                buckets.append(0)
+            buckets[idx] += len(data)
+
+            if early_stop and offset >= min_seconds and _is_stable(_window_rates(buckets[:idx])):
+                result["early_stop"] = True
+                break
+    except Exception as e:
+        result["error"] = str(e)
+    finally:
+        sock.close()
+
+    metrics.observe("connect_ms", result["connect_ms"])
+    if t_first is None:
+        metrics.inc("probes_timeout" if not result["error"] or "timed out" in result["error"] else "probes_failed")
+        return result
+    elapsed = max(time.monotonic() - t_first, BUCKET)
+    # 只统计已完整结束的桶，避免最后半个桶拉低速率；末尾断流期间没有收包的桶按 0 补齐
+    n_full = max(int(elapsed / BUCKET), 1)
+    full = (buckets + [0] * (n_full - len(buckets)))[:n_full]
+    rates = _window_rates(full) or [sum(full) / (len(full) * BUCKET) / MB]
+    bucket_rates = [b / BUCKET / MB for b in full]
+
+    metrics.inc("probes_ok")
+    metrics.inc("bytes_downloaded", total)
+    metrics.inc("stalls", stalls)
+    metrics.observe("ttfb_ms", result["ttfb_ms"])
+    result.update(
+        ok=total > 0,
+        bytes=total,
+        elapsed=elapsed,
+        sustained=statistics.median(rates),
+        peak=max(rates),
+        average=total / elapsed / MB,
+        jitter=statistics.pstdev(bucket_rates) if len(bucket_rates) > 1 else 0.0,
+        stalls=stalls,
+        head=bytes(head),
+        timeline=timeline,
+    )
+    return result
+
+
+def sustainability(m, nominal_bps, prebuffer=PREBUFFER_SECONDS):
+    """按流的标称码率模拟播放器缓冲：起播前缓冲 prebuffer 秒，此后按码率消耗，
+    缓冲见底记一次断流并重新缓冲。返回 {nominal_mbps, delivery_mbps, headroom, underruns, startup_ms}"""
+    report = {"nominal_mbps": 0.0, "delivery_mbps": 0.0, "headroom": None, "underruns": 0, "startup_ms": None}
+    if not nominal_bps or not m["ok"]:
+        return report
+    rate = nominal_bps / 8.0   # 字节/秒
+    need = rate * prebuffer
+    delivered = played = 0.0
+    playing = False
+    last_t = 0.0
+    underruns = 0
+    for t, n in m["timeline"]:
+        if playing:
+            played_now = played + (t - last_t) * rate
+            if played_now > delivered:
+                underruns += 1
+                played = delivered
+                playing = False
+            else:
+                played = played_now
+        last_t = t
+        delivered += n
+        if not playing and delivered - played >= need:
+            playing = True
+            if report["startup_ms"] is None:
+                report["startup_ms"] = t * 1000
+    # 最后一个包之后到测量结束仍在播放：缓冲耗尽同样记一次断流
+    if playing and played + (m["elapsed"] - last_t) * rate > delivered:
+        underruns += 1
+
+    delivery_bps = m["sustained"] * MB * 8
+    report.update(
+        nominal_mbps=nominal_bps / 1e6,
+        delivery_mbps=delivery_bps / 1e6,
+        headroom=delivery_bps / nominal_bps - 1,
+        underruns=underruns,
+    )
+    return report
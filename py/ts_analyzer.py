@@ -0,0 +1,221 @@
+# ===============================
+# 配置区
+TS_PACKET_SIZE = 188
+TS_SYNC_BYTE = 0x47
+PCR_CLOCK = 27_000_000
+PCR_WRAP = (1 << 33) * 300
+NULL_PID = 0x1FFF
+MIN_SYNC_RATIO = 0.95      # 对齐包占比低于此值视为非 TS
+MIN_PACKETS = 100          # 至少收到多少个对齐的 TS 包才算可播放（服务器发几个包就断开的不算）
+MAX_CC_ERROR_RATE = 0.05   # 连续计数错误率高于此值视为不可播放
+
+VIDEO_STREAM_TYPES = {0x01, 0x02, 0x10, 0x1B, 0x24, 0x42, 0xD1, 0xEA}
+AUDIO_STREAM_TYPES = {0x03, 0x04, 0x0F, 0x11, 0x1C, 0x81, 0x82, 0x83, 0x84, 0x87}
+AUDIO_DESCRIPTOR_TAGS = {0x6A, 0x7A, 0x7B, 0x7C}   # stream_type 0x06 时的 AC-3/E-AC-3/DTS/AAC 描述符
+# ===============================
+
+
+def find_sync(view):
+    """返回连续三个同步字节对齐的起始偏移，找不到返回 -1"""
+    limit = min(len(view) - 2 * TS_PACKET_SIZE, TS_PACKET_SIZE)
+    for off in range(max(limit, 0)):
+        if (view[off] == TS_SYNC_BYTE
+                and view[off + TS_PACKET_SIZE] == TS_SYNC_BYTE
+                and view[off + 2 * TS_PACKET_SIZE] == TS_SYNC_BYTE):
+            return off
+    return -1
+
+
+def _payload_offset(view, pos):
+    """返回包内负载起始位置（相对包头），无负载返回 -1"""
+    afc = (view[pos + 3] >> 4) & 0x3
+    if not afc & 0x1:
+        return -1
+    if afc & 0x2:
+        start = 5 + view[pos + 4]
+    else:
+        start = 4
+    return start if start < TS_PACKET_SIZE else -1
+
+
+def _section(view, pos):
+    """取出单包内的 PSI section（跳过 pointer_field），返回 memoryview 或 None"""
+    start = _payload_offset(view, pos)
+    if start < 0:
+        return None
+    start += 1 + view[pos + start]
+    if start + 3 > TS_PACKET_SIZE:
+        return None
+    sec = view[pos + start:pos + TS_PACKET_SIZE]
+    length = ((sec[1] & 0x0F) << 8) | sec[2]
+    if 3 + length > len(sec):
+        return None
+    return sec[:3 + length]
+
+
+def parse_pat(sec):
+    """解析 PAT，返回 {program_number: pmt_pid}"""
+    programs = {}
+    end = len(sec) - 4   # 去掉 CRC32
+    for i in range(8, end - 3, 4):
+        program = (sec[i] << 8) | sec[i + 1]
+        pid = ((sec[i + 2] & 0x1F) << 8) | sec[i + 3]
+        if program != 0:
+            programs[program] = pid
+    return programs
+
+
+def parse_pmt(sec):
+    """解析 PMT，返回 {"pcr_pid": int, "streams": [(stream_type, pid, kind)]}"""
+    pcr_pid = ((sec[8] & 0x1F) << 8) | sec[9]
+    info_len = ((sec[10] & 0x0F) << 8) | sec[11]
+    i = 12 + info_len
+    end = len(sec) - 4
+    streams = []
+    while i + 5 <= end:
+        stype = sec[i]
+        pid = ((sec[i + 1] & 0x1F) << 8) | sec[i + 2]
+        es_len = ((sec[i + 3] & 0x0F) << 8) | sec[i + 4]
+        kind = None
+        if stype in VIDEO_STREAM_TYPES:
+            kind = "video"
+        elif stype in AUDIO_STREAM_TYPES:
+            kind = "audio"
+        elif stype == 0x06:
+            j, desc_end = i + 5, min(i + 5 + es_len, end)
+            while j + 2 <= desc_end:
+                if sec[j] in AUDIO_DESCRIPTOR_TAGS:
+                    kind = "audio"
+                    break
+                j += 2 + sec[j + 1]
+        streams.append((stype, pid, kind))
+        i += 5 + es_len
+    return {"pcr_pid": pcr_pid, "streams": streams}
+
+
+def _read_pcr(view, pos):
+    """读取包内 PCR（27MHz 单位），没有返回 None"""
+    if not (view[pos + 3] >> 4) & 0x2 or view[pos + 4] < 7:
+        return None
+    if not view[pos + 5] & 0x10:
+        return None
+    b = view[pos + 6:pos + 12]
+    base = (b[0] << 25) | (b[1] << 17) | (b[2] << 9) | (b[3] << 1) | (b[4] >> 7)
+    ext = ((b[4] & 0x01) << 8) | b[5]
+    return base * 300 + ext
+
+
+def analyze(data):
+    """分析一段 TS 字节流（零拷贝），返回校验报告 dict"""
+    view = memoryview(data)
+    report = {
+        "sync_offset": -1, "packets": 0, "sync_ratio": 0.0,
+        "pat": {}, "pmt": {}, "video_pids": [], "audio_pids": [],
+        "cc_errors": 0, "cc_error_rate": 0.0, "pcr_bitrate": 0.0,
+        "playable": False,
+    }
+    off = find_sync(view)
+    if off < 0:
+        return report
+    view = view[off:]
+    total = len(view) // TS_PACKET_SIZE
+    if not total:
+        return report
+    # 同步字节列：步长切片在 C 层完成，不逐包拷贝
+    syncs = view[:total * TS_PACKET_SIZE:TS_PACKET_SIZE].tobytes()
+    synced = total - len(syncs.replace(bytes([TS_SYNC_BYTE]), b""))
+    report.update(sync_offset=off, packets=total, sync_ratio=synced / total)
+
+    pat, pmt = {}, {}
+    pmt_pids = set()
+    last_cc = {}
+    cc_checked = cc_errors = 0
+    pid_seen = set()
+    pcr_samples = {}
+    pes_kinds = {}   # PAT/PMT 没读到时，根据 PES 头的 stream_id 判断音视频
+
+    for n in range(total):
+        pos = n * TS_PACKET_SIZE
+        if view[pos] != TS_SYNC_BYTE:
+            continue
+        b1 = view[pos + 1]
+        pid = ((b1 & 0x1F) << 8) | view[pos + 2]
+        if pid == NULL_PID or b1 & 0x80:   # 空包或传输错误包
+            continue
+        pid_seen.add(pid)
+        b3 = view[pos + 3]
+        afc = (b3 >> 4) & 0x3
+
+        # 连续计数：仅带负载的包递增，允许一次重复包，遇到 discontinuity 重置
+        if afc & 0x1:
+            cc = b3 & 0x0F
+            prev = last_cc.get(pid)
+            discontinuity = afc & 0x2 and view[pos + 4] and view[pos + 5] & 0x80
+            if prev is not None and not discontinuity:
+                cc_checked += 1
+                if cc != (prev + 1) & 0x0F and cc != prev:
+                    cc_errors += 1
+            last_cc[pid] = cc
+
+        if afc & 0x2:
+            pcr = _read_pcr(view, pos)
+            if pcr is not None:
+                samples = pcr_samples.setdefault(pid, [])
+                samples.append((pos, pcr))
+
+        if b1 & 0x40:   # payload_unit_start
+            if pid == 0 and not pat:
+                sec = _section(view, pos)
+                if sec is not None and sec[0] == 0x00:
+                    pat = parse_pat(sec)
+                    pmt_pids = set(pat.values())
+            elif pid in pmt_pids and pid not in pmt:
+                sec = _section(view, pos)
+                if sec is not None and sec[0] == 0x02:
+                    pmt[pid] = parse_pmt(sec)
+            elif pid not in pes_kinds:
+                start = _payload_offset(view, pos)
+                if 0 <= start <= TS_PACKET_SIZE - 4:
+                    p = pos + start
+                    if view[p] == 0 and view[p + 1] == 0 and view[p + 2] == 1:
+                        sid = view[p + 3]
+                        if 0xE0 <= sid <= 0xEF:
+                            pes_kinds[pid] = "video"
+                        elif 0xC0 <= sid <= 0xDF or sid == 0xBD:
+                            pes_kinds[pid] = "audio"
+
+    video, audio = [], []
+    pcr_pid = None
+    for info in pmt.values():
+        if pcr_pid is None:
+            pcr_pid = info["pcr_pid"]
+        for _, pid, kind in info["streams"]:
+            if kind == "video" and pid not in video:
+                video.append(pid)
+            elif kind == "audio" and pid not in audio:
+                audio.append(pid)
+
+    if not pmt:
+        video = [pid for pid, kind in pes_kinds.items() if kind == "video"]
+        audio = [pid for pid, kind in pes_kinds.items() if kind == "audio"]
+
+    samples = pcr_samples.get(pcr_pid) or next(iter(pcr_samples.values()), [])
+    if len(samples) >= 2:
+        (p0, c0), (p1, c1) = samples[0], samples[-1]
+        ticks = (c1 - c0) % PCR_WRAP
+        if ticks > 0 and p1 > p0:
+            report["pcr_bitrate"] = (p1 - p0) * 8 * PCR_CLOCK / ticks
+
+    cc_rate = cc_errors / cc_checked if cc_checked else 0.0
+    has_media = any(p in pid_seen for p in video + audio)
+    report.update(
+        pat=pat, pmt=pmt, video_pids=video, audio_pids=audio,
+        cc_errors=cc_errors, cc_error_rate=cc_rate,
+        playable=(report["packets"] >= MIN_PACKETS and report["sync_ratio"] >= MIN_SYNC_RATIO
+                  and has_media and cc_rate <= MAX_CC_ERROR_RATE),
+    )
+    return report
+
+
+def is_playable(data):
+    return analyze(data)["playable"]
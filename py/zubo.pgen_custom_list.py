@@ -1,40 +1,36 @@
 import os
 import re
 
+import convert_full_m3u
+import metrics
+import playlist
+import snapshot
+
 # --- 配置区 ---
 RTP_DIR = "rtp"
 # 目标改为 livezubo.txt
 INPUT_TXT = "py/livezubo.txt"  
 OUTPUT_TXT = "py/live_full.txt"
 
+_LIVE_RE = re.compile(r'http://([\d\.]+:\d+)/rtp/.*?\$([\u4e00-\u9fa5]+)')
+
 def get_live_servers():
-    """从 livezubo.txt 提取存活的 IP 和地区"""
-    servers = {} # {"湖北电信": {"58.50.205.3:4022", ...}}
+    """从 livezubo.txt 提取存活的 IP 和地区，返回 {"湖北电信": [ip_port, ...]}（按首次出现顺序）"""
+    servers = {}
     if not os.path.exists(INPUT_TXT):
         print(f"❌ 找不到输入文件: {INPUT_TXT}")
         return servers
 
-    print(f"📖 正在从 {INPUT_TXT} 提取有效服务器...")
-    with open(INPUT_TXT, 'r', encoding='utf-8') as f:
-        for line in f:
-            line = line.strip()
-            if not line or "#genre#" in line:
-                continue
-            
-            # 匹配格式: 频道名,http://124.77.177.88:5555/rtp/239.253.10.1:5140$上海市电信
-            # 提取 IP:端口 (124.77.177.88:5555) 和 注释 (上海市电信)
-            match = re.search(r'http://([\d\.]+:\d+)/rtp/.*?\$([\u4e00-\u9fa5]+)', line)
-            if match:
-                ip_port = match.group(1)
-                region = match.group(2)
-                
-                # 进一步清洗地区名，只保留省份/运营商核心词（例如：上海市电信 -> 上海电信）
-                clean_region = region.replace("市", "")
-                
-                if clean_region not in servers:
-                    servers[clean_region] = set()
-                servers[clean_region].add(ip_port)
-    
+    print(f"📖 正在从 {INPUT_TXT} 提取有效服务器（有新鲜快照时直接读快照）...")
+    # 匹配格式: 频道名,http://124.77.177.88:5555/rtp/239.253.10.1:5140$上海市电信
+    live = snapshot.load_playlist(INPUT_TXT, keep=lambda name, url: _LIVE_RE.search(url) is not None)
+    for ch in live:
+        # 进一步清洗地区名，只保留省份/运营商核心词（例如：上海市电信 -> 上海电信）
+        region = _LIVE_RE.search(ch.full_url).group(2).replace("市", "")
+        ip_ports = servers.setdefault(region, [])
+        if ch.server not in ip_ports:
+            ip_ports.append(ch.server)
+
     print(f"✅ 提取到的活服务器地区: {list(servers.keys())}")
     return servers
 
@@ -44,16 +40,16 @@ def generate():
         print("❌ 未提取到任何有效 IP，请检查 livezubo.txt 格式。")
         return
 
-    output_lines = []
     if not os.path.exists(RTP_DIR):
         print(f"❌ 找不到 rtp 目录")
         return
 
     # 获取 rtp 目录下所有的地区文件
     rtp_files = [f for f in os.listdir(RTP_DIR) if f.endswith(".txt")]
-    
+
     # 模拟分类头部
-    output_lines.append("全量更新,#genre#")
+    full = playlist.Playlist()
+    full.category("全量更新")
 
     for region_file in sorted(rtp_files):
         # rtp/湖北电信.txt -> region_key = 湖北电信
@@ -73,13 +69,18 @@ def generate():
                         # 提取组播地址
                         m = re.search(r'(\d+\.\d+\.\d+\.\d+:\d+)', rtp_addr)
                         if m:
-                            multicast = m.group(1)
                             # 拼接：频道,http://IP:PORT/rtp/组播地址$地区
-                            output_lines.append(f"{ch_name},http://{ip_port}/rtp/{multicast}${region_key}")
+                            full.add(ch_name, f"http://{ip_port}/rtp/{m.group(1)}", "全量更新", region_key)
 
+    # 同一份数据直接输出 live_full.txt 与 IPTV2.m3u，不再二次解析
     with open(OUTPUT_TXT, 'w', encoding='utf-8') as f:
-        f.write("\n".join(output_lines))
-    print(f"✨ 处理完成！文件 {OUTPUT_TXT} 已生成，共 {len(output_lines)} 条线路。")
+        playlist.render_txt(full, f, spaced=False)
+    snapshot.save_playlist(full, OUTPUT_TXT)
+    convert_full_m3u.render(full)
+    metrics.set_value("servers", sum(len(v) for v in live_servers.values()))
+    metrics.set_value("lines_out", len(full))
+    print(f"✨ 处理完成！文件 {OUTPUT_TXT} 与 {convert_full_m3u.OUTPUT_M3U} 已生成，共 {len(full) + 1} 条线路。")
 
 if __name__ == "__main__":
-    generate()
+    with metrics.stage("pgen_custom_list"):
+        generate()